@@ -0,0 +1,74 @@
+import os
+import argparse
+import numpy as np
+import django
+
+# Set up Django environment
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'medical_system.settings')
+django.setup()
+
+from diagnostics.vector_db import MedicalKnowledgeDB, benchmark_storage_modes, VECTOR_PQ_MIN_VECTORS
+
+def load_query_vectors(knowledge_db, vectors, queries_file=None, sample_size=200, noise=0.01, seed=42):
+    """Embed queries from a file (one per line), or perturb stored vectors for an offline run"""
+    if queries_file:
+        with open(queries_file) as f:
+            queries = [line.strip() for line in f if line.strip()]
+        print(f"Embedding {len(queries)} queries from {queries_file}")
+        return np.asarray(knowledge_db.embeddings.embed_documents(queries), dtype=np.float32)
+    
+    rng = np.random.default_rng(seed)
+    picked = rng.choice(len(vectors), size=min(sample_size, len(vectors)), replace=False)
+    scale = noise * np.abs(vectors).mean()
+    print(f"Using {len(picked)} perturbed stored vectors as offline queries")
+    return vectors[picked] + rng.normal(0, scale, size=(len(picked), vectors.shape[1])).astype(np.float32)
+
+def run_benchmark():
+    """Report recall@k, memory and latency of each storage mode against the float32 index"""
+    parser = argparse.ArgumentParser(description="Benchmark compressed vector storage modes")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--queries", help="Text file with one query per line (uses the embedding API)")
+    parser.add_argument("--sample", type=int, default=200, help="Offline query count when --queries is not given")
+    parser.add_argument("--subquantizers", type=int, default=None)
+    parser.add_argument("--rerank-factor", type=int, default=None)
+    parser.add_argument("--force-pq", action="store_true",
+                        help=f"Benchmark pq even below VECTOR_PQ_MIN_VECTORS ({VECTOR_PQ_MIN_VECTORS})")
+    args = parser.parse_args()
+    
+    # Always benchmark against the uncompressed index
+    knowledge_db = MedicalKnowledgeDB(storage_mode="float32")
+    knowledge_db.load_or_create_db()
+    flat_index = knowledge_db.vector_db.index
+    vectors = flat_index.reconstruct_n(0, flat_index.ntotal)
+    print(f"Loaded {vectors.shape[0]} vectors of dimension {vectors.shape[1]}")
+    
+    query_vectors = load_query_vectors(knowledge_db, vectors, args.queries, args.sample)
+    
+    modes = ("float16", "pq")
+    options = {}
+    pq_skipped = len(vectors) < VECTOR_PQ_MIN_VECTORS and not args.force_pq
+    if pq_skipped:
+        modes = ("float16",)
+    elif args.force_pq:
+        options["pq_min_vectors"] = 0
+    if args.subquantizers:
+        options["pq_subquantizers"] = args.subquantizers
+    if args.rerank_factor:
+        options["rerank_factor"] = args.rerank_factor
+    results = benchmark_storage_modes(vectors, query_vectors, k=args.k, modes=modes, **options)
+    
+    print(f"\n{'mode':<22}{'recall@' + str(args.k):>12}{'memory (MB)':>14}{'query (ms)':>12}")
+    for result in results:
+        print(f"{result['mode']:<22}{result['recall_at_k']:>12.3f}"
+              f"{result['memory_bytes'] / 1e6:>14.2f}{result['avg_query_ms']:>12.3f}")
+    
+    print()
+    if pq_skipped:
+        print(f"pq skipped: {len(vectors)} vectors is below VECTOR_PQ_MIN_VECTORS={VECTOR_PQ_MIN_VECTORS} "
+              f"(use --force-pq to run it anyway)")
+    print("Recommended compressed mode: float16 (VECTOR_STORAGE_MODE=float16). pq also keeps a "
+          "float32 copy on disk for re-ranking and is only worth it for collections above "
+          f"{VECTOR_PQ_MIN_VECTORS} vectors.")
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -1,18 +1,26 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
+from collections import OrderedDict, deque
 from datetime import datetime
-import json
+import itertools
+import threading
 
 class AgentActivityTracker:
-    """Tracks and formats real-time agent activities for user transparency"""
+    """Tracks and formats real-time agent activities of one session for user transparency.
     
-    def __init__(self):
-        self.activities = []
+    Keeps the last max_activities activities; older ones are dropped.
+    """
+    
+    def __init__(self, max_activities: int = 50):
+        self.activities = deque(maxlen=max_activities)
+        self._by_id = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
         self.current_step = None
     
     def start_activity(self, agent_name: str, activity: str, context: Dict[str, Any] = None):
         """Start tracking an agent activity"""
         activity_data = {
-            "id": len(self.activities) + 1,
+            "id": next(self._ids),
             "agent": agent_name,
             "activity": activity,
             "status": "in_progress",
@@ -20,22 +28,28 @@ class AgentActivityTracker:
             "context": context or {},
             "user_friendly_message": self._generate_user_message(agent_name, activity, context)
         }
-        self.activities.append(activity_data)
-        self.current_step = activity_data
+        with self._lock:
+            if len(self.activities) == self.activities.maxlen:
+                self._by_id.pop(self.activities[0]["id"], None)
+            self.activities.append(activity_data)
+            self._by_id[activity_data["id"]] = activity_data
+            self.current_step = activity_data
         return activity_data["id"]
     
     def complete_activity(self, activity_id: int, result: Dict[str, Any], reasoning: str = None):
         """Complete an agent activity with results"""
-        for activity in self.activities:
-            if activity["id"] == activity_id:
-                activity.update({
-                    "status": "completed",
-                    "end_time": datetime.now().isoformat(),
-                    "result": result,
-                    "reasoning": reasoning,
-                    "duration": self._calculate_duration(activity["start_time"])
-                })
-                break
+        with self._lock:
+            activity = self._by_id.get(activity_id)
+            if activity is None:
+                # Already dropped from the ring buffer
+                return
+            activity.update({
+                "status": "completed",
+                "end_time": datetime.now().isoformat(),
+                "result": result,
+                "reasoning": reasoning,
+                "duration": self._calculate_duration(activity["start_time"])
+            })
     
     def _generate_user_message(self, agent: str, activity: str, context: Dict[str, Any]) -> str:
         """Generate user-friendly messages for agent activities"""
@@ -60,16 +74,55 @@ class AgentActivityTracker:
             return 0.0
     
     def get_current_activities(self) -> List[Dict[str, Any]]:
-        """Get all activities for real-time display"""
-        return self.activities
+        """Get the retained activities for real-time display"""
+        with self._lock:
+            return [dict(activity) for activity in self.activities]
     
     def get_summary(self) -> Dict[str, Any]:
         """Get activity summary"""
-        completed = [a for a in self.activities if a["status"] == "completed"]
+        activities = self.get_current_activities()
+        completed = [a for a in activities if a["status"] == "completed"]
         return {
-            "total_activities": len(self.activities),
+            "total_activities": len(activities),
             "completed_activities": len(completed),
             "total_duration": sum(a.get("duration", 0) for a in completed),
-            "agents_involved": list(set(a["agent"] for a in self.activities))
+            "agents_involved": list(set(a["agent"] for a in activities))
         }
+
+class SessionActivityTrackers:
+    """One AgentActivityTracker per session, for at most max_sessions recently active sessions.
+    
+    Sessions are released explicitly when their workflow completes; the bound
+    covers sessions that are abandoned before that.
+    """
+    
+    def __init__(self, max_sessions: int, max_activities: int):
+        self.max_sessions = max_sessions
+        self.max_activities = max_activities
+        self._lock = threading.Lock()
+        self._trackers = OrderedDict()
+        self.evicted = 0
+    
+    def for_session(self, session_id: Optional[str]) -> AgentActivityTracker:
+        with self._lock:
+            tracker = self._trackers.pop(session_id, None) or AgentActivityTracker(self.max_activities)
+            self._trackers[session_id] = tracker
+            while len(self._trackers) > self.max_sessions:
+                self._trackers.popitem(last=False)
+                self.evicted += 1
+            return tracker
+    
+    def release(self, session_id: str):
+        with self._lock:
+            self._trackers.pop(session_id, None)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sessions": len(self._trackers),
+                "activities": sum(len(tracker.activities) for tracker in self._trackers.values()),
+                "max_sessions": self.max_sessions,
+                "max_activities_per_session": self.max_activities,
+                "evicted": self.evicted
+            }
     
@@ -0,0 +1,187 @@
+"""Admission control for diagnostic graph runs: bounded worker slots and a bounded priority queue"""
+from typing import Dict, Any, Callable
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+import asyncio
+import heapq
+import itertools
+import math
+import threading
+import time
+
+# Lower value is served first
+PRIORITY_ANSWER = 0
+PRIORITY_NEW_SESSION = 1
+PRIORITY_BACKGROUND = 2
+
+PRIORITY_NAMES = {
+    PRIORITY_ANSWER: "answer",
+    PRIORITY_NEW_SESSION: "new_session",
+    PRIORITY_BACKGROUND: "background"
+}
+
+class AdmissionRejected(Exception):
+    """Raised when the queue is full; retry_after is a hint in seconds for the client"""
+
+    def __init__(self, priority: int, retry_after: int):
+        super().__init__(f"Diagnostic queue is full ({PRIORITY_NAMES[priority]}), retry in {retry_after}s")
+        self.priority = priority
+        self.retry_after = retry_after
+
+class _Waiter:
+    __slots__ = ("start", "enqueued_at")
+
+    def __init__(self, start: Callable[[], None]):
+        self.start = start
+        self.enqueued_at = time.monotonic()
+
+class AdmissionController:
+    """Runs at most max_active graph runs at once and queues at most max_queue more.
+
+    Answers to clarifying questions jump ahead of new sessions and may use
+    answer_reserve extra queue slots, so a session that already paid for its
+    first LLM round is not dropped. Work beyond that is rejected immediately
+    instead of waiting for an HTTP timeout.
+    """
+
+    # Service time assumed for Retry-After before any run has finished
+    DEFAULT_SERVICE_SECONDS = 10.0
+    MAX_RETRY_AFTER = 120
+
+    def __init__(self, max_active: int, max_queue: int, answer_reserve: int = 0, sample_size: int = 500):
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.answer_reserve = answer_reserve
+        self.executor = ThreadPoolExecutor(max_workers=max_active, thread_name_prefix="diagnostic")
+        self._lock = threading.Lock()
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._active = 0
+        self._admitted = {name: 0 for name in PRIORITY_NAMES.values()}
+        self._rejected = {name: 0 for name in PRIORITY_NAMES.values()}
+        self._completed = 0
+        self._queue_waits = deque(maxlen=sample_size)
+        self._service_times = deque(maxlen=sample_size)
+
+    def _enter(self, priority: int, start: Callable[[], None]):
+        """Start right away if a slot is free, otherwise queue or reject"""
+        with self._lock:
+            if self._active < self.max_active and not self._waiting:
+                self._active += 1
+                self._admitted[PRIORITY_NAMES[priority]] += 1
+                self._queue_waits.append(0.0)
+                immediate = True
+            else:
+                limit = self.max_queue + (self.answer_reserve if priority == PRIORITY_ANSWER else 0)
+                if len(self._waiting) >= limit:
+                    self._rejected[PRIORITY_NAMES[priority]] += 1
+                    raise AdmissionRejected(priority, self._retry_after())
+                self._admitted[PRIORITY_NAMES[priority]] += 1
+                heapq.heappush(self._waiting, (priority, next(self._sequence), _Waiter(start)))
+                immediate = False
+        if immediate:
+            start()
+
+    def _release(self, service_seconds: float = None):
+        """Hand the freed slot to the next waiter, if any"""
+        with self._lock:
+            if service_seconds is not None:
+                self._completed += 1
+                self._service_times.append(service_seconds)
+            if not self._waiting:
+                self._active -= 1
+                return
+            _, _, waiter = heapq.heappop(self._waiting)
+            self._queue_waits.append(time.monotonic() - waiter.enqueued_at)
+        waiter.start()
+
+    def _retry_after(self) -> int:
+        """Rough time until a queued request would start; caller holds the lock"""
+        if self._service_times:
+            service = sum(self._service_times) / len(self._service_times)
+        else:
+            service = self.DEFAULT_SERVICE_SECONDS
+        estimate = math.ceil((len(self._waiting) + 1) * service / self.max_active)
+        return max(1, min(self.MAX_RETRY_AFTER, estimate))
+
+    def submit(self, fn: Callable, *args, priority: int = PRIORITY_NEW_SESSION) -> Future:
+        """Queue a blocking call for the worker threads; raises AdmissionRejected when full"""
+        future = Future()
+
+        def run():
+            started_at = time.monotonic()
+            try:
+                result = fn(*args)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+            finally:
+                self._release(time.monotonic() - started_at)
+
+        def start():
+            # The caller may have given up while the request was queued
+            if not future.set_running_or_notify_cancel():
+                self._release()
+                return
+            self.executor.submit(run)
+
+        self._enter(priority, start)
+        return future
+
+    async def run_in_executor(self, fn: Callable, *args, priority: int = PRIORITY_NEW_SESSION):
+        """Await a blocking call run through submit()"""
+        return await asyncio.wrap_future(self.submit(fn, *args, priority=priority))
+
+    async def run(self, coroutine_fn: Callable, *args, priority: int = PRIORITY_NEW_SESSION):
+        """Await a coroutine once it is admitted; used when the graph runs on the event loop"""
+        loop = asyncio.get_running_loop()
+        turn = loop.create_future()
+
+        def wake():
+            if turn.cancelled():
+                self._release()
+            else:
+                turn.set_result(None)
+
+        self._enter(priority, lambda: loop.call_soon_threadsafe(wake))
+        try:
+            await turn
+        except asyncio.CancelledError:
+            # The slot was already handed over when the cancellation arrived
+            if turn.done() and not turn.cancelled():
+                self._release()
+            raise
+
+        started_at = time.monotonic()
+        try:
+            return await coroutine_fn(*args)
+        finally:
+            self._release(time.monotonic() - started_at)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Queue depth, rejections and queue-wait metrics for monitoring"""
+        with self._lock:
+            waits = sorted(self._queue_waits)
+            queued = {name: 0 for name in PRIORITY_NAMES.values()}
+            for priority, _, _ in self._waiting:
+                queued[PRIORITY_NAMES[priority]] += 1
+            service_times = list(self._service_times)
+            return {
+                "active": self._active,
+                "max_active": self.max_active,
+                "queued": queued,
+                "queue_depth": len(self._waiting),
+                "max_queue": self.max_queue,
+                "answer_reserve": self.answer_reserve,
+                "admitted": dict(self._admitted),
+                "rejected": dict(self._rejected),
+                "completed": self._completed,
+                "queue_wait_ms": {
+                    "avg": round(1000 * sum(waits) / len(waits), 1) if waits else 0.0,
+                    "p95": round(1000 * waits[int(0.95 * (len(waits) - 1))], 1) if waits else 0.0,
+                    "max": round(1000 * waits[-1], 1) if waits else 0.0
+                },
+                "avg_service_ms": round(1000 * sum(service_times) / len(service_times), 1) if service_times else 0.0,
+                "retry_after_seconds": self._retry_after()
+            }
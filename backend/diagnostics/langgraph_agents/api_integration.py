@@ -2,9 +2,18 @@ from fastapi import HTTPException
 from typing import Dict, Any, List, Optional
 from .graph import MedicalDiagnosticGraph
 from .state import DiagnosticState
+from .config import DiagnosticConfig
+from .admission import (AdmissionController, AdmissionRejected, PRIORITY_ANSWER,
+                        PRIORITY_NEW_SESSION, PRIORITY_BACKGROUND)
+from .single_flight import SingleFlight, session_request_key
+from .rate_limiter import get_llm_limiter
+from .circuit_breaker import get_llm_breaker
+from .token_usage import get_token_usage
+from .structured_output import get_parse_tracker
+from .session_store import get_session_store
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
 import json
+import uuid
 import time
 from datetime import datetime
 
@@ -12,11 +21,19 @@ class DiagnosticAPIIntegration:
     def __init__(self, vector_db, gemini_api_key: str):
         self.diagnostic_graph = MedicalDiagnosticGraph(vector_db, gemini_api_key)
         self.diagnostic_graph.diagnostic_api_ref = self
-        self.executor = ThreadPoolExecutor(max_workers=4)
-        self.session_reasoning = {}
-        self.session_status = {}
-        self.session_initialized = {}
-        self.session_timestamps = {}
+        self.admission = AdmissionController(
+            DiagnosticConfig.DIAGNOSTIC_MAX_WORKERS,
+            DiagnosticConfig.DIAGNOSTIC_MAX_QUEUE,
+            DiagnosticConfig.DIAGNOSTIC_ANSWER_QUEUE_RESERVE
+        )
+        self.single_flight = SingleFlight(DiagnosticConfig.SINGLE_FLIGHT_WINDOW_SECONDS)
+        # Expire with the session after SESSION_TTL_SECONDS idle (see session_store)
+        self.session_store = get_session_store()
+        self.session_reasoning = self.session_store.namespace("reasoning")
+        self.session_status = self.session_store.namespace("status")
+        self.session_initialized = self.session_store.namespace("initialized")
+        self.session_timestamps = self.session_store.namespace("timestamps")
+        self.session_jobs = self.session_store.namespace("jobs")
         
     def initialize_session(self, session_id: str):
         """Initialize a session for reasoning tracking"""
@@ -26,6 +43,52 @@ class DiagnosticAPIIntegration:
         self.session_timestamps[session_id] = time.time()
         print(f"Initialized session {session_id} for reasoning tracking")
 
+    def _flight_key(self, owner_id: Optional[int], symptoms: List[str], patient_info, max_questions: int,
+                    allow_fast_path: bool, job: bool) -> Optional[str]:
+        """Single-flight key of a session start, None when it is not deduplicated"""
+        if owner_id is None or self.single_flight.window_seconds <= 0:
+            return None
+        return session_request_key(owner_id, symptoms, patient_info, max_questions, allow_fast_path, job)
+    
+    def claim_session(self,
+                      symptoms: List[str],
+                      patient_info: Optional[Dict[str, Any]],
+                      max_questions: int,
+                      allow_fast_path: bool = True,
+                      owner_id: Optional[int] = None,
+                      job: bool = False):
+        """
+        Session id to start under, decided before any per-session state is written
+        
+        Returns (session_id, leader). A start identical to one the same user made within
+        SINGLE_FLIGHT_WINDOW_SECONDS gets that run's session and leader=False: the caller
+        must not initialise or write to it, and in job mode must not submit another job.
+        """
+        session_id = str(uuid.uuid4())
+        key = self._flight_key(owner_id, symptoms, patient_info, max_questions, allow_fast_path, job)
+        if key is None:
+            return session_id, True
+        return self.single_flight.claim(key, session_id)
+    
+    def settle_session_claim(self,
+                             symptoms: List[str],
+                             patient_info: Optional[Dict[str, Any]],
+                             max_questions: int,
+                             allow_fast_path: bool = True,
+                             owner_id: Optional[int] = None,
+                             job: bool = False,
+                             result: Optional[Dict[str, Any]] = None,
+                             error: Optional[BaseException] = None):
+        """
+        Finish a session claimed with claim_session that ends before start_diagnosis or a job
+        
+        Followers arriving within the window get result; after an error the next
+        identical start leads again.
+        """
+        key = self._flight_key(owner_id, symptoms, patient_info, max_questions, allow_fast_path, job)
+        if key is not None:
+            self.single_flight.settle(key, result, error)
+    
     def update_session_reasoning(self, session_id: str, reasoning_steps: List[Dict[str, Any]]):
         """Update reasoning steps for a session"""
         # Ensure session is initialized
@@ -69,6 +132,21 @@ class DiagnosticAPIIntegration:
         return new_step
     
     
+    def add_reasoning_delta(self, session_id: str, node: str, step_id: str, content: str):
+        """Append a streamed LLM token chunk to the session's delta feed"""
+        self.session_store.append("deltas", session_id, {
+            'type': 'delta',
+            'node': node,
+            'step_id': step_id,
+            'content': content,
+            'timestamp': datetime.now().isoformat()
+        })
+    
+    def get_new_reasoning_deltas(self, session_id: str, since_index: int) -> List[Dict[str, Any]]:
+        """Token deltas published after the given index"""
+        deltas = self.session_store.items_since("deltas", session_id, since_index)
+        return [{**delta, 'index': since_index + offset} for offset, delta in enumerate(deltas)]
+    
     def get_session_reasoning(self, session_id: str) -> List[Dict[str, Any]]:
         """Get reasoning steps for a session"""
         try:
@@ -94,7 +172,9 @@ class DiagnosticAPIIntegration:
                          patient_info: Optional[Dict[str, Any]] = None,
                          initial_predictions: Optional[Dict[str, Any]] = None,
                          max_questions: int = 5,
-                         session_id: str = None) -> Dict[str, Any]:
+                         session_id: str = None,
+                         allow_fast_path: bool = True,
+                         owner_id: Optional[int] = None) -> Dict[str, Any]:
         """
         Start a new diagnostic session
         
@@ -103,6 +183,9 @@ class DiagnosticAPIIntegration:
             patient_info: Optional patient information
             initial_predictions: Initial ML model predictions
             max_questions: Maximum number of clarifying questions
+            allow_fast_path: Return clear-cut ML results without running the agents
+            owner_id: Requesting user; identical starts by the same user within
+                SINGLE_FLIGHT_WINDOW_SECONDS share one run (and its session)
             
         Returns:
             Initial diagnostic results or first question
@@ -111,36 +194,223 @@ class DiagnosticAPIIntegration:
         if not symptoms:
             raise HTTPException(status_code=400, detail="At least one symptom is required")
         
+        key = self._flight_key(owner_id, symptoms, patient_info, max_questions, allow_fast_path, False)
+        if key is not None:
+            return await self.single_flight.run(key, self._start_diagnosis, symptoms, patient_info,
+                                                initial_predictions, max_questions, session_id,
+                                                allow_fast_path)
+        return await self._start_diagnosis(symptoms, patient_info, initial_predictions,
+                                           max_questions, session_id, allow_fast_path)
+    
+    async def _start_diagnosis(self, symptoms, patient_info, initial_predictions, max_questions,
+                               session_id: str, allow_fast_path: bool) -> Dict[str, Any]:
+        llm_available = get_llm_breaker().allows_calls()
         try:
-            # Run diagnosis in thread pool to avoid blocking
-            loop = asyncio.get_event_loop()
-            result = await loop.run_in_executor(
-                self.executor,
-                self.diagnostic_graph.run_diagnosis,
-                symptoms,
-                patient_info,
-                initial_predictions,  # Pass initial predictions
-                session_id,
-                max_questions
-            )
+            if not llm_available:
+                # Provider incident: every node falls back without the LLM, so the run is cheap
+                result = await self._run_without_llm(symptoms, patient_info, initial_predictions,
+                                                     session_id, max_questions, allow_fast_path)
+            elif DiagnosticConfig.ASYNC_GRAPH_EXECUTION:
+                result = await self.admission.run(
+                    self.diagnostic_graph.arun_diagnosis,
+                    symptoms,
+                    patient_info,
+                    initial_predictions,
+                    session_id,
+                    max_questions,
+                    allow_fast_path,
+                    priority=PRIORITY_NEW_SESSION
+                )
+            else:
+                # Run diagnosis on the admission-controlled worker threads to avoid blocking
+                result = await self.admission.run_in_executor(
+                    self.diagnostic_graph.run_diagnosis,
+                    symptoms,
+                    patient_info,
+                    initial_predictions,  # Pass initial predictions
+                    session_id,
+                    max_questions,
+                    allow_fast_path,
+                    priority=PRIORITY_NEW_SESSION
+                )
             
             if "error" in result:
                 raise HTTPException(status_code=500, detail=result["error"])
             
+            self._finish_start(result, llm_available, symptoms, patient_info, initial_predictions)
             return result
             
+        except AdmissionRejected as e:
+            print(f"Admission rejected new session: {e}")
+            if DiagnosticConfig.ADMISSION_OVERLOAD_MODE != "degrade" or not initial_predictions:
+                raise
+            return self._degraded_result(symptoms, patient_info, initial_predictions, session_id)
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Diagnostic error: {str(e)}")
     
+    async def _run_without_llm(self, symptoms, patient_info, initial_predictions, session_id: str,
+                               max_questions: int, allow_fast_path: bool) -> Dict[str, Any]:
+        """Admission-controlled run while the LLM circuit is open.
+        
+        An outage is when requests pile up, so these runs take the same slots as any
+        other. When the queue is full the ML prediction alone is served: the run would
+        not have had the LLM's review either.
+        """
+        try:
+            if DiagnosticConfig.ASYNC_GRAPH_EXECUTION:
+                return await self.admission.run(self.diagnostic_graph.arun_diagnosis, symptoms, patient_info,
+                                                initial_predictions, session_id, max_questions, allow_fast_path,
+                                                priority=PRIORITY_NEW_SESSION)
+            return await self.admission.run_in_executor(self.diagnostic_graph.run_diagnosis, symptoms,
+                                                        patient_info, initial_predictions, session_id,
+                                                        max_questions, allow_fast_path,
+                                                        priority=PRIORITY_NEW_SESSION)
+        except AdmissionRejected as e:
+            if not initial_predictions:
+                raise
+            print(f"Admission rejected run without LLM, serving the ML prediction: {e}")
+            return self._degraded_result(symptoms, patient_info, initial_predictions, session_id)
+    
+    def _finish_start(self, result: Dict[str, Any], llm_available: bool, symptoms, patient_info, initial_predictions):
+        """Queue enrichment behind a fast-path answer, or mark a run made while the LLM circuit was open"""
+        if llm_available:
+            self._schedule_enrichment(result, symptoms, patient_info, initial_predictions)
+        else:
+            result["degraded"] = True
+            # Keep "overloaded" when the queue was full as well
+            result.setdefault("degraded_reason", "llm_unavailable")
+    
+    def _schedule_enrichment(self, result: Dict[str, Any], symptoms, patient_info, initial_predictions):
+        """Queue the full agent run behind a fast-path answer, when enabled"""
+        if not (result.get("fast_path") and DiagnosticConfig.FAST_PATH_BACKGROUND_ENRICHMENT):
+            return
+        try:
+            self.admission.submit(self._enrich_fast_path_session, symptoms, patient_info,
+                                  initial_predictions, result["session_id"],
+                                  priority=PRIORITY_BACKGROUND)
+            result["enrichment_pending"] = True
+        except AdmissionRejected:
+            print(f"Skipping background enrichment for {result['session_id']}: queue is full")
+    
+    def _degraded_result(self, symptoms, patient_info, initial_predictions, session_id: str) -> Dict[str, Any]:
+        """Serve the ML prediction alone rather than turning the user away"""
+        result = self.diagnostic_graph.run_fast_path(symptoms, patient_info or {}, initial_predictions,
+                                                     session_id or str(uuid.uuid4()),
+                                                     skipped_reason="overloaded")
+        result["degraded"] = True
+        result["degraded_reason"] = "overloaded"
+        return result
+    
+    def submit_diagnosis_job(self,
+                             symptoms: List[str],
+                             patient_info: Optional[Dict[str, Any]],
+                             initial_predictions: Optional[Dict[str, Any]],
+                             max_questions: int,
+                             session_id: str,
+                             allow_fast_path: bool = True,
+                             owner_id: Optional[int] = None,
+                             on_complete=None):
+        """
+        Start a diagnostic session in the background and return immediately
+        
+        Args:
+            owner_id: User allowed to read the job, None for anonymous sessions; the
+                job settles the single flight claimed with claim_session(job=True)
+            on_complete: Called on the worker thread with the start_diagnosis-style
+                result; its return value becomes the job response
+        
+        Raises AdmissionRejected when the queue is full (unless overload mode is "degrade")
+        """
+        
+        if not symptoms:
+            raise HTTPException(status_code=400, detail="At least one symptom is required")
+        
+        flight_key = self._flight_key(owner_id, symptoms, patient_info, max_questions, allow_fast_path, True)
+        if flight_key is not None:
+            self.single_flight.mark_started(flight_key)
+        job = {
+            "status": "queued",
+            "owner_id": owner_id,
+            "submitted_at": time.time(),
+            "finished_at": None,
+            "response": None,
+            "error": None
+        }
+        self.session_jobs[session_id] = job
+        try:
+            self.admission.submit(self._run_diagnosis_job, symptoms, patient_info, initial_predictions,
+                                  max_questions, session_id, allow_fast_path, on_complete, job, flight_key,
+                                  priority=PRIORITY_NEW_SESSION)
+        except AdmissionRejected as e:
+            print(f"Admission rejected diagnosis job: {e}")
+            if DiagnosticConfig.ADMISSION_OVERLOAD_MODE != "degrade" or not initial_predictions:
+                self.session_jobs.pop(session_id, None)
+                if flight_key is not None:
+                    self.single_flight.settle(flight_key, error=e)
+                raise
+            result = self._degraded_result(symptoms, patient_info, initial_predictions, session_id)
+            self._finish_job(session_id, job, result, on_complete, flight_key)
+    
+    def _run_diagnosis_job(self, symptoms, patient_info, initial_predictions, max_questions,
+                           session_id: str, allow_fast_path: bool, on_complete, job: Dict[str, Any],
+                           flight_key: Optional[str] = None):
+        job["status"] = "running"
+        self.session_jobs[session_id] = job
+        try:
+            llm_available = get_llm_breaker().allows_calls()
+            result = self.diagnostic_graph.run_diagnosis(symptoms, patient_info, initial_predictions,
+                                                         session_id, max_questions, allow_fast_path)
+            if "error" in result:
+                raise RuntimeError(result["error"])
+            self._finish_start(result, llm_available, symptoms, patient_info, initial_predictions)
+            self._finish_job(session_id, job, result, on_complete, flight_key)
+        except Exception as e:
+            print(f"Diagnosis job failed for session {session_id}: {e}")
+            job["error"] = str(e)
+            job["finished_at"] = time.time()
+            job["status"] = "error"
+            self.session_jobs[session_id] = job
+            if flight_key is not None:
+                # Followers already point at this job; a retry after the error starts afresh
+                self.single_flight.settle(flight_key, error=e)
+    
+    def _finish_job(self, session_id: str, job: Dict[str, Any], result: Dict[str, Any], on_complete,
+                    flight_key: Optional[str] = None):
+        job["response"] = on_complete(result) if on_complete else result
+        job["finished_at"] = time.time()
+        # Set last: readers treat any status other than queued/running as final
+        job["status"] = "waiting_for_input" if result.get("type") == "question" else "completed"
+        # Written back for shared stores, and in case the record expired while queued
+        self.session_jobs[session_id] = job
+        if flight_key is not None:
+            self.single_flight.settle(flight_key, result)
+    
+    def get_job(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Background job record for a session started in job mode"""
+        job = self.session_jobs.get(session_id)
+        return dict(job) if job else None
+    
+    def _enrich_fast_path_session(self, symptoms, patient_info, initial_predictions, session_id: str):
+        """Run the agent workflow without questions so the session gets the full analysis"""
+        try:
+            self.diagnostic_graph.run_diagnosis(symptoms, patient_info, initial_predictions,
+                                                session_id, 0, False)
+            print(f"Background enrichment completed for session {session_id}")
+        except Exception as e:
+            print(f"Background enrichment failed for session {session_id}: {e}")
+    
     async def answer_question(self, 
                             session_id: str, 
-                            answer: str) -> Dict[str, Any]:
+                            answer: str,
+                            pipeline_mode: Optional[str] = None) -> Dict[str, Any]:
         """
         Continue diagnostic session with an answer
         
         Args:
             session_id: The diagnostic session ID
             answer: The user's answer to the question
+            pipeline_mode: "standard" or "compact" processing of the answers;
+                defaults to DiagnosticConfig.PIPELINE_MODE
             
         Returns:
             Updated results or next question
@@ -149,20 +419,34 @@ class DiagnosticAPIIntegration:
         if not session_id or not answer:
             raise HTTPException(status_code=400, detail="Session ID and answer are required")
         
+        if pipeline_mode not in (None, "standard", "compact"):
+            raise HTTPException(status_code=400, detail="pipeline_mode must be 'standard' or 'compact'")
+        
         try:
-            loop = asyncio.get_event_loop()
-            result = await loop.run_in_executor(
-                self.executor,
-                self.diagnostic_graph.continue_with_answer,
-                session_id,
-                answer
-            )
+            if DiagnosticConfig.ASYNC_GRAPH_EXECUTION:
+                result = await self.admission.run(
+                    self.diagnostic_graph.acontinue_with_answer,
+                    session_id,
+                    answer,
+                    pipeline_mode,
+                    priority=PRIORITY_ANSWER
+                )
+            else:
+                result = await self.admission.run_in_executor(
+                    self.diagnostic_graph.continue_with_answer,
+                    session_id,
+                    answer,
+                    pipeline_mode,
+                    priority=PRIORITY_ANSWER
+                )
             
             if "error" in result:
                 raise HTTPException(status_code=404, detail=result["error"])
             
             return result
             
+        except AdmissionRejected:
+            raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error processing answer: {str(e)}")
     
@@ -181,12 +465,11 @@ class DiagnosticAPIIntegration:
             raise HTTPException(status_code=400, detail="Session ID is required")
         
         try:
-            loop = asyncio.get_event_loop()
-            result = await loop.run_in_executor(
-                self.executor,
-                self.diagnostic_graph.get_session_history,
-                session_id
-            )
+            if DiagnosticConfig.ASYNC_GRAPH_EXECUTION:
+                result = await self.diagnostic_graph.aget_session_history(session_id)
+            else:
+                # Checkpoint lookups are cheap; they skip the graph run queue
+                result = await asyncio.to_thread(self.diagnostic_graph.get_session_history, session_id)
             
             if "error" in result:
                 raise HTTPException(status_code=404, detail=result["error"])
@@ -200,11 +483,7 @@ class DiagnosticAPIIntegration:
         """Get list of active diagnostic sessions"""
         
         try:
-            loop = asyncio.get_event_loop()
-            sessions = await loop.run_in_executor(
-                self.executor,
-                self.diagnostic_graph.list_active_sessions
-            )
+            sessions = await asyncio.to_thread(self.diagnostic_graph.list_active_sessions)
             
             return {
                 "active_sessions": sessions,
@@ -214,6 +493,42 @@ class DiagnosticAPIIntegration:
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error listing sessions: {str(e)}")
     
+    def get_admission_stats(self) -> Dict[str, Any]:
+        """Worker, queue and rejection metrics of the admission controller"""
+        return {
+            **self.admission.get_stats(),
+            "single_flight": self.single_flight.get_stats()
+        }
+    
+    def get_llm_limiter_stats(self) -> Dict[str, Any]:
+        """Concurrency, queueing and rate-limit metrics of the process-wide LLM throttle"""
+        return get_llm_limiter().get_stats()
+    
+    def get_llm_circuit_stats(self) -> Dict[str, Any]:
+        """State and failure/slow-call rates of the LLM circuit breaker"""
+        return get_llm_breaker().get_stats()
+    
+    def get_token_usage_stats(self, session_id: Optional[str] = None) -> Dict[str, Any]:
+        """LLM input/output tokens per node, process-wide or for one session"""
+        if session_id:
+            return {"session_id": session_id, **get_token_usage().get_session_usage(session_id)}
+        return get_token_usage().get_stats()
+    
+    def get_structured_output_stats(self) -> Dict[str, Any]:
+        """Clean, repaired, re-asked and failed JSON parses per node"""
+        return get_parse_tracker().get_stats()
+    
+    def get_session_store_stats(self) -> Dict[str, Any]:
+        """Sessions held in memory, their items per namespace, evictions and process RSS"""
+        return {
+            **self.session_store.get_stats(),
+            "activity_trackers": self.diagnostic_graph.nodes.activity_trackers.get_stats()
+        }
+    
+    def get_llm_cache_stats(self) -> Dict[str, Any]:
+        """Hit-rate metrics of the shared LLM response cache"""
+        return self.diagnostic_graph.nodes.get_llm_cache_stats()
+    
     def format_diagnostic_response(self, result: Dict[str, Any]) -> Dict[str, Any]:
         """Format diagnostic results for API response"""
         
@@ -0,0 +1,224 @@
+"""Circuit breaker for the LLM provider: stop calling it while it fails or stalls"""
+from typing import Dict, Any, Optional
+from collections import deque
+from contextlib import contextmanager
+from .config import DiagnosticConfig
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitOpen(Exception):
+    """The LLM circuit is open; the caller should fall back to a path without the LLM"""
+
+    def __init__(self, retry_in: float):
+        super().__init__(f"LLM circuit is open, next probe in {retry_in:.1f}s")
+        self.retry_in = retry_in
+
+class CircuitBreaker:
+    """Trips on the failure rate or the slow-call rate over the last window_size calls.
+
+    Rates are only evaluated once minimum_calls outcomes are in the window. While
+    open, every call is rejected with CircuitOpen; after open_seconds one probe
+    call is let through (half-open). A fast success closes the circuit, a failure
+    or a slow call opens it again. Calls abandoned by their caller (e.g. a node
+    time budget) count as slow once they have run for slow_call_seconds. A probe
+    that has not returned after slow_call_seconds counts as slow right away, so a
+    hung probe cannot hold the circuit half-open; its late result is ignored.
+    """
+
+    def __init__(self, failure_rate_threshold: float, slow_call_seconds: float,
+                 slow_call_rate_threshold: float, window_size: int, minimum_calls: int,
+                 open_seconds: float, enabled: bool = True):
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.minimum_calls = minimum_calls
+        self.open_seconds = open_seconds
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._window = deque(maxlen=window_size)
+        self._opened_at = None
+        self._probe_started_at = None
+        self._probe_seq = 0
+        self.times_opened = 0
+        self.rejected = 0
+        self.last_trip_reason = None
+
+    def _current_state(self, now: float) -> str:
+        """State with probe expiry and the open -> half-open transition applied; caller holds the lock"""
+        if self._probe_started_at is not None and now - self._probe_started_at >= self.slow_call_seconds:
+            self._probe_started_at = None
+            self._open(now, f"half-open probe still running after {self.slow_call_seconds:.1f}s")
+        if self._state == OPEN and now - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+        return self._state
+
+    def _retry_in(self, now: float) -> float:
+        if self._state != OPEN:
+            return 0.0
+        return max(0.0, self._opened_at + self.open_seconds - now)
+
+    def _open(self, now: float, reason: str):
+        self._state = OPEN
+        self._opened_at = now
+        self._window.clear()
+        self.times_opened += 1
+        self.last_trip_reason = reason
+        print(f"LLM circuit opened: {reason}")
+
+    def _close(self):
+        self._state = CLOSED
+        self._opened_at = None
+        self._window.clear()
+        print("LLM circuit closed")
+
+    def allows_calls(self) -> bool:
+        """Whether a call would be let through right now, without reserving the probe"""
+        if not self.enabled:
+            return True
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            return state == CLOSED or (state == HALF_OPEN and self._probe_started_at is None)
+
+    def check(self):
+        """Raise CircuitOpen if a call would be rejected right now"""
+        if self.allows_calls():
+            return
+        with self._lock:
+            self.rejected += 1
+            raise CircuitOpen(self._retry_in(time.monotonic()))
+
+    def _acquire(self) -> Optional[int]:
+        """Admit one call; returns the probe number when it is the half-open probe"""
+        with self._lock:
+            now = time.monotonic()
+            state = self._current_state(now)
+            if state == CLOSED:
+                return None
+            if state == HALF_OPEN and self._probe_started_at is None:
+                self._probe_started_at = now
+                self._probe_seq += 1
+                return self._probe_seq
+            self.rejected += 1
+            raise CircuitOpen(self._retry_in(now))
+
+    def _probe_pending(self, probe: int) -> bool:
+        """Whether the probe still holds the reservation (it has not expired); caller holds the lock"""
+        return probe == self._probe_seq and self._probe_started_at is not None
+
+    def _record(self, probe: Optional[int], failed: bool, duration: float):
+        slow = duration >= self.slow_call_seconds
+        with self._lock:
+            now = time.monotonic()
+            self._current_state(now)
+            if probe is not None:
+                if not self._probe_pending(probe):
+                    # Expired probe: it was already counted as slow
+                    return
+                self._probe_started_at = None
+                if failed or slow:
+                    self._open(now, "half-open probe " + ("failed" if failed else f"took {duration:.1f}s"))
+                else:
+                    self._close()
+                return
+            if self._state != CLOSED:
+                # Late result of a call started before the circuit opened
+                return
+            self._window.append((failed, slow))
+            if len(self._window) < self.minimum_calls:
+                return
+            failure_rate = sum(1 for f, _ in self._window if f) / len(self._window)
+            slow_rate = sum(1 for _, s in self._window if s) / len(self._window)
+            if failure_rate >= self.failure_rate_threshold:
+                self._open(now, f"failure rate {failure_rate:.0%} over {len(self._window)} calls")
+            elif slow_rate >= self.slow_call_rate_threshold:
+                self._open(now, f"slow-call rate {slow_rate:.0%} over {len(self._window)} calls")
+
+    def _abandon(self, probe: Optional[int], duration: float):
+        if duration >= self.slow_call_seconds:
+            self._record(probe, False, duration)
+        elif probe is not None:
+            # No verdict; let the next caller probe
+            with self._lock:
+                if self._probe_pending(probe):
+                    self._probe_started_at = None
+
+    @contextmanager
+    def guard(self):
+        """Wrap one provider call: raises CircuitOpen up front, records the outcome after"""
+        if not self.enabled:
+            yield
+            return
+        probe = self._acquire()
+        started_at = time.monotonic()
+        try:
+            yield
+        except Exception:
+            self._record(probe, True, time.monotonic() - started_at)
+            raise
+        except BaseException:
+            self._abandon(probe, time.monotonic() - started_at)
+            raise
+        self._record(probe, False, time.monotonic() - started_at)
+
+    def guarded(self, llm) -> "_GuardedLLM":
+        return _GuardedLLM(self, llm)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Circuit state and the failure/slow-call rates it is judged on"""
+        with self._lock:
+            now = time.monotonic()
+            state = self._current_state(now)
+            window = list(self._window)
+            return {
+                "enabled": self.enabled,
+                "state": state,
+                "retry_in_seconds": round(self._retry_in(now), 1),
+                "window_calls": len(window),
+                "failure_rate": round(sum(1 for f, _ in window if f) / len(window), 3) if window else 0.0,
+                "slow_call_rate": round(sum(1 for _, s in window if s) / len(window), 3) if window else 0.0,
+                "failure_rate_threshold": self.failure_rate_threshold,
+                "slow_call_seconds": self.slow_call_seconds,
+                "slow_call_rate_threshold": self.slow_call_rate_threshold,
+                "times_opened": self.times_opened,
+                "rejected": self.rejected,
+                "last_trip_reason": self.last_trip_reason
+            }
+
+class _GuardedLLM:
+    """Chat model proxy whose invoke/ainvoke go through a CircuitBreaker"""
+
+    def __init__(self, breaker: CircuitBreaker, llm):
+        self.breaker = breaker
+        self.llm = llm
+
+    def invoke(self, messages, config: Optional[Dict[str, Any]] = None, **kwargs):
+        with self.breaker.guard():
+            return self.llm.invoke(messages, config=config, **kwargs)
+
+    async def ainvoke(self, messages, config: Optional[Dict[str, Any]] = None, **kwargs):
+        with self.breaker.guard():
+            return await self.llm.ainvoke(messages, config=config, **kwargs)
+
+_llm_breaker = None
+_llm_breaker_lock = threading.Lock()
+
+def get_llm_breaker() -> CircuitBreaker:
+    """The circuit breaker shared by every LLM call in this process"""
+    global _llm_breaker
+    with _llm_breaker_lock:
+        if _llm_breaker is None:
+            _llm_breaker = CircuitBreaker(
+                DiagnosticConfig.LLM_CIRCUIT_FAILURE_RATE,
+                DiagnosticConfig.LLM_CIRCUIT_SLOW_CALL_SECONDS,
+                DiagnosticConfig.LLM_CIRCUIT_SLOW_CALL_RATE,
+                DiagnosticConfig.LLM_CIRCUIT_WINDOW_SIZE,
+                DiagnosticConfig.LLM_CIRCUIT_MINIMUM_CALLS,
+                DiagnosticConfig.LLM_CIRCUIT_OPEN_SECONDS,
+                enabled=DiagnosticConfig.LLM_CIRCUIT_BREAKER_ENABLED
+            )
+        return _llm_breaker
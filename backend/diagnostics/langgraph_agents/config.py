@@ -1,6 +1,7 @@
 """Configuration for the LangGraph diagnostic system"""
 import os
-from typing import Dict, Any
+import json
+from typing import Dict, Any, Optional
 
 class DiagnosticConfig:
     """Configuration class for diagnostic system"""
@@ -22,6 +23,127 @@ class DiagnosticConfig:
     # Agent Configuration
     AGENT_TEMPERATURE = float(os.getenv("AGENT_TEMPERATURE", "0.1"))
     MAX_TOKENS = int(os.getenv("MAX_TOKENS", "2048"))
+    # "batch" sends every disease in one prompt; "per_disease" fans out one smaller
+    # request per disease and runs them concurrently (at most LLM_FANOUT_CONCURRENCY at once)
+    LLM_FANOUT_MODE = os.getenv("LLM_FANOUT_MODE", "batch")
+    LLM_FANOUT_CONCURRENCY = int(os.getenv("LLM_FANOUT_CONCURRENCY", "4"))
+    
+    # Process-wide LLM throttle: concurrent calls, and requests/tokens per minute (0 disables a
+    # bucket). Token use is estimated from the prompt plus LLM_OUTPUT_TOKEN_ESTIMATE and then
+    # corrected with the usage the provider reports
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+    LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "900"))
+    LLM_TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", "1000000"))
+    LLM_OUTPUT_TOKEN_ESTIMATE = int(os.getenv("LLM_OUTPUT_TOKEN_ESTIMATE", "512"))
+    # Provider request limits. Calls made within a node time budget get what is left of it
+    # as their timeout instead, so an abandoned call cannot hold its limiter slot for long
+    LLM_REQUEST_TIMEOUT_SECONDS = float(os.getenv("LLM_REQUEST_TIMEOUT_SECONDS", "30"))
+    LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+    
+    # Prompt size: the context each node puts into a prompt is trimmed, least important first,
+    # to PROMPT_TOKEN_BUDGET estimated tokens (per-node overrides as JSON in PROMPT_TOKEN_BUDGETS,
+    # e.g. {"validation": 6000}; 0 disables trimming)
+    PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "3000"))
+    PROMPT_TOKEN_BUDGETS = json.loads(os.getenv("PROMPT_TOKEN_BUDGETS", "{}"))
+    
+    # Processing of the answers: "standard" runs response integration, refinement and validation
+    # as separate LLM calls; "compact" does all three in one structured-output call, next to the
+    # explanation. Answer requests may pick a mode with "pipeline_mode"
+    PIPELINE_MODE = os.getenv("PIPELINE_MODE", "standard")
+    
+    # Circuit breaker around the LLM provider: opens when, over the last LLM_CIRCUIT_WINDOW_SIZE
+    # calls (at least LLM_CIRCUIT_MINIMUM_CALLS), the failure rate or the rate of calls slower than
+    # LLM_CIRCUIT_SLOW_CALL_SECONDS reaches its threshold. While open, nodes fall back without the
+    # LLM; after LLM_CIRCUIT_OPEN_SECONDS a single probe call decides whether to close it again
+    LLM_CIRCUIT_BREAKER_ENABLED = os.getenv("LLM_CIRCUIT_BREAKER_ENABLED", "true").lower() == "true"
+    LLM_CIRCUIT_FAILURE_RATE = float(os.getenv("LLM_CIRCUIT_FAILURE_RATE", "0.5"))
+    LLM_CIRCUIT_SLOW_CALL_SECONDS = float(os.getenv("LLM_CIRCUIT_SLOW_CALL_SECONDS", "15"))
+    LLM_CIRCUIT_SLOW_CALL_RATE = float(os.getenv("LLM_CIRCUIT_SLOW_CALL_RATE", "0.8"))
+    LLM_CIRCUIT_WINDOW_SIZE = int(os.getenv("LLM_CIRCUIT_WINDOW_SIZE", "20"))
+    LLM_CIRCUIT_MINIMUM_CALLS = int(os.getenv("LLM_CIRCUIT_MINIMUM_CALLS", "5"))
+    LLM_CIRCUIT_OPEN_SECONDS = float(os.getenv("LLM_CIRCUIT_OPEN_SECONDS", "30"))
+    
+    # Time limits: every graph run (start or answer) gets a deadline of REQUEST_DEADLINE_SECONDS,
+    # and each LLM node at most NODE_TIME_BUDGET_SECONDS of it (per-node overrides as JSON in
+    # NODE_TIME_BUDGETS, e.g. {"refinement": 30}). A node that runs out serves a fallback
+    REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "60"))
+    NODE_TIME_BUDGET_SECONDS = float(os.getenv("NODE_TIME_BUDGET_SECONDS", "20"))
+    NODE_TIME_BUDGETS = json.loads(os.getenv("NODE_TIME_BUDGETS", "{}"))
+    
+    # JSON answers: "json_mode" has the provider constrain the output to JSON, "text" leaves
+    # it free-form. Answers that still do not parse are repaired locally first, then
+    # re-asked at most STRUCTURED_OUTPUT_MAX_REASKS times with a short fix-this prompt
+    STRUCTURED_OUTPUT_MODE = os.getenv("STRUCTURED_OUTPUT_MODE", "json_mode")
+    STRUCTURED_OUTPUT_MAX_REASKS = int(os.getenv("STRUCTURED_OUTPUT_MAX_REASKS", "1"))
+    
+    # LLM response cache: exact-match on model settings + normalized prompt
+    LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "sqlite")  # sqlite, memory or none
+    LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.db")
+    LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", "86400"))
+    LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+    
+    # Clarifying questions: "llm" lets the model invent them, "information_gain" picks
+    # symptoms from the dataset by expected entropy reduction and has the LLM phrase
+    # them, "fast" uses the same selection with template phrasing and no LLM call
+    QUESTION_ENGINE = os.getenv("QUESTION_ENGINE", "information_gain")
+    QUESTION_CANDIDATE_DISEASES = int(os.getenv("QUESTION_CANDIDATE_DISEASES", "5"))
+    SYMPTOM_DATASET_PATH = os.getenv(
+        "SYMPTOM_DATASET_PATH",
+        os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "symptoms", "dataset.csv")
+    )
+    
+    # Generate the first questions concurrently with the orchestrator analysis instead of
+    # after it; the questions are filtered and reordered by the analysis once it lands
+    SPECULATIVE_QUESTIONING = os.getenv("SPECULATIVE_QUESTIONING", "true").lower() == "true"
+    
+    # Explanations: "full" has the LLM write them from scratch, "delta" adds a short
+    # case-specific LLM note to the precomputed catalog entry, "fast" serves the catalog only
+    EXPLANATION_MODE = os.getenv("EXPLANATION_MODE", "delta")
+    EXPLANATION_CATALOG_PATH = os.getenv(
+        "EXPLANATION_CATALOG_PATH",
+        os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "explanations", "explanation_catalog.json")
+    )
+    
+    # Run the symptom-match tool locally and put its scores in the refinement and
+    # validation prompts (the model is not given tool schemas it could call)
+    TOOL_PREFETCH_ENABLED = os.getenv("TOOL_PREFETCH_ENABLED", "true").lower() == "true"
+    
+    # Per-session API/graph state: dropped after this long idle, or least recently used beyond the cap
+    SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "7200"))
+    SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+    SESSION_SWEEP_INTERVAL_SECONDS = float(os.getenv("SESSION_SWEEP_INTERVAL_SECONDS", "60"))
+    # "sqlite" shares session status and reasoning events between worker processes on a host
+    SESSION_STORE_BACKEND = os.getenv("SESSION_STORE_BACKEND", "memory")  # memory or sqlite
+    SESSION_STORE_PATH = os.getenv("SESSION_STORE_PATH", "session_store.db")
+    
+    # Agent activity history kept per session (ring buffer) and for how many sessions
+    ACTIVITY_TRACKER_MAX_ACTIVITIES = int(os.getenv("ACTIVITY_TRACKER_MAX_ACTIVITIES", "50"))
+    ACTIVITY_TRACKER_MAX_SESSIONS = int(os.getenv("ACTIVITY_TRACKER_MAX_SESSIONS", "1000"))
+    
+    # Forward LLM tokens to the reasoning stream as they are generated
+    TOKEN_STREAMING_ENABLED = os.getenv("TOKEN_STREAMING_ENABLED", "true").lower() == "true"
+    STREAM_POLL_INTERVAL = float(os.getenv("STREAM_POLL_INTERVAL", "0.2"))
+    
+    # Run the graph natively on the server's event loop (astream + async nodes) and route
+    # the diagnosis endpoints to async views. Needs an ASGI server (uvicorn/daphne), since
+    # each event loop keeps its own async checkpointer connection. Requires aiosqlite and
+    # langgraph-checkpoint-sqlite 2.x (AsyncSqliteSaver); aiosqlite 0.22+, which dropped
+    # Connection.is_alive, is bridged in MedicalDiagnosticGraph._get_async_graph.
+    ASYNC_GRAPH_EXECUTION = os.getenv("ASYNC_GRAPH_EXECUTION", "false").lower() == "true"
+    
+    # Admission control: graph runs at once, queued runs beyond that, and extra queue
+    # slots only answers may use. When the queue is full new sessions get HTTP 429
+    # ("reject") or the ML-only result ("degrade")
+    DIAGNOSTIC_MAX_WORKERS = int(os.getenv("DIAGNOSTIC_MAX_WORKERS", "4"))
+    DIAGNOSTIC_MAX_QUEUE = int(os.getenv("DIAGNOSTIC_MAX_QUEUE", "16"))
+    DIAGNOSTIC_ANSWER_QUEUE_RESERVE = int(os.getenv("DIAGNOSTIC_ANSWER_QUEUE_RESERVE", "8"))
+    ADMISSION_OVERLOAD_MODE = os.getenv("ADMISSION_OVERLOAD_MODE", "reject")
+    # Identical session starts by the same user within this window share one run (0 disables)
+    SINGLE_FLIGHT_WINDOW_SECONDS = float(os.getenv("SINGLE_FLIGHT_WINDOW_SECONDS", "10"))
+    
+    # Default for the enhanced prediction "job" flag: reply 202 after the ML prediction and
+    # deliver questions/diagnosis through the reasoning stream or sessions/<id>/job/
+    ENHANCED_JOB_MODE_DEFAULT = os.getenv("ENHANCED_JOB_MODE_DEFAULT", "false").lower() == "true"
     
     # Vector DB Configuration
     VECTOR_DB_PATH = os.getenv("VECTOR_DB_PATH", "medical_knowledge.db")
@@ -31,6 +153,25 @@ class DiagnosticConfig:
     HIGH_CONFIDENCE_THRESHOLD = float(os.getenv("HIGH_CONFIDENCE_THRESHOLD", "0.8"))
     MEDIUM_CONFIDENCE_THRESHOLD = float(os.getenv("MEDIUM_CONFIDENCE_THRESHOLD", "0.5"))
     
+    # Fast path: when the ML top-1 is at least HIGH_CONFIDENCE_THRESHOLD and leads the
+    # runner-up by FAST_PATH_MIN_MARGIN, return it directly instead of running the agents
+    FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "true").lower() == "true"
+    FAST_PATH_MIN_MARGIN = float(os.getenv("FAST_PATH_MIN_MARGIN", "0.3"))
+    # Run the agent workflow (without questions) afterwards to enrich the stored session
+    FAST_PATH_BACKGROUND_ENRICHMENT = os.getenv("FAST_PATH_BACKGROUND_ENRICHMENT", "false").lower() == "true"
+    
+    @classmethod
+    def node_time_budget(cls, node_name: str) -> Optional[float]:
+        """Per-node time budget in seconds; 0 or less means unlimited"""
+        budget = float(cls.NODE_TIME_BUDGETS.get(node_name, cls.NODE_TIME_BUDGET_SECONDS))
+        return budget if budget > 0 else None
+    
+    @classmethod
+    def prompt_token_budget(cls, node_name: str) -> Optional[int]:
+        """Per-node prompt input budget in estimated tokens; 0 or less means unlimited"""
+        budget = int(cls.PROMPT_TOKEN_BUDGETS.get(node_name, cls.PROMPT_TOKEN_BUDGET))
+        return budget if budget > 0 else None
+    
     @classmethod
     def setup_langsmith(cls):
         """Setup LangSmith environment variables"""
@@ -66,6 +207,8 @@ class DiagnosticConfig:
                 "max_questions": cls.MAX_QUESTIONS_DEFAULT,
                 "checkpoint_db": cls.CHECKPOINT_DB_PATH,
                 "temperature": cls.AGENT_TEMPERATURE,
+                "llm_cache_backend": cls.LLM_CACHE_BACKEND,
+                "async_graph_execution": cls.ASYNC_GRAPH_EXECUTION,
                 "langsmith_project": cls.LANGCHAIN_PROJECT
             }
         }
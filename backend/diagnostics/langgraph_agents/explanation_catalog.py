@@ -0,0 +1,168 @@
+"""Versioned on-disk catalog of base patient-education explanations per disease"""
+from typing import Dict, Any, List, Optional
+from datetime import datetime
+from langchain_core.prompts import ChatPromptTemplate
+from .structured_output import json_mode, repair_json
+import pandas as pd
+import hashlib
+import json
+import os
+
+# Bump when the entry layout changes; catalog_version counts regenerations
+CATALOG_SCHEMA_VERSION = 1
+CATALOG_SOURCE_FILES = ("symptom_Description.csv", "symptom_precaution.csv")
+
+def _disease_key(disease: str) -> str:
+    return " ".join(str(disease).split()).lower()
+
+def source_fingerprint(symptoms_dir: str) -> str:
+    """Hash of the description/precaution CSVs, to detect a catalog built from older data"""
+    digest = hashlib.sha256()
+    for filename in CATALOG_SOURCE_FILES:
+        with open(os.path.join(symptoms_dir, filename), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def load_disease_sources(symptoms_dir: str) -> Dict[str, Dict[str, Any]]:
+    """Static description and precautions for every disease in the dataset"""
+    descriptions = pd.read_csv(os.path.join(symptoms_dir, "symptom_Description.csv"))
+    precautions = pd.read_csv(os.path.join(symptoms_dir, "symptom_precaution.csv"))
+
+    sources = {}
+    for _, row in descriptions.iterrows():
+        disease = " ".join(str(row["Disease"]).split())
+        sources[disease] = {"description": str(row["Description"]).strip(), "precautions": []}
+    for _, row in precautions.iterrows():
+        disease = " ".join(str(row["Disease"]).split())
+        items = [str(p).strip() for p in row.iloc[1:].tolist() if isinstance(p, str) and p.strip()]
+        sources.setdefault(disease, {"description": "", "precautions": []})["precautions"] = items
+    return sources
+
+def template_entry(disease: str, description: str, precautions: List[str]) -> Dict[str, Any]:
+    """Catalog entry assembled directly from the source data, without an LLM"""
+    care_advice = f"If your symptoms get worse or do not improve, please see a doctor about {disease}."
+    text = description
+    if precautions:
+        text += f" Helpful precautions: {', '.join(precautions)}."
+    text += f" {care_advice}"
+    return {
+        "disease": disease,
+        "overview": description,
+        "precautions": precautions,
+        "care_advice": care_advice,
+        "text": text.strip(),
+        "generated_by": "template"
+    }
+
+def llm_entry(llm, disease: str, description: str, precautions: List[str]) -> Dict[str, Any]:
+    """Catalog entry rewritten by the LLM in patient-friendly language"""
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", """You are a Medical Explanation Specialist writing patient-education material.
+
+        DISEASE: {disease}
+        REFERENCE DESCRIPTION: {description}
+        REFERENCE PRECAUTIONS: {precautions}
+
+        Write for a patient with no medical background. Do not mention any specific patient.
+        Return ONLY a valid JSON object:
+        {{
+            "overview": "2-3 sentences on what the condition is and how it usually presents",
+            "precautions": ["short patient-friendly precaution", ...],
+            "care_advice": "One sentence on when to seek medical care"
+        }}"""),
+        ("human", "Write the patient-education entry.")
+    ])
+    response = json_mode(llm).invoke(prompt.format_messages(
+        disease=disease, description=description, precautions=json.dumps(precautions)
+    ))
+    data, _ = repair_json(response.content)
+
+    entry = template_entry(disease, data.get("overview", description), data.get("precautions", precautions))
+    entry["care_advice"] = data.get("care_advice", entry["care_advice"])
+    entry["text"] = " ".join(filter(None, [
+        entry["overview"],
+        f"Helpful precautions: {', '.join(entry['precautions'])}." if entry["precautions"] else "",
+        entry["care_advice"]
+    ]))
+    entry["generated_by"] = "llm"
+    return entry
+
+def build_catalog(symptoms_dir: str, llm=None, previous: Optional[Dict[str, Any]] = None,
+                  model_name: str = None) -> Dict[str, Any]:
+    """Generate the whole catalog; LLM failures for a disease fall back to the template entry"""
+    entries = {}
+    for disease, source in sorted(load_disease_sources(symptoms_dir).items()):
+        entry = None
+        if llm is not None:
+            try:
+                entry = llm_entry(llm, disease, source["description"], source["precautions"])
+            except Exception as e:
+                print(f"Warning: LLM entry for {disease} failed, using template: {e}")
+        entries[disease] = entry or template_entry(disease, source["description"], source["precautions"])
+        print(f"Catalog entry ready: {disease} ({entries[disease]['generated_by']})")
+
+    return {
+        "schema_version": CATALOG_SCHEMA_VERSION,
+        "catalog_version": (previous or {}).get("catalog_version", 0) + 1,
+        "generated_at": datetime.now().isoformat(),
+        "model": model_name if llm is not None else None,
+        "source_fingerprint": source_fingerprint(symptoms_dir),
+        "entries": entries
+    }
+
+def write_catalog(catalog: Dict[str, Any], path: str):
+    """Write atomically so running workers never read a half-written file"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(catalog, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+class ExplanationCatalog:
+    """Read-only view of a generated catalog file"""
+
+    def __init__(self, catalog: Dict[str, Any]):
+        self.catalog_version = catalog.get("catalog_version")
+        self.source_fingerprint = catalog.get("source_fingerprint")
+        self._entries = {_disease_key(d): entry for d, entry in catalog.get("entries", {}).items()}
+
+    @classmethod
+    def load(cls, path: str, symptoms_dir: Optional[str] = None) -> Optional["ExplanationCatalog"]:
+        """The catalog at path, or None when it is missing, outdated or built from other source data"""
+        try:
+            with open(path, encoding="utf-8") as f:
+                catalog = json.load(f)
+        except FileNotFoundError:
+            print(f"Warning: Explanation catalog not found at {path}; run generate_explanation_catalog.py")
+            return None
+        except Exception as e:
+            print(f"Warning: Could not load explanation catalog: {e}")
+            return None
+
+        if catalog.get("schema_version") != CATALOG_SCHEMA_VERSION:
+            print(f"Warning: Explanation catalog schema {catalog.get('schema_version')} "
+                  f"does not match {CATALOG_SCHEMA_VERSION}; regenerate it")
+            return None
+        explanation_catalog = cls(catalog)
+        if symptoms_dir is not None:
+            try:
+                stale = explanation_catalog.is_stale(symptoms_dir)
+            except OSError as e:
+                print(f"Warning: Could not check the explanation catalog against its source data: {e}")
+                stale = False
+            if stale:
+                print(f"Warning: Explanation catalog v{catalog.get('catalog_version')} was built from "
+                      f"older data than {symptoms_dir}; regenerate it")
+                return None
+        print(f"Loaded explanation catalog v{catalog.get('catalog_version')} "
+              f"with {len(catalog.get('entries', {}))} diseases")
+        return explanation_catalog
+
+    def get(self, disease: str) -> Optional[Dict[str, Any]]:
+        return self._entries.get(_disease_key(disease))
+
+    def has_all(self, diseases: List[str]) -> bool:
+        return all(self.get(disease) is not None for disease in diseases)
+
+    def is_stale(self, symptoms_dir: str) -> bool:
+        return self.source_fingerprint != source_fingerprint(symptoms_dir)
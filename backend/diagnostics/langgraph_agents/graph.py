@@ -1,13 +1,19 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 import sqlite3
+import asyncio
+import weakref
+import aiosqlite
 from langgraph.graph import StateGraph, END
 from langgraph.checkpoint.sqlite import SqliteSaver
-from langgraph.prebuilt import ToolNode
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
 from .state import DiagnosticState
 from .nodes import MedicalAgentNodes
-from .tools import create_medical_tools
 import uuid
 from .config import DiagnosticConfig
+from .steps import request_deadline
+from .session_store import get_session_store
 from datetime import datetime
 import os
 from langsmith import Client
@@ -18,8 +24,8 @@ class MedicalDiagnosticGraph:
         self.vector_db = vector_db
         self.gemini_api_key = gemini_api_key
         self.nodes = MedicalAgentNodes(vector_db, gemini_api_key)
-        self.tools = create_medical_tools(vector_db)
-        self.session_reasoning_steps = {} 
+        self.session_reasoning_steps = get_session_store().namespace("graph_reasoning")
+        get_session_store().add_eviction_listener(self.nodes.release_session)
         
         # Setup LangSmith
         self.langsmith_enabled = DiagnosticConfig.setup_langsmith()
@@ -30,18 +36,20 @@ class MedicalDiagnosticGraph:
             self.langsmith_client = None
             print("LangSmith tracing disabled - API key not found")
         
+        self.db_path = db_path
         self.checkpointer = self._create_checkpointer(db_path)
         self.graph = self._build_graph()
+        # Async graphs are created lazily, one per event loop (see _get_async_graph)
+        self._async_graphs = weakref.WeakKeyDictionary()
     
     def _add_reasoning_step(self, session_id: str, agent: str, step: str, content: str, details: Dict = None):
         """Add a reasoning step for real-time updates"""
-        if session_id not in self.session_reasoning_steps:
-            self.session_reasoning_steps[session_id] = []
+        session_steps = self.session_reasoning_steps.setdefault(session_id, [])
         
         # Ensure content is string
         content_str = content if isinstance(content, str) else str(content)
         
-        step_id = f"{session_id}_{len(self.session_reasoning_steps[session_id])}"
+        step_id = f"{session_id}_{len(session_steps)}"
         
         reasoning_step = {
             'id': step_id,
@@ -53,12 +61,13 @@ class MedicalDiagnosticGraph:
             'status': 'completed'
         }
             
-        self.session_reasoning_steps[session_id].append(reasoning_step)
+        session_steps.append(reasoning_step)
+        self.session_reasoning_steps[session_id] = session_steps
         print(f"Added reasoning step for session {session_id}: {agent} - {step}")
         
         # Store in diagnostic API for SSE access
         if hasattr(self, 'diagnostic_api_ref'):
-            self.diagnostic_api_ref.update_session_reasoning(session_id, self.session_reasoning_steps[session_id])
+            self.diagnostic_api_ref.update_session_reasoning(session_id, session_steps)
         
         return reasoning_step
     
@@ -67,6 +76,42 @@ class MedicalDiagnosticGraph:
         """Get reasoning steps for a session"""
         return self.session_reasoning_steps.get(session_id, [])
     
+    def _stream_graph(self, graph_input, config: Dict[str, Any], session_id: str):
+        """Run the graph yielding node updates; LLM tokens go to the session's reasoning feed"""
+        if not DiagnosticConfig.TOKEN_STREAMING_ENABLED:
+            yield from self.graph.stream(graph_input, config)
+            return
+        
+        for mode, chunk in self.graph.stream(graph_input, config, stream_mode=["updates", "messages"]):
+            if mode == "messages":
+                self._forward_token(session_id, *chunk)
+            else:
+                yield chunk
+    
+    async def _astream_graph(self, graph_input, config: Dict[str, Any], session_id: str):
+        """Async _stream_graph on the graph bound to the running event loop"""
+        graph = await self._get_async_graph()
+        if not DiagnosticConfig.TOKEN_STREAMING_ENABLED:
+            async for chunk in graph.astream(graph_input, config):
+                yield chunk
+            return
+        
+        async for mode, chunk in graph.astream(graph_input, config, stream_mode=["updates", "messages"]):
+            if mode == "messages":
+                self._forward_token(session_id, *chunk)
+            else:
+                yield chunk
+    
+    def _forward_token(self, session_id: str, message, metadata: Dict[str, Any]):
+        """Publish one streamed LLM chunk as a delta tagged with its node and step"""
+        if not isinstance(message, AIMessage) or not isinstance(message.content, str) or not message.content:
+            return
+        
+        node = metadata.get("langgraph_node", "unknown")
+        step_id = f"{session_id}_{node}_{metadata.get('langgraph_step', 0)}"
+        if hasattr(self, 'diagnostic_api_ref'):
+            self.diagnostic_api_ref.add_reasoning_delta(session_id, node, step_id, message.content)
+    
     def _create_checkpointer(self, db_path: str):
         """Create SQLite checkpointer with proper connection handling"""
         try:
@@ -77,64 +122,197 @@ class MedicalDiagnosticGraph:
             print(f"Warning: Could not create checkpointer: {e}")
             return None
     
-    def _build_graph(self) -> StateGraph:
+    async def _get_async_graph(self):
+        """Graph compiled against an async checkpointer owned by the running event loop.
+        
+        aiosqlite connections and the saver's lock belong to one loop, so each loop
+        (normally just the ASGI server's) gets its own compiled graph on the same database.
+        """
+        loop = asyncio.get_running_loop()
+        graph = self._async_graphs.get(loop)
+        if graph is not None:
+            return graph
+        self._release_closed_loops()
+        
+        checkpointer = None
+        if self.checkpointer is not None:
+            conn = aiosqlite.connect(self.db_path)
+            # Connections of loops that end without closing them (async_to_sync creates
+            # one loop per call) must not keep the process alive at shutdown
+            getattr(conn, "_thread", conn).daemon = True
+            conn = await conn
+            if not hasattr(conn, "is_alive"):
+                # aiosqlite >= 0.22 is no longer a Thread, but AsyncSqliteSaver.setup
+                # (langgraph-checkpoint-sqlite 2.x) still calls conn.is_alive()
+                conn.is_alive = conn._thread.is_alive
+            checkpointer = AsyncSqliteSaver(conn)
+            try:
+                await checkpointer.setup()
+            except Exception:
+                # The connection's worker thread would otherwise keep the process alive
+                await conn.close()
+                raise
+        
+        if loop in self._async_graphs:
+            # Another coroutine finished setting up first
+            if checkpointer is not None:
+                await checkpointer.conn.close()
+            return self._async_graphs[loop]
+        
+        graph = self._build_graph(checkpointer)
+        self._async_graphs[loop] = graph
+        return graph
+    
+    def _release_closed_loops(self):
+        """Stop the checkpoint connections of event loops that have been closed.
+        
+        The saver keeps a reference to its loop, so the weak mapping alone never drops them.
+        """
+        for loop, graph in list(self._async_graphs.items()):
+            if not loop.is_closed():
+                continue
+            del self._async_graphs[loop]
+            conn = getattr(graph.checkpointer, "conn", None)
+            if conn is not None and hasattr(conn, "stop"):
+                conn.stop()
+    
+    def _node(self, name: str, node_fn, anode_fn=None):
+        """Node with a native async implementation for astream, sync one for stream"""
+        if anode_fn is None:
+            return node_fn
+        return RunnableLambda(node_fn, afunc=anode_fn, name=name)
+    
+    def _build_graph(self, checkpointer=None) -> StateGraph:
         """Build the LangGraph workflow with restructured flow"""
+        if checkpointer is None:
+            checkpointer = self.checkpointer
         workflow = StateGraph(DiagnosticState)
         
         # Add nodes
-        workflow.add_node("orchestrator", self.nodes.orchestrator_node)
-        workflow.add_node("questioning", self.nodes.questioning_node)
+        workflow.add_node("orchestrator", self._node("orchestrator", self.nodes.orchestrator_node, self.nodes.aorchestrator_node))
+        workflow.add_node("questioning", self._node("questioning", self.nodes.questioning_node, self.nodes.aquestioning_node))
         workflow.add_node("human_input", self.nodes.human_input_node)
-        workflow.add_node("response_integration", self.nodes.response_integration_node)
-        workflow.add_node("validation", self.nodes.validation_node)
-        workflow.add_node("refinement", self.nodes.refinement_node)
+        # Speculative start: questions are generated next to the orchestrator analysis
+        # and fitted to it afterwards (see SPECULATIVE_QUESTIONING)
+        workflow.add_node("speculative_orchestrator", self._parallel_branch("orchestrator", self.nodes.orchestrator_node,
+                                                                            self.nodes.aorchestrator_node))
+        workflow.add_node("speculative_questioning", self._parallel_branch("questioning", self.nodes.questioning_node,
+                                                                           self.nodes.aquestioning_node))
+        workflow.add_node("question_reconciliation", self.nodes.question_reconciliation_node)
+        workflow.add_node("response_integration", self._node("response_integration", self.nodes.response_integration_node,
+                                                             self.nodes.aresponse_integration_node))
+        workflow.add_node("refinement", self._node("refinement", self.nodes.refinement_node, self.nodes.arefinement_node))
+        workflow.add_node("validation", self._parallel_branch("validation", self.nodes.validation_node,
+                                                              self.nodes.avalidation_node))
+        workflow.add_node("explanation", self._parallel_branch("explanation", self.nodes.explanation_node,
+                                                               self.nodes.aexplanation_node))
+        # Compact pipeline: one assessment call next to the explanation (see PIPELINE_MODE)
+        workflow.add_node("compact_assessment", self._parallel_branch("compact", self.nodes.compact_assessment_node,
+                                                                      self.nodes.acompact_assessment_node))
+        workflow.add_node("compact_explanation", self._parallel_branch("explanation", self.nodes.explanation_node,
+                                                                       self.nodes.aexplanation_node))
+        workflow.add_node("reconciliation", self.nodes.reconciliation_node)
         workflow.add_node("evaluator", self.nodes.evaluator_node)
-        workflow.add_node("explanation", self.nodes.explanation_node)
-        
-        # Add tool node for medical tools
-        workflow.add_node("tools", ToolNode(self.tools))
         
         # Define the new workflow structure
-        workflow.set_entry_point("orchestrator")
+        workflow.set_conditional_entry_point(
+            self._entry_route,
+            {
+                "orchestrator": "orchestrator",
+                "speculative_orchestrator": "speculative_orchestrator",
+                "speculative_questioning": "speculative_questioning"
+            }
+        )
         
         # Add conditional edge from orchestrator
         workflow.add_conditional_edges(
             "orchestrator",
-            self._check_orchestrator_routing,
+            self._orchestrator_route,
             {
                 "generate_questions": "questioning",
-                "process_responses": "response_integration"  # Direct to response integration if we have responses
+                "process_responses": "response_integration",  # Direct to response integration if we have responses
+                "compact_assessment": "compact_assessment",
+                "compact_explanation": "compact_explanation"
             }
         )
         
         # From questioning to human input (with interrupt)
         workflow.add_edge("questioning", "human_input")
+        workflow.add_edge(["speculative_orchestrator", "speculative_questioning"], "question_reconciliation")
+        workflow.add_edge("question_reconciliation", "human_input")
         
         # From human input, check if we have responses
         workflow.add_conditional_edges(
             "human_input",
-            self._check_human_input_routing,
+            self._human_input_route,
             {
                 "process_responses": "response_integration",
+                "compact_assessment": "compact_assessment",
+                "compact_explanation": "compact_explanation",
                 "wait_for_input": END  # This creates the interrupt
             }
         )
         
-        # Linear flow after response integration
+        # After response integration: refinement, then validation and explanation
+        # run concurrently and are reconciled before the final evaluation
         workflow.add_edge("response_integration", "refinement")
         workflow.add_edge("refinement", "validation")
-        workflow.add_edge("validation", "evaluator")
-        workflow.add_edge("evaluator", "explanation")
-        workflow.add_edge("explanation", END)
+        workflow.add_edge("refinement", "explanation")
+        workflow.add_edge(["validation", "explanation"], "reconciliation")
+        workflow.add_edge(["compact_assessment", "compact_explanation"], "reconciliation")
+        workflow.add_edge("reconciliation", "evaluator")
+        workflow.add_edge("evaluator", END)
         
         # Compile the graph 
         compile_kwargs = {}
-        if self.checkpointer is not None:
-            compile_kwargs["checkpointer"] = self.checkpointer
+        if checkpointer is not None:
+            compile_kwargs["checkpointer"] = checkpointer
             compile_kwargs["interrupt_before"] = ["human_input"]
         
         return workflow.compile(**compile_kwargs)
     
+    def _parallel_branch(self, name: str, node_fn, anode_fn=None):
+        """Wrap a node so it can run next to others in the same step.
+        
+        Nodes return the whole state, so two of them running concurrently would both
+        write shared keys such as reasoning_steps. The wrapper only records what the
+        node changed under branch_results[name]; the reconciliation node merges it.
+        """
+        def changes(state: DiagnosticState, result: Dict[str, Any]) -> Dict[str, Any]:
+            changed = {key: value for key, value in result.items() if state.get(key) != value}
+            return {"branch_results": {name: changed}}
+        
+        def branch(state: DiagnosticState) -> Dict[str, Any]:
+            return changes(state, node_fn(state))
+        
+        async def abranch(state: DiagnosticState) -> Dict[str, Any]:
+            return changes(state, await anode_fn(state))
+        
+        branch.__name__ = f"{name}_branch"
+        return self._node(name, branch, abranch if anode_fn is not None else None)
+    
+    def _compact_route(self, state: DiagnosticState, route: str):
+        """Send responses down the compact pipeline when the session asks for it"""
+        if route == "process_responses" and state.get("pipeline_mode") == "compact":
+            print("🔀 ROUTING: compact pipeline")
+            return ["compact_assessment", "compact_explanation"]
+        return route
+    
+    def _entry_route(self, state: DiagnosticState):
+        """Start new sessions speculatively: questioning mostly needs the ML predictions, which
+        are known up front, so it need not wait for the orchestrator's LLM analysis"""
+        if (DiagnosticConfig.SPECULATIVE_QUESTIONING and not state.get("user_responses")
+                and not state.get("clarifying_questions") and state.get("max_questions", 5) > 0):
+            print("🔀 ENTRY ROUTING: speculative questioning")
+            return ["speculative_orchestrator", "speculative_questioning"]
+        return "orchestrator"
+    
+    def _orchestrator_route(self, state: DiagnosticState):
+        return self._compact_route(state, self._check_orchestrator_routing(state))
+    
+    def _human_input_route(self, state: DiagnosticState):
+        return self._compact_route(state, self._check_human_input_routing(state))
+    
     def _check_human_input_routing(self, state: DiagnosticState) -> str:
         """Check if we have human responses to process"""
         user_responses = state.get("user_responses", {})
@@ -169,6 +347,10 @@ class MedicalDiagnosticGraph:
         if current_step in ["responses_ready_for_processing", "all_responses_received"]:
             print("🔀 ORCHESTRATOR ROUTING: process_responses (by step)")
             return "process_responses"
+        
+        if state.get("max_questions", 5) <= 0:
+            print("🔀 ORCHESTRATOR ROUTING: process_responses (no question budget)")
+            return "process_responses"
         print("🔀 ORCHESTRATOR ROUTING: generate_questions")
         return "generate_questions"
 
@@ -185,34 +367,140 @@ class MedicalDiagnosticGraph:
         # In single round workflow, always proceed to explanation after processing responses
         return "proceed_to_explanation"
         
-    @traceable(name="diagnostic_workflow")
-    def run_diagnosis(self,
-                  symptoms: List[str],
-                  patient_info: Dict[str, Any] = None,
-                  initial_predictions: Dict[str, Any] = None,
-                  session_id: str = None,
-                  max_questions: int = 5) -> Dict[str, Any]:
-        """Run the complete diagnostic workflow"""
+    def should_take_fast_path(self, initial_predictions: Dict[str, Any]) -> bool:
+        """True when the ML result is clear-cut: confident top-1 with a wide gap to top-2"""
+        if not DiagnosticConfig.FAST_PATH_ENABLED or not initial_predictions:
+            return False
         
-        if session_id is None:
-            session_id = str(uuid.uuid4())
-
-        # Add orchestrator start step
-        self._add_reasoning_step(session_id, "orchestrator", "workflow_started",
-                            "Multi-agent diagnostic workflow initiated")
-
-        # Add metadata for tracing
-        trace_metadata = {
+        probabilities = sorted(
+            (data.get("probability", 0) if isinstance(data, dict) else float(data or 0)
+             for data in initial_predictions.values()),
+            reverse=True
+        )
+        top_probability = probabilities[0]
+        runner_up = probabilities[1] if len(probabilities) > 1 else 0.0
+        
+        return (top_probability >= DiagnosticConfig.HIGH_CONFIDENCE_THRESHOLD
+                and top_probability - runner_up >= DiagnosticConfig.FAST_PATH_MIN_MARGIN)
+    
+    def _catalog_explanation(self, disease: str, prediction_data: Dict[str, Any]) -> str:
+        """Patient-facing explanation from the explanation catalog, else the stored description and precautions"""
+        probability = prediction_data.get("probability", 0)
+        explanation = f"Based on your symptoms, there is a {probability:.0%} likelihood of {disease}."
+        
+        catalog = self.nodes.explanation_catalog
+        entry = catalog.get(disease) if catalog is not None else None
+        if entry is not None:
+            return f"{explanation} {entry['text']}"
+        
+        description = prediction_data.get("description")
+        if description and description != "No description available":
+            explanation += f" {description}"
+        
+        precautions = [
+            str(p).strip() for p in prediction_data.get("precautions", [])
+            if isinstance(p, str) and p.strip() and p != "No precautions available"
+        ]
+        if precautions:
+            explanation += f" Recommended precautions: {', '.join(precautions)}."
+        
+        return explanation
+    
+    def run_fast_path(self,
+                      symptoms: List[str],
+                      patient_info: Dict[str, Any],
+                      initial_predictions: Dict[str, Any],
+                      session_id: str,
+                      skipped_reason: Optional[str] = None) -> Dict[str, Any]:
+        """Return the ML predictions with catalog explanations, skipping the agent graph.
+        
+        skipped_reason (e.g. "overloaded") marks a result that skips the agents for another
+        reason than a clear-cut ML result; it is then not reported as a confident fast path.
+        """
+        timestamp = datetime.now().isoformat()
+        
+        final_predictions = {}
+        for disease, prediction_data in initial_predictions.items():
+            if not isinstance(prediction_data, dict):
+                prediction_data = {"probability": float(prediction_data or 0)}
+            probability = prediction_data.get("probability", 0)
+            confidence_level = ("High" if probability >= DiagnosticConfig.HIGH_CONFIDENCE_THRESHOLD
+                                else "Medium" if probability >= DiagnosticConfig.MEDIUM_CONFIDENCE_THRESHOLD else "Low")
+            
+            final_predictions[disease] = {
+                "probability": probability,
+                "confidence": prediction_data.get("confidence", confidence_level),
+                "explanation": self._catalog_explanation(disease, prediction_data),
+                "validation": {},
+                "overall_confidence": {
+                    "adjusted_probability": probability,
+                    "confidence_level": confidence_level,
+                    "validation_status": "not_validated"
+                }
+            }
+        
+        top_disease = max(final_predictions, key=lambda d: final_predictions[d]["probability"])
+        top_probability = final_predictions[top_disease]["probability"]
+        top_confidence = final_predictions[top_disease]["overall_confidence"]["confidence_level"]
+        if skipped_reason is None:
+            step = "fast_path"
+            result = f"ML model is confident in {top_disease} ({top_probability:.1%}); skipped agent workflow"
+            content = f"High-confidence ML prediction for {top_disease}; returning result directly"
+            evaluation_summary = "High-confidence ML prediction returned without agent review"
+        else:
+            step = "agent_review_skipped"
+            result = (f"Agent review skipped ({skipped_reason}); ML prediction {top_disease} "
+                      f"({top_probability:.1%}, {top_confidence} confidence) returned unreviewed")
+            content = (f"Agent review skipped ({skipped_reason}); returning the unreviewed ML prediction "
+                       f"for {top_disease} ({top_probability:.1%})")
+            evaluation_summary = f"{top_confidence}-confidence ML prediction returned without agent review ({skipped_reason})"
+        reasoning_steps = [{
+            "agent": "system",
+            "step": step,
+            "timestamp": timestamp,
+            "result": result
+        }]
+        self._add_reasoning_step(session_id, "system", step, content,
+                                 {"top_probability": top_probability,
+                                  "skipped_reason": skipped_reason,
+                                  "thresholds": {
+                                      "high_confidence": DiagnosticConfig.HIGH_CONFIDENCE_THRESHOLD,
+                                      "min_margin": DiagnosticConfig.FAST_PATH_MIN_MARGIN
+                                  }})
+        
+        return {
+            "type": "diagnosis",
             "session_id": session_id,
-            "num_symptoms": len(symptoms),
-            "num_predictions": len(initial_predictions) if initial_predictions else 0,
-            "max_questions": max_questions,
-            "workflow_type": "single_round_all_questions",
-            "patient_age": patient_info.get("age") if patient_info else None
+            "predictions": final_predictions,
+            "symptoms_analyzed": symptoms,
+            "questions_asked": 0,
+            "reasoning_steps": reasoning_steps,
+            "agent_outputs": {},
+            "evaluation_results": {},
+            "timestamp": timestamp,
+            "status": "completed",
+            "prediction_complete": True,
+            "fast_path": skipped_reason is None,
+            "transparency": {
+                "workflow_steps": len(reasoning_steps),
+                "agents_involved": [],
+                "decision_process": reasoning_steps,
+                "detailed_outputs": {},
+                "evaluator_decisions": {}
+            },
+            "summary": {
+                "total_diseases_analyzed": len(final_predictions),
+                "questions_asked": 0,
+                "confidence_level": top_confidence,
+                "reasoning_transparency": f"{len(reasoning_steps)} decision steps recorded",
+                "evaluation_summary": evaluation_summary
+            }
         }
-
-        # Initialize state
-        initial_state = {
+    
+    def _initial_state(self, symptoms: List[str], patient_info: Dict[str, Any],
+                       initial_predictions: Dict[str, Any], session_id: str, max_questions: int) -> Dict[str, Any]:
+        """Fresh graph state for a new session"""
+        return {
             "selected_symptoms": symptoms,
             "patient_info": patient_info or {},
             "initial_predictions": initial_predictions or {},
@@ -230,72 +518,168 @@ class MedicalDiagnosticGraph:
             "user_responses": {},
             "updated_symptoms": symptoms,
             "evaluation_results": {},
+            "retrieval_memo": {},
+            "degraded_nodes": [],
+            "pipeline_mode": DiagnosticConfig.PIPELINE_MODE,
             "workflow_type": "single_round"
         }
+    
+    def _run_config(self, session_id: str, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        # Nodes size their time budgets against the deadline (see node_time_budget)
+        configurable = {"thread_id": session_id} if self.checkpointer else {}
+        configurable["deadline"] = request_deadline()
+        return {
+            "configurable": configurable,
+            "metadata": metadata
+        }
+    
+    def _start_workflow(self, symptoms, patient_info, initial_predictions, session_id, max_questions) -> tuple:
+        """Reasoning steps, initial state and run config shared by the sync and async runs"""
+        # Add orchestrator start step
+        self._add_reasoning_step(session_id, "orchestrator", "workflow_started",
+                            "Multi-agent diagnostic workflow initiated")
 
-        config = {
-            "configurable": {
-                "thread_id": session_id
-            },
-            "metadata": trace_metadata
-        } if self.checkpointer else {"metadata": trace_metadata}
+        # Add metadata for tracing
+        trace_metadata = {
+            "session_id": session_id,
+            "num_symptoms": len(symptoms),
+            "num_predictions": len(initial_predictions) if initial_predictions else 0,
+            "max_questions": max_questions,
+            "workflow_type": "single_round_all_questions",
+            "patient_age": patient_info.get("age") if patient_info else None
+        }
+        
+        initial_state = self._initial_state(symptoms, patient_info, initial_predictions, session_id, max_questions)
+        config = self._run_config(session_id, trace_metadata)
+        
+        # Add step for workflow execution start
+        self._add_reasoning_step(session_id, "system", "workflow_execution_started",
+                            "Beginning step-by-step diagnostic analysis")
+        return initial_state, config
+    
+    def _handle_run_update(self, session_id: str, state: Dict[str, Any]):
+        """Record a node update; returns the question response once the graph waits for input"""
+        print(f"Current state keys: {list(state.keys()) if isinstance(state, dict) else 'Not a dict'}")
+        
+        # Add reasoning steps for each node execution
+        if isinstance(state, dict):
+            for node_name, node_state in state.items():
+                if isinstance(node_state, dict) and node_name != '__interrupt__':
+                    step_content = f"Executed {node_name} node"
+                    if node_name == "orchestrator":
+                        step_content = "Orchestrator analyzing symptoms and determining next steps"
+                    elif node_name == "questioning":
+                        step_content = "Generating clarifying questions based on initial analysis"
+                    elif node_name == "response_integration":
+                        step_content = "Integrating user responses with diagnostic analysis"
+                    elif node_name == "refinement":
+                        step_content = "Refining predictions based on additional information"
+                    elif node_name == "validation":
+                        step_content = "Validating diagnostic predictions"
+                    elif node_name == "evaluator":
+                        step_content = "Evaluating overall diagnostic confidence"
+                    elif node_name == "explanation":
+                        step_content = "Generating explanations for diagnostic results"
+                    elif node_name in ("speculative_orchestrator", "speculative_questioning"):
+                        step_content = "Analyzing symptoms and generating clarifying questions concurrently"
+                    elif node_name == "question_reconciliation":
+                        step_content = "Fitting the clarifying questions to the orchestrator analysis"
+                    elif node_name == "reconciliation":
+                        step_content = "Reconciling validation results with explanations"
+                        
+                    self._add_reasoning_step(session_id, node_name, f"{node_name}_executed", step_content)
+        
+        # Check if we're at a human input interrupt
+        if self._is_waiting_for_input(state):
+            print("Detected waiting for input state")
+            self._add_reasoning_step(session_id, "system", "awaiting_user_input",
+                                "Waiting for user responses to clarifying questions")
+            return self._format_question_response(state, session_id)
+        return None
+    
+    def _workflow_error(self, session_id: str, error: Exception, initial_state: Dict[str, Any]) -> Dict[str, Any]:
+        print(f"Error in diagnostic workflow: {error}")
+        import traceback
+        traceback.print_exc()
+        
+        # Add error reasoning step
+        self._add_reasoning_step(session_id, "system", "workflow_error",
+                            f"Workflow error: {str(error)}")
+        
+        return {
+            "error": str(error),
+            "session_id": session_id,
+            "partial_results": initial_state
+        }
+    
+    @traceable(name="diagnostic_workflow")
+    def run_diagnosis(self,
+                  symptoms: List[str],
+                  patient_info: Dict[str, Any] = None,
+                  initial_predictions: Dict[str, Any] = None,
+                  session_id: str = None,
+                  max_questions: int = 5,
+                  allow_fast_path: bool = True) -> Dict[str, Any]:
+        """Run the complete diagnostic workflow"""
+        
+        if session_id is None:
+            session_id = str(uuid.uuid4())
+        
+        if allow_fast_path and self.should_take_fast_path(initial_predictions):
+            print(f"Fast path taken for session {session_id}")
+            return self.run_fast_path(symptoms, patient_info or {}, initial_predictions, session_id)
 
+        initial_state, config = self._start_workflow(symptoms, patient_info, initial_predictions,
+                                                     session_id, max_questions)
         try:
-            # Add step for workflow execution start
-            self._add_reasoning_step(session_id, "system", "workflow_execution_started",
-                                "Beginning step-by-step diagnostic analysis")
-            
             # Run the graph and collect all states
             final_state = None
-            
-            for state in self.graph.stream(initial_state, config):
+            for state in self._stream_graph(initial_state, config, session_id):
                 final_state = state
-                print(f"Current state keys: {list(state.keys()) if isinstance(state, dict) else 'Not a dict'}")
-                
-                # Add reasoning steps for each node execution
-                if isinstance(state, dict):
-                    for node_name, node_state in state.items():
-                        if isinstance(node_state, dict) and node_name != '__interrupt__':
-                            step_content = f"Executed {node_name} node"
-                            if node_name == "orchestrator":
-                                step_content = "Orchestrator analyzing symptoms and determining next steps"
-                            elif node_name == "questioning":
-                                step_content = "Generating clarifying questions based on initial analysis"
-                            elif node_name == "response_integration":
-                                step_content = "Integrating user responses with diagnostic analysis"
-                            elif node_name == "refinement":
-                                step_content = "Refining predictions based on additional information"
-                            elif node_name == "validation":
-                                step_content = "Validating diagnostic predictions"
-                            elif node_name == "evaluator":
-                                step_content = "Evaluating overall diagnostic confidence"
-                            elif node_name == "explanation":
-                                step_content = "Generating explanations for diagnostic results"
-                                
-                            self._add_reasoning_step(session_id, node_name, f"{node_name}_executed", step_content)
-                
-                # Check if we're at a human input interrupt
-                if self._is_waiting_for_input(state):
-                    print("Detected waiting for input state")
-                    self._add_reasoning_step(session_id, "system", "awaiting_user_input",
-                                        "Waiting for user responses to clarifying questions")
-                    return self._format_question_response(state, session_id)
+                question_response = self._handle_run_update(session_id, state)
+                if question_response is not None:
+                    return question_response
 
+            # Ran to completion without asking questions (e.g. no question budget)
+            self.nodes.release_session(session_id)
+            return self._format_results(final_state)
             
         except Exception as e:
-            print(f"Error in diagnostic workflow: {e}")
-            import traceback
-            traceback.print_exc()
-            
-            # Add error reasoning step
-            self._add_reasoning_step(session_id, "system", "workflow_error",
-                                f"Workflow error: {str(e)}")
+            return self._workflow_error(session_id, e, initial_state)
+    
+    @traceable(name="diagnostic_workflow")
+    async def arun_diagnosis(self,
+                  symptoms: List[str],
+                  patient_info: Dict[str, Any] = None,
+                  initial_predictions: Dict[str, Any] = None,
+                  session_id: str = None,
+                  max_questions: int = 5,
+                  allow_fast_path: bool = True) -> Dict[str, Any]:
+        """Async run_diagnosis: the graph runs on the caller's event loop via astream"""
+        
+        if session_id is None:
+            session_id = str(uuid.uuid4())
+        
+        if allow_fast_path and self.should_take_fast_path(initial_predictions):
+            print(f"Fast path taken for session {session_id}")
+            return self.run_fast_path(symptoms, patient_info or {}, initial_predictions, session_id)
+
+        initial_state, config = self._start_workflow(symptoms, patient_info, initial_predictions,
+                                                     session_id, max_questions)
+        try:
+            final_state = None
+            async for state in self._astream_graph(initial_state, config, session_id):
+                final_state = state
+                question_response = self._handle_run_update(session_id, state)
+                if question_response is not None:
+                    return question_response
+
+            # Ran to completion without asking questions (e.g. no question budget)
+            self.nodes.release_session(session_id)
+            return self._format_results(final_state)
             
-            return {
-                "error": str(e),
-                "session_id": session_id,
-                "partial_results": initial_state
-            }
+        except Exception as e:
+            return self._workflow_error(session_id, e, initial_state)
     
     def _format_question_response(self, state: Dict[str, Any], session_id: str) -> Dict[str, Any]:
         """Format response when waiting for human input"""
@@ -411,6 +795,7 @@ class MedicalDiagnosticGraph:
             "questions": formatted_questions,
             "progress": progress,
             "status": "waiting_for_input",
+            "degraded_nodes": state_data.get("degraded_nodes", []),
             "reasoning_steps": reasoning_steps,
             "agent_outputs": agent_outputs,
             "transparency": {
@@ -420,16 +805,11 @@ class MedicalDiagnosticGraph:
             }
         }
 
-    @traceable(name="continue_diagnosis")
-    def continue_with_answer(self, session_id: str, answers: Dict[str, Any]) -> Dict[str, Any]:
-        """Continue the diagnostic workflow with human answers - single round version"""
-        
-        if not self.checkpointer:
-            return {"error": "Session persistence not available"}
-        
-        config = {
+    def _continuation_config(self, session_id: str, answers: Dict[str, Any]) -> Dict[str, Any]:
+        return {
             "configurable": {
-                "thread_id": session_id
+                "thread_id": session_id,
+                "deadline": request_deadline()
             },
             "metadata": {
                 "session_id": session_id,
@@ -438,6 +818,52 @@ class MedicalDiagnosticGraph:
                 "workflow_type": "single_round"
             }
         }
+    
+    def _continuation_values(self, current_values: Dict[str, Any], answers: Dict[str, Any],
+                             pipeline_mode: Optional[str] = None) -> Dict[str, Any]:
+        """State update that marks every question answered so the graph runs to completion"""
+        print(f"Single round: Processing {len(answers)} answers")
+        
+        # Ensure we have a proper state structure
+        state_values = current_values or {}
+        
+        # FIXED: For single round, mark all questions as answered and set proper routing step
+        max_questions = state_values.get("max_questions", 5)
+        
+        return {
+            **state_values,
+            "user_responses": answers,
+            "questions_asked": max_questions,
+            "current_step": "all_responses_received",  # CHANGED: This ensures proper routing
+            "needs_more_questions": False,
+            "responses_ready": True,
+            "degraded_nodes": [],  # Report only this request's fallbacks
+            "branch_results": None,  # Drop branches of the first round before the final fan-in
+            "pipeline_mode": pipeline_mode or state_values.get("pipeline_mode", DiagnosticConfig.PIPELINE_MODE),
+            "evaluation_results": {
+                "needs_more_questions": False,
+                "reason": "Single round workflow - all questions answered"
+            }
+        }
+    
+    def _continuation_error(self, session_id: str, error: Exception) -> Dict[str, Any]:
+        print(f"Error in single round continuation: {error}")
+        import traceback
+        traceback.print_exc()
+        return {
+            "error": str(error),
+            "session_id": session_id
+        }
+    
+    @traceable(name="continue_diagnosis")
+    def continue_with_answer(self, session_id: str, answers: Dict[str, Any],
+                             pipeline_mode: Optional[str] = None) -> Dict[str, Any]:
+        """Continue the diagnostic workflow with human answers - single round version"""
+        
+        if not self.checkpointer:
+            return {"error": "Session persistence not available"}
+        
+        config = self._continuation_config(session_id, answers)
         
         try:
             # Get current state
@@ -445,44 +871,49 @@ class MedicalDiagnosticGraph:
             if current_state is None:
                 return {"error": "Session not found"}
             
-            print(f"Single round: Processing {len(answers)} answers")
+            updated_values = self._continuation_values(current_state.values, answers, pipeline_mode)
             
-            # Ensure we have a proper state structure
-            state_values = current_state.values or {}
+            # Continue execution - should go straight through to completion
+            final_state = None
+            for state in self._stream_graph(updated_values, config, session_id):
+                final_state = state
+                print(f"Single round continuation: {list(state.keys()) if isinstance(state, dict) else 'Not a dict'}")
             
-            # FIXED: For single round, mark all questions as answered and set proper routing step
-            max_questions = state_values.get("max_questions", 5)
+            # Should complete without interruption in single round
+            self.nodes.release_session(session_id)
+            return self._format_results(final_state)
             
-            updated_values = {
-                **current_state.values,
-                "user_responses": answers,
-                "questions_asked": max_questions,
-                "current_step": "all_responses_received",  # CHANGED: This ensures proper routing
-                "needs_more_questions": False,
-                "responses_ready": True,
-                "evaluation_results": {
-                    "needs_more_questions": False,
-                    "reason": "Single round workflow - all questions answered"
-                }
-            }
+        except Exception as e:
+            return self._continuation_error(session_id, e)
+    
+    @traceable(name="continue_diagnosis")
+    async def acontinue_with_answer(self, session_id: str, answers: Dict[str, Any],
+                                    pipeline_mode: Optional[str] = None) -> Dict[str, Any]:
+        """Async continue_with_answer on the caller's event loop"""
+        
+        if not self.checkpointer:
+            return {"error": "Session persistence not available"}
+        
+        config = self._continuation_config(session_id, answers)
+        
+        try:
+            graph = await self._get_async_graph()
+            current_state = await graph.aget_state(config)
+            if current_state is None:
+                return {"error": "Session not found"}
+            
+            updated_values = self._continuation_values(current_state.values, answers, pipeline_mode)
             
-            # Continue execution - should go straight through to completion
             final_state = None
-            for state in self.graph.stream(updated_values, config):
+            async for state in self._astream_graph(updated_values, config, session_id):
                 final_state = state
                 print(f"Single round continuation: {list(state.keys()) if isinstance(state, dict) else 'Not a dict'}")
             
-            # Should complete without interruption in single round
+            self.nodes.release_session(session_id)
             return self._format_results(final_state)
             
         except Exception as e:
-            print(f"Error in single round continuation: {e}")
-            import traceback
-            traceback.print_exc()
-            return {
-                "error": str(e),
-                "session_id": session_id
-            }
+            return self._continuation_error(session_id, e)
     
     def _is_waiting_for_input(self, state: Dict[str, Any]) -> bool:
         """Check if the workflow is waiting for human input"""
@@ -536,7 +967,7 @@ class MedicalDiagnosticGraph:
 
         # Extract data from all relevant nodes in the new order
         state_data = {}
-        node_keys = ['explanation', 'evaluator', 'refinement', 'validation', 'response_integration']
+        node_keys = ['evaluator', 'reconciliation', 'refinement', 'response_integration']
 
         for key in node_keys:
             if key in final_state and isinstance(final_state[key], dict):
@@ -591,6 +1022,8 @@ class MedicalDiagnosticGraph:
             "timestamp": state_data.get("timestamp"),
             "status": "completed",
             "prediction_complete": True,
+            "degraded_nodes": state_data.get("degraded_nodes", []),
+            "pipeline_mode": state_data.get("pipeline_mode", "standard"),
             "transparency": {
                 "workflow_steps": len(reasoning_steps),
                 "agents_involved": list(agent_outputs.keys()),
@@ -636,6 +1069,33 @@ class MedicalDiagnosticGraph:
         except Exception as e:
             return {"error": str(e)}
     
+    async def aget_session_history(self, session_id: str) -> Dict[str, Any]:
+        """Async get_session_history"""
+        if not self.checkpointer:
+            return {"error": "Session persistence not available"}
+        
+        config = {
+            "configurable": {
+                "thread_id": session_id
+            }
+        }
+        
+        try:
+            graph = await self._get_async_graph()
+            state = await graph.aget_state(config)
+            if state is None:
+                return {"error": "Session not found"}
+            
+            return {
+                "session_id": session_id,
+                "current_state": state.values,
+                "history": state.config,
+                "next_steps": state.next
+            }
+            
+        except Exception as e:
+            return {"error": str(e)}
+    
     def list_active_sessions(self) -> List[str]:
         """List all active diagnostic sessions"""
         try:
@@ -0,0 +1,285 @@
+"""Exact-match response cache for the diagnostic agents' LLM calls"""
+from typing import Dict, Any, Optional
+from collections import OrderedDict
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+from langchain_core.language_models import BaseChatModel
+from langchain_core.load import dumps, loads
+from langchain_core.runnables import RunnableBinding
+from .config import DiagnosticConfig
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# The per-call request timeout (see rate_limiter) is transport, not model configuration
+_TIMEOUT_PARAM = re.compile(r", \('timeout', [^)]*\)|\('timeout', [^)]*\)(, )?")
+
+def cache_key(prompt: str, llm_string: str) -> str:
+    """Hash of the model configuration (model, temperature, tools) and the normalized prompt"""
+    normalized_prompt = re.sub(r"(\\n|\s)+", " ", prompt).strip()
+    llm_string = _TIMEOUT_PARAM.sub("", llm_string)
+    return hashlib.sha256(f"{llm_string}\x00{normalized_prompt}".encode("utf-8")).hexdigest()
+
+class MeteredLLMCache(BaseCache):
+    """Base class for LLM response caches that keeps hit-rate metrics.
+
+    Subclasses implement _get/_set/_clear/_size on a hashed key. Plugged into the
+    chat model through its `cache` argument, so every invoke/batch goes through it.
+    """
+
+    backend = "base"
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        value = self._get(cache_key(prompt, llm_string))
+        with self._stats_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        evicted = self._set(cache_key(prompt, llm_string), return_val)
+        with self._stats_lock:
+            self.writes += 1
+            self.evictions += evicted
+
+    def clear(self, **kwargs: Any) -> None:
+        self._clear()
+
+    def invalidate(self, prompt: str, llm_string: str) -> bool:
+        """Drop a cached response that turned out to be unusable"""
+        dropped = self._delete(cache_key(prompt, llm_string))
+        with self._stats_lock:
+            self.invalidations += int(dropped)
+        return dropped
+
+    def contains(self, prompt: str, llm_string: str) -> bool:
+        """Whether lookup() would hit; not counted in the hit rate, the lookup that follows is"""
+        return self._get(cache_key(prompt, llm_string)) is not None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit-rate metrics for monitoring"""
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": self.backend,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "writes": self.writes,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "entries": self._size(),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds
+            }
+
+    def _get(self, key: str) -> Optional[RETURN_VAL_TYPE]:
+        raise NotImplementedError
+
+    def _set(self, key: str, return_val: RETURN_VAL_TYPE) -> int:
+        raise NotImplementedError
+
+    def _delete(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def _clear(self) -> None:
+        raise NotImplementedError
+
+    def _size(self) -> int:
+        raise NotImplementedError
+
+class InMemoryLLMCache(MeteredLLMCache):
+    """Process-local LRU cache with TTL"""
+
+    backend = "memory"
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        super().__init__(ttl_seconds, max_entries)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key: str) -> Optional[RETURN_VAL_TYPE]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            created_at, value = entry
+            if time.time() - created_at > self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _set(self, key: str, return_val: RETURN_VAL_TYPE) -> int:
+        with self._lock:
+            self._entries[key] = (time.time(), return_val)
+            self._entries.move_to_end(key)
+            evicted = 0
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+            return evicted
+
+    def _delete(self, key: str) -> bool:
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+
+    def _clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _size(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+class SQLiteLLMCache(MeteredLLMCache):
+    """Persistent cache in a local SQLite file, shared across restarts and worker processes.
+
+    A hit only rewrites last_used once per TOUCH_INTERVAL_SECONDS, so repeated hits
+    on a hot entry stay reads; LRU order is only needed to the nearest few seconds.
+    """
+
+    backend = "sqlite"
+    TOUCH_INTERVAL_SECONDS = 5.0
+
+    def __init__(self, db_path: str, ttl_seconds: float, max_entries: int):
+        super().__init__(ttl_seconds, max_entries)
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache (last_used)")
+        self.conn.commit()
+
+    def _get(self, key: str) -> Optional[RETURN_VAL_TYPE]:
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT response, created_at, last_used FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            response, created_at, last_used = row
+            if now - created_at > self.ttl_seconds:
+                self.conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self.conn.commit()
+                return None
+            if now - last_used > self.TOUCH_INTERVAL_SECONDS:
+                self.conn.execute("UPDATE llm_cache SET last_used = ? WHERE key = ?", (now, key))
+                self.conn.commit()
+        try:
+            return loads(response)
+        except Exception as e:
+            print(f"Warning: Could not load cached LLM response: {e}")
+            return None
+
+    def _set(self, key: str, return_val: RETURN_VAL_TYPE) -> int:
+        now = time.time()
+        response = dumps(list(return_val))
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, response, created_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, response, now, now)
+            )
+            # Expired rows go first, then least recently used ones over the size limit
+            evicted = self.conn.execute(
+                "DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,)
+            ).rowcount
+            overflow = self._count() - self.max_entries
+            if overflow > 0:
+                evicted += self.conn.execute(
+                    "DELETE FROM llm_cache WHERE key IN "
+                    "(SELECT key FROM llm_cache ORDER BY last_used ASC LIMIT ?)",
+                    (overflow,)
+                ).rowcount
+            self.conn.commit()
+            return evicted
+
+    def _delete(self, key: str) -> bool:
+        with self._lock:
+            deleted = self.conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,)).rowcount > 0
+            self.conn.commit()
+            return deleted
+
+    def _clear(self) -> None:
+        with self._lock:
+            self.conn.execute("DELETE FROM llm_cache")
+            self.conn.commit()
+
+    def _count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+    def _size(self) -> int:
+        with self._lock:
+            return self._count()
+
+def _cache_target(llm) -> tuple:
+    """The chat model behind llm (possibly a bind() of it) and the call kwargs bound to it"""
+    kwargs = {}
+    while isinstance(llm, RunnableBinding):
+        kwargs = {**llm.kwargs, **kwargs}
+        llm = llm.bound
+    if isinstance(llm, BaseChatModel) and isinstance(llm.cache, MeteredLLMCache):
+        return llm, kwargs
+    return None, kwargs
+
+def is_cached(llm, messages) -> bool:
+    """Whether invoking llm on messages would be served from its response cache"""
+    model, kwargs = _cache_target(llm)
+    if model is None:
+        return False
+    # The same key the model computes in invoke(); stop is never passed by the nodes
+    return model.cache.contains(dumps(messages), model._get_llm_string(stop=None, **kwargs))
+
+def evict_cached(llm, messages) -> bool:
+    """Drop the cached response of llm to messages, e.g. an answer that does not parse"""
+    model, kwargs = _cache_target(llm)
+    if model is None:
+        return False
+    return model.cache.invalidate(dumps(messages), model._get_llm_string(stop=None, **kwargs))
+
+def is_cached_response(message) -> bool:
+    """Whether a response came from the cache; LangChain zeroes total_cost on cache hits"""
+    usage = getattr(message, "usage_metadata", None) or {}
+    return usage.get("total_cost") == 0
+
+def create_llm_cache(backend: str = None) -> Optional[MeteredLLMCache]:
+    """Build the response cache selected by LLM_CACHE_BACKEND ("sqlite", "memory" or "none")"""
+    backend = (backend or DiagnosticConfig.LLM_CACHE_BACKEND).lower()
+    ttl_seconds = DiagnosticConfig.LLM_CACHE_TTL_SECONDS
+    max_entries = DiagnosticConfig.LLM_CACHE_MAX_ENTRIES
+
+    if backend == "none":
+        return None
+    if backend == "memory":
+        return InMemoryLLMCache(ttl_seconds, max_entries)
+    if backend == "sqlite":
+        try:
+            return SQLiteLLMCache(DiagnosticConfig.LLM_CACHE_PATH, ttl_seconds, max_entries)
+        except Exception as e:
+            print(f"Warning: Could not open LLM cache at {DiagnosticConfig.LLM_CACHE_PATH}: {e}")
+            return InMemoryLLMCache(ttl_seconds, max_entries)
+    raise ValueError(f"Unknown LLM_CACHE_BACKEND {backend!r}; expected 'sqlite', 'memory' or 'none'")
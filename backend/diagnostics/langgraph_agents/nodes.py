@@ -1,32 +1,118 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_ollama import ChatOllama
-from .state import DiagnosticState, QuestionSchema, PredictionSchema
-from .tools import create_medical_tools
+from .state import (DiagnosticState, IntegrationSchema, CompactAssessmentSchema, PredictionScoresSchema,
+                    ValidationScoresSchema, QuestionListSchema, per_disease_schema, single_disease_schema,
+                    retrieval_memo_key)
+from .tools import symptom_match
 import json
-from .activity_tracker import AgentActivityTracker
+from .activity_tracker import SessionActivityTrackers
+from .config import DiagnosticConfig
+from .llm_cache import create_llm_cache
+from .question_selector import load_question_selector
+from .explanation_catalog import ExplanationCatalog
+from .prompt_builder import PromptInputs, compact_json
+from .steps import LLMInvoke, LLMBatch, BlockingCall, NodeTimeout, node_time_budget, run_steps, arun_steps
+from .circuit_breaker import CircuitOpen
+from .structured_output import StructuredOutputError, json_mode, parse_structured, get_parse_tracker
 import os
 from datetime import datetime
 from langsmith.run_helpers import traceable
 
+# Knowledge sources each node draws on when it looks up context for a disease
+ORCHESTRATOR_SOURCES = ("description", "dataset")
+VALIDATION_SOURCES = ("dataset", "description")
+EXPLANATION_SOURCES = ("description", "precaution")
+
 class MedicalAgentNodes:
     def __init__(self, vector_db, gemini_api_key: str):
         self.vector_db = vector_db
+        self.llm_cache = create_llm_cache()
         self.llm = ChatGoogleGenerativeAI(
             model="gemini-2.0-flash",
             temperature=0.7,
-            google_api_key=gemini_api_key
+            google_api_key=gemini_api_key,
+            timeout=DiagnosticConfig.LLM_REQUEST_TIMEOUT_SECONDS,
+            max_retries=DiagnosticConfig.LLM_MAX_RETRIES,
+            cache=self.llm_cache
+        )
+        self.activity_trackers = SessionActivityTrackers(
+            DiagnosticConfig.ACTIVITY_TRACKER_MAX_SESSIONS,
+            DiagnosticConfig.ACTIVITY_TRACKER_MAX_ACTIVITIES
+        )
+        self.question_selector = (
+            load_question_selector(DiagnosticConfig.SYMPTOM_DATASET_PATH)
+            if DiagnosticConfig.QUESTION_ENGINE != "llm" else None
+        )
+        self.explanation_catalog = (
+            ExplanationCatalog.load(DiagnosticConfig.EXPLANATION_CATALOG_PATH,
+                                    os.path.dirname(DiagnosticConfig.SYMPTOM_DATASET_PATH))
+            if DiagnosticConfig.EXPLANATION_MODE != "full" else None
         )
-        self.tools = create_medical_tools(vector_db)
-        self.llm_with_tools = self.llm.bind_tools(self.tools)
-        self.activity_tracker = AgentActivityTracker()
         
     
+    def _activity_tracker(self, state: DiagnosticState):
+        """Activity tracker of the session this state belongs to"""
+        return self.activity_trackers.for_session(state.get("session_id"))
+    
+    def release_session(self, session_id: str):
+        """Drop per-session bookkeeping once the session's workflow has completed"""
+        self.activity_trackers.release(session_id)
+    
+    def get_llm_cache_stats(self) -> Dict[str, Any]:
+        """Hit-rate metrics of the LLM response cache"""
+        if self.llm_cache is None:
+            return {"backend": "none"}
+        return self.llm_cache.get_stats()
+    
+    def _with_budget(self, node_name: str, state: DiagnosticState, steps_fn, fallback) -> DiagnosticState:
+        """Run a node within its time budget (see node_time_budget), serving fallback(state)
+        when it runs out or the LLM circuit is open"""
+        try:
+            return run_steps(steps_fn(state), node_time_budget(node_name))
+        except (NodeTimeout, CircuitOpen) as e:
+            return self._degraded(node_name, state, fallback, e)
+    
+    async def _awith_budget(self, node_name: str, state: DiagnosticState, steps_fn, fallback) -> DiagnosticState:
+        """Async _with_budget"""
+        try:
+            return await arun_steps(steps_fn(state), node_time_budget(node_name))
+        except (NodeTimeout, CircuitOpen) as e:
+            return self._degraded(node_name, state, fallback, e)
+    
+    def _degraded(self, node_name: str, state: DiagnosticState, fallback, error: Exception) -> DiagnosticState:
+        """Fallback state for a node that could not use the LLM, marked so clients can tell"""
+        print(f"⏱️ {node_name.upper()} NODE: {error}, serving fallback")
+        fallback_state = fallback(state)
+        return {
+            **fallback_state,
+            "degraded_nodes": list(state.get("degraded_nodes", [])) + [node_name],
+            "reasoning_steps": fallback_state.get("reasoning_steps", state.get("reasoning_steps", [])) + [{
+                "agent": node_name,
+                "step": "llm_circuit_open" if isinstance(error, CircuitOpen) else "time_budget_exceeded",
+                "timestamp": datetime.now().isoformat(),
+                "result": f"{node_name} fell back to a path without the LLM ({error})"
+            }]
+        }
+    
+    def _orchestrator_fallback(self, state: DiagnosticState) -> DiagnosticState:
+        """No case analysis; questioning works from the ML predictions alone"""
+        return {**state, "current_step": "orchestration_complete"}
+    
     @traceable(name="orchestrator_agent")
     def orchestrator_node(self, state: DiagnosticState) -> DiagnosticState:
         """Orchestrator agent that coordinates the diagnostic process"""
+        return self._with_budget("orchestrator", state, self._orchestrator_steps, self._orchestrator_fallback)
+    
+    @traceable(name="orchestrator_agent")
+    async def aorchestrator_node(self, state: DiagnosticState) -> DiagnosticState:
+        """orchestrator_node for astream: the analysis call is awaited on the event loop"""
+        return await self._awith_budget("orchestrator", state, self._orchestrator_steps, self._orchestrator_fallback)
+    
+    def _orchestrator_steps(self, state: DiagnosticState):
+        """Step generator behind orchestrator_node"""
         print(f"🔄 ORCHESTRATOR NODE STARTED - Current step: {state.get('current_step', 'unknown')}")
         print(f"   Questions asked: {state.get('questions_asked', 0)}/{state.get('max_questions', 5)}")
         print(f"   User responses: {len(state.get('user_responses', {}))}")
@@ -47,7 +133,7 @@ class MedicalAgentNodes:
             }
         
         # Start activity tracking
-        activity_id = self.activity_tracker.start_activity(
+        activity_id = self._activity_tracker(state).start_activity(
             "orchestrator", 
             "analyzing_symptoms",
             {
@@ -67,20 +153,15 @@ class MedicalAgentNodes:
                 reverse=True
             )[:3]
             
-            # Search for medical context for each top disease
-            medical_context = []
-            for disease_name, pred_data in top_diseases:
-                context_results = self.vector_db.search(f"Clinical presentation symptoms {disease_name}", k=2)
-                medical_context.extend(context_results)
-            
-            # Combine context into a structured format
-            medical_context_text = "\n".join([
-                f"Medical Reference {i+1}: {ctx}" 
-                for i, ctx in enumerate(medical_context)
-            ])
+            # Clinical context for each top disease, reusing lookups already made in this session
+            disease_context, retrieval_memo, memo_stats = yield from self._get_disease_context(
+                state, [disease_name for disease_name, _ in top_diseases], ORCHESTRATOR_SOURCES
+            )
+            medical_context = [text for texts in disease_context.values() for text in texts]
         else:
-            medical_context_text = "No specific medical context available"
             medical_context = []
+            retrieval_memo = state.get("retrieval_memo", {})
+            memo_stats = {"hits": 0, "misses": 0}
 
         prompt = ChatPromptTemplate.from_messages([
         ("system", """You are a Medical Diagnostic Orchestrator analyzing the patient case. 
@@ -106,13 +187,13 @@ class MedicalAgentNodes:
         ])
         
         # Properly format the prompt with all required variables
-        messages = prompt.format_messages(
-            selected_symptoms=state.get("selected_symptoms", []),
-            initial_predictions=json.dumps(initial_predictions, indent=2),
-            medical_context=medical_context_text
-        )
+        inputs = PromptInputs("orchestrator")
+        inputs.add("selected_symptoms", state.get("selected_symptoms", []))
+        inputs.add("initial_predictions", initial_predictions)
+        inputs.add_references("medical_context", medical_context)
+        messages = prompt.format_messages(**inputs.render())
         
-        response = self.llm.invoke(messages)
+        response = yield LLMInvoke(self.llm, messages)
         
         # Parse structured reasoning
         content = response.content
@@ -147,7 +228,8 @@ class MedicalAgentNodes:
                 "medical_complexity": medical_complexity
             },
             "vector_db_usage": {
-                "queries_made": len(top_diseases) if initial_predictions else 0,
+                "queries_made": memo_stats["misses"],
+                "memo_hits": memo_stats["hits"],
                 "context_retrieved": len(medical_context),
                 "top_diseases_researched": [d[0] for d in top_diseases] if initial_predictions else []
             },
@@ -155,7 +237,7 @@ class MedicalAgentNodes:
         }
         
         # Complete activity tracking
-        self.activity_tracker.complete_activity(
+        self._activity_tracker(state).complete_activity(
             activity_id,
             {
                 "diseases_analyzed": prediction_count,
@@ -182,13 +264,113 @@ class MedicalAgentNodes:
         "agent_outputs": {**existing_agent_outputs, "orchestrator": response.content},
         "vector_db_usage": existing_vector_usage + [{
             "agent": "orchestrator",
-            "queries": [f"Clinical presentation symptoms {d[0]}" for d in top_diseases] if initial_predictions else [],
+            "queries": [retrieval_memo_key(d[0], source) for d in top_diseases for source in ORCHESTRATOR_SOURCES] if initial_predictions else [],
+            "memo_hits": memo_stats["hits"],
             "results_count": len(medical_context),
             "timestamp": datetime.now().isoformat()
         }],
-            "real_time_activities": self.activity_tracker.get_current_activities()
+        "retrieval_memo": retrieval_memo,
+            "real_time_activities": self._activity_tracker(state).get_current_activities()
         }
         
+    def _docs_to_strings(self, docs) -> List[str]:
+        """Convert retrieved documents into plain strings for prompts and state"""
+        context_strings = []
+        for doc in docs:
+            if hasattr(doc, 'page_content'):
+                context_strings.append(doc.page_content)
+            elif hasattr(doc, 'content'):
+                context_strings.append(doc.content)
+            else:
+                context_strings.append(str(doc))
+        return context_strings
+    
+    def _get_disease_context(self, state: DiagnosticState, diseases: List[str], sources) -> tuple:
+        """Look up (disease, source) context, consulting the session retrieval memo before searching"""
+        retrieval_memo = dict(state.get("retrieval_memo") or {})
+        
+        missing = [
+            (disease, source)
+            for disease in diseases for source in sources
+            if retrieval_memo_key(disease, source) not in retrieval_memo
+        ]
+        if missing:
+            results = yield BlockingCall(self.vector_db.search_disease_many, missing, k=2)
+            for (disease, source), docs in zip(missing, results):
+                retrieval_memo[retrieval_memo_key(disease, source)] = self._docs_to_strings(docs)
+        
+        disease_context = {}
+        for disease in diseases:
+            texts = []
+            for source in sources:
+                for text in retrieval_memo.get(retrieval_memo_key(disease, source), []):
+                    if text not in texts:
+                        texts.append(text)
+            disease_context[disease] = texts
+        
+        memo_stats = {
+            "hits": len(diseases) * len(sources) - len(missing),
+            "misses": len(missing)
+        }
+        if missing:
+            print(f"   Retrieval memo: {memo_stats['hits']} hits, {memo_stats['misses']} lookups")
+        return disease_context, retrieval_memo, memo_stats
+    
+    def _symptom_matches(self, symptoms: List[str], disease_context: Dict[str, List[str]]) -> Dict[str, Any]:
+        """Symptom-match tool results per disease, computed from already retrieved dataset documents"""
+        matches = {}
+        for disease, texts in disease_context.items():
+            match = symptom_match(symptoms, disease, texts)
+            matches[disease] = {
+                "match_score": round(match["match_score"], 1),
+                "matched_symptoms": match["matched_symptoms"],
+                "total_known_symptoms": match["total_known_symptoms"]
+            }
+        return matches
+    
+    def _use_fanout(self, predictions: Dict[str, Any]) -> bool:
+        """Whether to split a node's LLM work into concurrent per-disease requests"""
+        return DiagnosticConfig.LLM_FANOUT_MODE == "per_disease" and len(predictions) > 1
+    
+    def _fan_out_per_disease(self, node_name: str, prompt: ChatPromptTemplate, diseases: List[str], format_kwargs,
+                             value_schema: Optional[type] = None) -> tuple:
+        """Run one small LLM request per disease concurrently and merge the per-disease JSON results.
+        
+        With value_schema, each answer's disease entry is validated and malformed ones are re-asked.
+        """
+        schema = single_disease_schema(value_schema) if value_schema else None
+        message_batches = [prompt.format_messages(**format_kwargs(disease)) for disease in diseases]
+        responses = yield LLMBatch(
+            json_mode(self.llm), message_batches,
+            config={"max_concurrency": DiagnosticConfig.LLM_FANOUT_CONCURRENCY}
+        )
+        
+        merged_results = {}
+        raw_outputs = []
+        for disease, messages, response in zip(diseases, message_batches, responses):
+            if isinstance(response, Exception):
+                print(f"Per-disease LLM call failed for {disease}: {response}")
+                continue
+            
+            raw_outputs.append(f"[{disease}]\n{response.content}")
+            try:
+                parsed = yield from parse_structured(node_name, self.llm, response.content, schema=schema,
+                                                     messages=messages)
+            except StructuredOutputError as e:
+                print(f"Error parsing per-disease result for {disease}: {e}")
+                continue
+            
+            # Expect {"<disease>": {...}}, but accept a single renamed key or a bare object
+            if isinstance(parsed, dict) and isinstance(parsed.get(disease), dict):
+                merged_results[disease] = parsed[disease]
+            elif isinstance(parsed, dict) and len(parsed) == 1 and isinstance(next(iter(parsed.values())), dict):
+                merged_results[disease] = next(iter(parsed.values()))
+            elif isinstance(parsed, dict) and parsed:
+                merged_results[disease] = parsed
+        
+        print(f"   Fan-out: {len(merged_results)}/{len(diseases)} per-disease results merged")
+        return merged_results, "\n\n".join(raw_outputs)
+    
     def _extract_section(self, content: str, section_name: str) -> str:
         """Extract a specific section from structured LLM response"""
         try:
@@ -229,65 +411,52 @@ class MedicalAgentNodes:
             return f"Error extracting {section_name.replace('_', ' ').lower()}"
     
     
-    @traceable(name="questioning_agent")
-    def questioning_node(self, state: DiagnosticState) -> DiagnosticState:
-        """Generate clarifying questions based on predictions"""
+    def _information_gain_questions(self, state: DiagnosticState, max_questions: int) -> tuple:
+        """Questions on the symptoms that best split the top candidates (see question_selector)"""
+        selections = self.question_selector.select(
+            state.get("initial_predictions", {}),
+            state.get("selected_symptoms", []),
+            max_questions,
+            DiagnosticConfig.QUESTION_CANDIDATE_DISEASES
+        )
+        if not selections:
+            return [], None
         
-        questions_asked = state.get("questions_asked", 0)
-        max_questions = state.get("max_questions", 5)
-        current_step = state.get("current_step", "")
-
-        print(f"🔄 QUESTIONING NODE STARTED - Total questions to generate: {max_questions}")
-        print(f"   Current step: {current_step}")
+        questions = self.question_selector.template_questions(selections)
+        selection_summary = json.dumps(selections)
+        if DiagnosticConfig.QUESTION_ENGINE == "fast":
+            return questions, selection_summary
         
-         # Check if we're in response processing mode
-        if current_step in ["responses_ready_for_processing", "all_responses_received"]:
-            print("❌ QUESTIONING NODE SKIPPED - Responses are being processed")
-            return {
-                **state,
-                "current_step": "questioning_skipped_for_processing",
-                "reasoning_steps": state.get("reasoning_steps", []) + [{
-                    "agent": "questioning",
-                    "step": "skipped_for_response_processing",
-                    "timestamp": datetime.now().isoformat(),
-                    "result": "Skipped questioning as responses are ready for processing"
-                }]
-            }
-        # Start activity tracking
-        activity_id = self.activity_tracker.start_activity(
-            "questioning", 
-            "generating_questions",
-            {
-                "questions_asked": questions_asked,
-                "max_questions": max_questions,
-                "questions_to_generate": max_questions
-            }
-        )
-
-        # Check if we've already generated questions
-        if questions_asked > 0 or state.get("clarifying_questions"):
-            print(f"Questions already generated or asked: {questions_asked}")
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", """You are a Medical Questioning Specialist. Rephrase each symptom check below as one
+            short, patient-friendly yes/no question. Keep the order and do not add or drop items.
             
-            self.activity_tracker.complete_activity(
-                activity_id,
-                {"questions_generated": 0, "reason": "already_generated"},
-                "Questions already generated in previous step"
-            )
+            SYMPTOM CHECKS:
+            {symptom_checks}
             
-            return {
-                **state,
-                "current_step": "questions_already_generated",
-                "needs_more_questions": False,
-                "reasoning_steps": state.get("reasoning_steps", []) + [{
-                    "agent": "questioning",
-                    "step": "questions_already_exist",
-                    "timestamp": datetime.now().isoformat(),
-                    "result": "Questions already generated",
-                    "questions_asked": questions_asked
-                }],
-                "real_time_activities": self.activity_tracker.get_current_activities()
-            }
+            CRITICAL: Return ONLY a valid JSON array of question strings, one per symptom check.
+            """),
+            ("human", "Phrase the questions.")
+        ])
+        messages = prompt.format_messages(
+            symptom_checks="\n".join(f"{i+1}. {q['symptom_checking']}" for i, q in enumerate(questions))
+        )
+        
+        try:
+            response = yield LLMInvoke(json_mode(self.llm), messages)
+            phrased = yield from parse_structured("questioning", self.llm, response.content, expect=list,
+                                                  messages=messages)
+            if isinstance(phrased, list) and len(phrased) == len(questions):
+                for question, text in zip(questions, phrased):
+                    if isinstance(text, str) and text.strip():
+                        question["question"] = question["question_text"] = text.strip()
+        except Exception as e:
+            print(f"Error phrasing selected questions, using templates: {e}")
         
+        return questions, selection_summary
+    
+    def _generate_llm_questions(self, state: DiagnosticState, max_questions: int) -> tuple:
+        """Have the LLM come up with the clarifying questions itself"""
         # Get orchestrator's analysis for context 
         orchestrator_analysis = None
         reasoning_steps = state.get("reasoning_steps", [])
@@ -344,86 +513,134 @@ class MedicalAgentNodes:
             Differential Diagnosis Needs: {orchestrator_analysis.get('differential_diagnosis', 'Not specified')}
             """
         
-        messages = prompt.format_messages(
-            initial_predictions=json.dumps(state.get("initial_predictions", {}), indent=2),
-            selected_symptoms=state.get("selected_symptoms", []),
-            max_questions=max_questions,
-            orchestrator_context=orchestrator_context_text
-        )
+        inputs = PromptInputs("questioning")
+        inputs.add("initial_predictions", state.get("initial_predictions", {}))
+        inputs.add("selected_symptoms", state.get("selected_symptoms", []))
+        inputs.add("orchestrator_context", orchestrator_context_text, priority=1)
+        messages = prompt.format_messages(max_questions=max_questions, **inputs.render())
         
-        response = self.llm.invoke(messages) 
+        response = yield LLMInvoke(json_mode(self.llm), messages) 
         
         print(f"Raw LLM response for questions: {response.content}")
         
         # Parse questions from response with better error handling 
         questions = []
         try:
-            content = response.content.strip()
-            
-            # Multiple extraction attempts
-            json_content = None
+            questions_data = yield from parse_structured("questioning", self.llm, response.content, expect=list,
+                                                         schema=QuestionListSchema, messages=messages)
             
-            # Method 1: Look for ```json blocks
-            if "```json" in content:
-                json_start = content.find("```json") + 7
-                json_end = content.find("```", json_start)
-                if json_end > json_start:
-                    json_content = content[json_start:json_end].strip()
+            # Validate and format questions
+            for i, q in enumerate(questions_data):
+                if isinstance(q, dict) and q.get("question_text"):
+                    question = {
+                        "id": q.get("id", f"q{i+1}"),
+                        "question": q.get("question_text", ""),
+                        "question_text": q.get("question_text", ""),
+                        "related_disease": q.get("related_disease", "General"),
+                        "symptom_checking": q.get("symptom_checking", "additional symptoms"),
+                        "priority": q.get("priority", 1),
+                        "type": q.get("type", "yes_no"),
+                        "required": q.get("required", True)
+                    }
+                    questions.append(question)
             
-            # Method 2: Look for array brackets
-            elif "[" in content and "]" in content:
-                start = content.find("[")
-                end = content.rfind("]") + 1
-                json_content = content[start:end]
+        except StructuredOutputError as e:
+            print(f"Error parsing questions: {e}")
+            print(f"Content that failed to parse: {response.content}")
+        
+        return questions, response.content
+    
+    @traceable(name="questioning_agent")
+    def questioning_node(self, state: DiagnosticState) -> DiagnosticState:
+        """Generate clarifying questions based on predictions"""
+        return self._with_budget("questioning", state, self._questioning_steps, self._questioning_fallback)
+    
+    @traceable(name="questioning_agent")
+    async def aquestioning_node(self, state: DiagnosticState) -> DiagnosticState:
+        """questioning_node for astream: knowledge lookups and question phrasing are awaited"""
+        return await self._awith_budget("questioning", state, self._questioning_steps, self._questioning_fallback)
+    
+    def _questioning_steps(self, state: DiagnosticState):
+        """Step generator behind questioning_node"""
+        
+        questions_asked = state.get("questions_asked", 0)
+        max_questions = state.get("max_questions", 5)
+        current_step = state.get("current_step", "")
+
+        print(f"🔄 QUESTIONING NODE STARTED - Total questions to generate: {max_questions}")
+        print(f"   Current step: {current_step}")
+        
+         # Check if we're in response processing mode
+        if current_step in ["responses_ready_for_processing", "all_responses_received"]:
+            print("❌ QUESTIONING NODE SKIPPED - Responses are being processed")
+            return {
+                **state,
+                "current_step": "questioning_skipped_for_processing",
+                "reasoning_steps": state.get("reasoning_steps", []) + [{
+                    "agent": "questioning",
+                    "step": "skipped_for_response_processing",
+                    "timestamp": datetime.now().isoformat(),
+                    "result": "Skipped questioning as responses are ready for processing"
+                }]
+            }
+        # Start activity tracking
+        activity_id = self._activity_tracker(state).start_activity(
+            "questioning", 
+            "generating_questions",
+            {
+                "questions_asked": questions_asked,
+                "max_questions": max_questions,
+                "questions_to_generate": max_questions
+            }
+        )
+
+        # Check if we've already generated questions
+        if questions_asked > 0 or state.get("clarifying_questions"):
+            print(f"Questions already generated or asked: {questions_asked}")
             
-            if json_content:
-                print(f"Extracted JSON content: {json_content}")
-                questions_data = json.loads(json_content)
-                
-                # Ensure it's a list
-                if isinstance(questions_data, dict):
-                    questions_data = [questions_data]
-                
-                # Validate and format questions
-                for i, q in enumerate(questions_data):
-                    if isinstance(q, dict) and q.get("question_text"):
-                        question = {
-                            "id": q.get("id", f"q{i+1}"),
-                            "question": q.get("question_text", ""),
-                            "question_text": q.get("question_text", ""),
-                            "related_disease": q.get("related_disease", "General"),
-                            "symptom_checking": q.get("symptom_checking", "additional symptoms"),
-                            "priority": q.get("priority", 1),
-                            "type": q.get("type", "yes_no"),
-                            "required": q.get("required", True)
-                        }
-                        questions.append(question)
+            self._activity_tracker(state).complete_activity(
+                activity_id,
+                {"questions_generated": 0, "reason": "already_generated"},
+                "Questions already generated in previous step"
+            )
             
-        except (json.JSONDecodeError, KeyError, AttributeError) as e:
-            print(f"Error parsing questions: {e}")
-            print(f"Content that failed to parse: {content}")
+            return {
+                **state,
+                "current_step": "questions_already_generated",
+                "needs_more_questions": False,
+                "reasoning_steps": state.get("reasoning_steps", []) + [{
+                    "agent": "questioning",
+                    "step": "questions_already_exist",
+                    "timestamp": datetime.now().isoformat(),
+                    "result": "Questions already generated",
+                    "questions_asked": questions_asked
+                }],
+                "real_time_activities": self._activity_tracker(state).get_current_activities()
+            }
+        
+        # Pick what to ask from the dataset when possible; the LLM only phrases it
+        questions = []
+        question_output = None
+        generation_strategy = "llm_generated"
+        if self.question_selector is not None:
+            questions, question_output = yield from self._information_gain_questions(state, max_questions)
+            if questions:
+                generation_strategy = f"information_gain_{DiagnosticConfig.QUESTION_ENGINE}"
+        
+        if not questions:
+            questions, question_output = yield from self._generate_llm_questions(state, max_questions)
         
         # Fallback
         if not questions:
             print("Generating fallback questions")
-            for i in range(max_questions):
-                questions.append({
-                    "id": f"q{i+1}",
-                    "question": f"Clarifying question {i+1} about your symptoms?",
-                    "question_text": f"Clarifying question {i+1} about your symptoms?",
-                    "related_disease": "General",
-                    "symptom_checking": "general symptoms",
-                    "priority": i+1,
-                    "type": "yes_no",
-                    "required": True
-                })
+            questions = self._generic_questions(max_questions)
 
         print(f"Final questions generated: {len(questions)} questions")
         for q in questions:
             print(f"  - {q['question_text']}")
         
         # Complete activity tracking
-        self.activity_tracker.complete_activity(
+        self._activity_tracker(state).complete_activity(
             activity_id,
             {
                 "questions_generated": len(questions),
@@ -439,8 +656,10 @@ class MedicalAgentNodes:
             "timestamp": datetime.now().isoformat(),
             "input_context": {
                 "max_questions": max_questions,
-                "orchestrator_analysis_available": orchestrator_analysis is not None,
-                "generation_strategy": "all_at_once"
+                "orchestrator_analysis_available": any(
+                    step.get("agent") == "orchestrator" for step in state.get("reasoning_steps", [])
+                ),
+                "generation_strategy": generation_strategy
             },
             "generation_process": {
                 "questions_generated": len(questions),
@@ -462,11 +681,46 @@ class MedicalAgentNodes:
             "current_step": "all_questions_generated",
             "needs_more_questions": False,  # No more questions needed
             "reasoning_steps": existing_reasoning + [reasoning_step],
-            "agent_outputs": {**existing_agent_outputs, "questioning": response.content},
-            "real_time_activities": self.activity_tracker.get_current_activities()
+            "agent_outputs": {**existing_agent_outputs, "questioning": question_output},
+            "real_time_activities": self._activity_tracker(state).get_current_activities()
         }
 
     
+    def _generic_questions(self, max_questions: int) -> List[Dict[str, Any]]:
+        return [{
+            "id": f"q{i+1}",
+            "question": f"Clarifying question {i+1} about your symptoms?",
+            "question_text": f"Clarifying question {i+1} about your symptoms?",
+            "related_disease": "General",
+            "symptom_checking": "general symptoms",
+            "priority": i+1,
+            "type": "yes_no",
+            "required": True
+        } for i in range(max_questions)]
+    
+    def _questioning_fallback(self, state: DiagnosticState) -> DiagnosticState:
+        """Template questions from the question selector, or generic ones, without the LLM"""
+        max_questions = state.get("max_questions", 5)
+        questions = []
+        if self.question_selector is not None:
+            selections = self.question_selector.select(
+                state.get("initial_predictions", {}),
+                state.get("selected_symptoms", []),
+                max_questions,
+                DiagnosticConfig.QUESTION_CANDIDATE_DISEASES
+            )
+            questions = self.question_selector.template_questions(selections) if selections else []
+        if not questions:
+            questions = self._generic_questions(max_questions)
+        return {
+            **state,
+            "clarifying_questions": questions,
+            "asked_questions": questions,
+            "questions_asked": len(questions),
+            "current_step": "all_questions_generated",
+            "needs_more_questions": False
+        }
+    
     def human_input_node(self, state: DiagnosticState) -> DiagnosticState:
         """Human-in-the-loop node for collecting responses"""
         
@@ -507,11 +761,20 @@ class MedicalAgentNodes:
     @traceable(name="response_integration_agent")
     def response_integration_node(self, state: DiagnosticState) -> DiagnosticState:
         """Process user responses with detailed medical reasoning - SAME AS BEFORE BUT WITH BETTER STATE PRESERVATION"""
+        return self._with_budget("response_integration", state, self._response_integration_steps, self._response_integration_fallback)
+    
+    @traceable(name="response_integration_agent")
+    async def aresponse_integration_node(self, state: DiagnosticState) -> DiagnosticState:
+        """response_integration_node for astream, with the same time budget and fallback"""
+        return await self._awith_budget("response_integration", state, self._response_integration_steps, self._response_integration_fallback)
+    
+    def _response_integration_steps(self, state: DiagnosticState):
+        """Step generator behind response_integration_node"""
         print(f"🔄 RESPONSE INTEGRATION NODE STARTED")
         print(f"   Processing {len(state.get('user_responses', {}))} user responses")
         
         # Track activity
-        activity_id = self.activity_tracker.start_activity(
+        activity_id = self._activity_tracker(state).start_activity(
             "response_integration", 
             "processing_answers",
             {"num_responses": len(state.get("user_responses", {}))}
@@ -543,48 +806,29 @@ class MedicalAgentNodes:
         ])
         
         # Create Q&A pairs for better context
-        qa_pairs = []
-        questions = state.get("clarifying_questions", [])
-        responses = state.get("user_responses", {})
-        
-        for q in questions:
-            q_id = q.get("id", "")
-            if q_id in responses:
-                qa_pairs.append({
-                    "question": q.get("question_text", ""),
-                    "answer": responses[q_id],
-                    "related_disease": q.get("related_disease", ""),
-                    "symptom_focus": q.get("symptom_checking", "")
-                })
+        qa_pairs = self._qa_pairs(state)
         
-        messages = prompt.format_messages(
-            qa_pairs=json.dumps(qa_pairs, indent=2),
-            diseases=list(state.get("initial_predictions", {}).keys()),
-            current_symptoms=state.get("selected_symptoms", [])
-        )
+        inputs = PromptInputs("response_integration")
+        inputs.add("qa_pairs", qa_pairs)
+        inputs.add("diseases", list(state.get("initial_predictions", {}).keys()))
+        inputs.add("current_symptoms", state.get("selected_symptoms", []))
+        messages = prompt.format_messages(**inputs.render())
         
-        response = self.llm.invoke(messages)  # Remove tools for cleaner JSON response
+        response = yield LLMInvoke(json_mode(self.llm), messages)
         
         # Parse the response
         updated_symptoms = state.get("selected_symptoms", [])
         medical_reasoning = response.content
         
         try:
-            content = response.content.strip()
-            if "```json" in content:
-                json_start = content.find("```json") + 7
-                json_end = content.find("```", json_start)
-                content = content[json_start:json_end].strip()
-            elif "{" in content and "}" in content:
-                start = content.find("{")
-                end = content.rfind("}") + 1
-                content = content[start:end]
-            
-            integration_result = json.loads(content)
+            integration_result = yield from parse_structured(
+                "response_integration", self.llm, response.content, schema=IntegrationSchema,
+                messages=messages
+            )
             updated_symptoms = integration_result.get("updated_symptoms", state["selected_symptoms"])
             medical_reasoning = integration_result.get("medical_reasoning", response.content)
             
-        except (json.JSONDecodeError, KeyError) as e:
+        except StructuredOutputError as e:
             print(f"Error parsing integration result: {e}")
             # Fallback: keep original symptoms
             updated_symptoms = state.get("selected_symptoms", [])
@@ -615,7 +859,7 @@ class MedicalAgentNodes:
         print(f"   Updated symptoms: {len(updated_symptoms)} total")
         
         # Complete activity tracking
-        self.activity_tracker.complete_activity(
+        self._activity_tracker(state).complete_activity(
             activity_id, 
             {"responses_processed": len(qa_pairs)},
             medical_reasoning
@@ -631,18 +875,57 @@ class MedicalAgentNodes:
             "current_step": "responses_integrated",
             "reasoning_steps": existing_reasoning + [detailed_reasoning],
             "agent_outputs": {**existing_agent_outputs, "response_integration": response.content},
-            "real_time_activities": self.activity_tracker.get_current_activities()
+            "real_time_activities": self._activity_tracker(state).get_current_activities()
         }
 
     
+    def _qa_pairs(self, state: DiagnosticState) -> List[Dict[str, Any]]:
+        """Each answered clarifying question with its answer"""
+        qa_pairs = []
+        responses = state.get("user_responses", {})
+        for q in state.get("clarifying_questions", []):
+            q_id = q.get("id", "")
+            if q_id in responses:
+                qa_pairs.append({
+                    "question": q.get("question_text", ""),
+                    "answer": responses[q_id],
+                    "related_disease": q.get("related_disease", ""),
+                    "symptom_focus": q.get("symptom_checking", "")
+                })
+        return qa_pairs
+    
+    def _response_integration_fallback(self, state: DiagnosticState) -> DiagnosticState:
+        """Add the symptoms the patient confirmed with a plain "yes" answer"""
+        updated_symptoms = list(state.get("selected_symptoms", []))
+        responses = state.get("user_responses", {})
+        for q in state.get("clarifying_questions", []):
+            answer = str(responses.get(q.get("id", ""), "")).strip().lower()
+            symptom = q.get("symptom_checking", "")
+            if answer in ("yes", "y", "true") and symptom and symptom != "general symptoms" and symptom not in updated_symptoms:
+                updated_symptoms.append(symptom)
+        return {
+            **state,
+            "updated_symptoms": updated_symptoms,
+            "current_step": "responses_integrated"
+        }
+    
     @traceable(name="refinement_agent")
     def refinement_node(self, state: DiagnosticState) -> DiagnosticState:
         """Refine and re-rank disease predictions based on updated information with detailed reasoning"""
+        return self._with_budget("refinement", state, self._refinement_steps, self._refinement_fallback)
+    
+    @traceable(name="refinement_agent")
+    async def arefinement_node(self, state: DiagnosticState) -> DiagnosticState:
+        """refinement_node for astream: the re-ranking call (or its per-disease fan-out) is awaited"""
+        return await self._awith_budget("refinement", state, self._refinement_steps, self._refinement_fallback)
+    
+    def _refinement_steps(self, state: DiagnosticState):
+        """Step generator behind refinement_node"""
         print(f"🔄 REFINEMENT NODE STARTED")
         print(f"   Refining {len(state.get('initial_predictions', {}))} predictions")
         
         # Track activity
-        activity_id = self.activity_tracker.start_activity(
+        activity_id = self._activity_tracker(state).start_activity(
             "refinement", 
             "updating_predictions",
             {"num_predictions": len(state.get('initial_predictions', {}))}
@@ -654,18 +937,23 @@ class MedicalAgentNodes:
         validation_results = state.get("validation_results", {})
         
         # Search for symptom-disease relationships
-        symptom_disease_context = {}
-        for symptom in updated_symptoms[:3]:  # Limit to top 3 symptoms for efficiency
-            context = self.vector_db.search(f"Symptom {symptom} associated diseases differential diagnosis", k=2)
-            context_strings = []
-            for doc in context:
-                if hasattr(doc, 'page_content'):
-                    context_strings.append(doc.page_content)
-                elif hasattr(doc, 'content'):
-                    context_strings.append(doc.content)
-                else:
-                    context_strings.append(str(doc))
-            symptom_disease_context[symptom] = context_strings
+        top_symptoms = updated_symptoms[:3]  # Limit to top 3 symptoms for efficiency
+        context_batches = yield BlockingCall(self.vector_db.search_many,
+            [f"Symptom {symptom} associated diseases differential diagnosis" for symptom in top_symptoms], k=2
+        )
+        symptom_disease_context = {
+            symptom: self._docs_to_strings(context)
+            for symptom, context in zip(top_symptoms, context_batches)
+        }
+        
+        # Run the symptom-match tool locally on the (memoized) dataset documents
+        symptom_matches = {}
+        retrieval_memo = state.get("retrieval_memo") or {}
+        if DiagnosticConfig.TOOL_PREFETCH_ENABLED:
+            disease_symptoms, retrieval_memo, _ = yield from self._get_disease_context(
+                state, list(initial_predictions.keys()), ("dataset",)
+            )
+            symptom_matches = self._symptom_matches(updated_symptoms, disease_symptoms)
 
         prompt = ChatPromptTemplate.from_messages([
             ("system", """You are a Medical Prediction Refinement Specialist. Re-rank and refine 
@@ -674,6 +962,9 @@ class MedicalAgentNodes:
             SYMPTOM-DISEASE CONTEXT:
             {symptom_disease_context}
 
+            SYMPTOM MATCH SCORES (from the medical knowledge base):
+            {symptom_matches}
+
             Initial predictions: {initial_predictions}
             Updated symptoms: {updated_symptoms}
             Validation results: {validation_results}
@@ -685,7 +976,7 @@ class MedicalAgentNodes:
             4. RANKING_JUSTIFICATION: Medical reasoning for ranking changes
             5. CONFIDENCE_ASSESSMENT: Detailed confidence level reasoning
 
-            Use the medical knowledge tools to verify symptom-disease relationships.
+            Use the symptom match scores to verify symptom-disease relationships.
 
             Return ONLY a valid JSON object:
             {{
@@ -702,32 +993,38 @@ class MedicalAgentNodes:
             ("human", "Refine the disease predictions with detailed medical reasoning based on all available information.")
         ])
 
-        messages = prompt.format_messages(
-            symptom_disease_context=json.dumps(symptom_disease_context, indent=2),
-            initial_predictions=json.dumps(initial_predictions, indent=2),
-            updated_symptoms=updated_symptoms,
-            validation_results=json.dumps(validation_results, indent=2)
-        )
-
-        response = self.llm_with_tools.invoke(messages)
+        if self._use_fanout(initial_predictions):
+            # One smaller request per disease, run concurrently
+            refined_predictions, raw_output = yield from self._fan_out_per_disease(
+                "refinement", prompt, list(initial_predictions.keys()),
+                lambda disease: self._refinement_inputs(
+                    symptom_disease_context, {disease: initial_predictions[disease]}, updated_symptoms,
+                    {disease: validation_results[disease]} if disease in validation_results else {},
+                    {disease: symptom_matches[disease]} if disease in symptom_matches else {}
+                ),
+                value_schema=PredictionScoresSchema
+            )
+            # Diseases without a usable answer keep their ML prediction
+            for disease, prediction in initial_predictions.items():
+                refined_predictions.setdefault(disease, prediction)
+        else:
+            messages = prompt.format_messages(**self._refinement_inputs(
+                symptom_disease_context, initial_predictions, updated_symptoms, validation_results, symptom_matches
+            ))
 
-        # Parse refinement results
-        try:
-            content = response.content
-            if "```json" in content:
-                json_start = content.find("```json") + 7
-                json_end = content.find("```", json_start)
-                content = content[json_start:json_end].strip()
-            elif "{" in content and "}" in content:
-                start = content.find("{")
-                end = content.rfind("}") + 1
-                content = content[start:end]
+            response = yield LLMInvoke(json_mode(self.llm), messages)
+            raw_output = response.content
 
-            refined_predictions = json.loads(content)
+            # Parse refinement results
+            try:
+                refined_predictions = yield from parse_structured(
+                    "refinement", self.llm, raw_output, schema=per_disease_schema(PredictionScoresSchema),
+                    messages=messages
+                )
 
-        except (json.JSONDecodeError, KeyError) as e:
-            print(f"Error parsing refinement result: {e}")
-            refined_predictions = initial_predictions
+            except StructuredOutputError as e:
+                print(f"Error parsing refinement result: {e}")
+                refined_predictions = initial_predictions
 
         # Create detailed reasoning
         detailed_reasoning = {
@@ -759,7 +1056,7 @@ class MedicalAgentNodes:
         print(f"   Refined {len(refined_predictions)} disease predictions with medical reasoning")
 
         # Complete activity tracking
-        self.activity_tracker.complete_activity(
+        self._activity_tracker(state).complete_activity(
             activity_id,
             {"predictions_refined": len(refined_predictions)},
             f"Refined {len(refined_predictions)} predictions based on updated symptoms and validation"
@@ -770,22 +1067,203 @@ class MedicalAgentNodes:
             "refined_predictions": refined_predictions,
             "current_step": "predictions_refined",
             "reasoning_steps": state.get("reasoning_steps", []) + [detailed_reasoning],
-            "agent_outputs": {**state.get("agent_outputs", {}), "refinement": response.content},
+            "agent_outputs": {**state.get("agent_outputs", {}), "refinement": raw_output},
             "vector_db_usage": state.get("vector_db_usage", []) + [
                 {"query": f"Symptom {symptom} associated diseases differential diagnosis", "results": symptom_disease_context[symptom]}
                 for symptom in symptom_disease_context.keys()
             ],
-            "real_time_activities": self.activity_tracker.get_current_activities()
+            "retrieval_memo": retrieval_memo,
+            "real_time_activities": self._activity_tracker(state).get_current_activities()
+        }
+    
+    def _refinement_inputs(self, symptom_disease_context, initial_predictions, updated_symptoms, validation_results,
+                           symptom_matches) -> Dict[str, str]:
+        inputs = PromptInputs("refinement")
+        inputs.add("initial_predictions", initial_predictions)
+        inputs.add("updated_symptoms", updated_symptoms)
+        inputs.add("symptom_matches", symptom_matches)
+        inputs.add("validation_results", validation_results, priority=1)
+        inputs.add_grouped_references("symptom_disease_context", symptom_disease_context)
+        return inputs.render()
+    
+    def _refinement_fallback(self, state: DiagnosticState) -> DiagnosticState:
+        """Keep the ML predictions unchanged"""
+        return {
+            **state,
+            "refined_predictions": state.get("initial_predictions", {}),
+            "current_step": "predictions_refined"
+        }
+    
+    @traceable(name="compact_assessment_agent")
+    def compact_assessment_node(self, state: DiagnosticState) -> DiagnosticState:
+        """Response integration, refinement and validation in one structured LLM call (compact pipeline)"""
+        return self._with_budget("compact_assessment", state, self._compact_assessment_steps,
+                                 self._compact_assessment_fallback)
+    
+    @traceable(name="compact_assessment_agent")
+    async def acompact_assessment_node(self, state: DiagnosticState) -> DiagnosticState:
+        """compact_assessment_node for astream: its single structured call is awaited"""
+        return await self._awith_budget("compact_assessment", state, self._compact_assessment_steps,
+                                        self._compact_assessment_fallback)
+    
+    def _compact_assessment_steps(self, state: DiagnosticState):
+        """Step generator behind compact_assessment_node"""
+        print(f"🔄 COMPACT ASSESSMENT NODE STARTED")
+        
+        initial_predictions = state["initial_predictions"]
+        activity_id = self._activity_tracker(state).start_activity(
+            "compact_assessment",
+            "assessing_answers",
+            {"num_responses": len(state.get("user_responses", {})), "num_predictions": len(initial_predictions)}
+        )
+        
+        qa_pairs = self._qa_pairs(state)
+        medical_context, retrieval_memo, memo_stats = yield from self._get_disease_context(
+            state, list(initial_predictions.keys()), VALIDATION_SOURCES
+        )
+        
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", """You are a Medical Diagnostic Assessor. In one pass:
+            1. Integrate the patient's answers into the symptom list.
+            2. Refine the probability of every predicted disease given the updated symptoms.
+            3. Validate each refined prediction against the medical context.
+            
+            MEDICAL CONTEXT:
+            {medical_context}
+            
+            Questions and answers: {qa_pairs}
+            Initial symptoms: {symptoms}
+            Initial ML predictions: {predictions}
+            
+            Return one prediction and one validation for every disease above, using its exact name."""),
+            ("human", "Assess the case.")
+        ])
+        inputs = PromptInputs("compact_assessment")
+        inputs.add("qa_pairs", qa_pairs)
+        inputs.add("symptoms", state.get("selected_symptoms", []))
+        inputs.add("predictions", {
+            disease: data.get("probability", 0) if isinstance(data, dict) else float(data or 0)
+            for disease, data in initial_predictions.items()
+        })
+        inputs.add_grouped_references("medical_context", medical_context)
+        messages = prompt.format_messages(**inputs.render())
+        
+        structured_llm = self.llm.with_structured_output(CompactAssessmentSchema, include_raw=True)
+        response = yield LLMInvoke(structured_llm, messages)
+        raw = response.get("raw")
+        raw_output = (raw.content or json.dumps(raw.tool_calls, default=str)) if raw is not None else ""
+        assessment = response.get("parsed")
+        
+        # Anything the model leaves out keeps its deterministic default
+        defaults = self._compact_assessment_fallback(state)
+        updated_symptoms = defaults["updated_symptoms"]
+        refined_predictions = dict(defaults["refined_predictions"])
+        validation_results = {}
+        medical_reasoning = "Structured assessment could not be parsed; kept the ML predictions"
+        get_parse_tracker().record("compact_assessment", "failed" if assessment is None else "clean")
+        if assessment is None:
+            print(f"Error parsing compact assessment: {response.get('parsing_error')}")
+        else:
+            diseases = {disease.lower(): disease for disease in initial_predictions}
+            updated_symptoms = assessment.updated_symptoms or updated_symptoms
+            medical_reasoning = assessment.medical_reasoning
+            for prediction in assessment.predictions:
+                disease = diseases.get(prediction.disease_name.lower())
+                if disease is not None:
+                    refined_predictions[disease] = {
+                        "probability": prediction.probability,
+                        "confidence": prediction.confidence,
+                        "description": prediction.description,
+                        "precautions": prediction.precautions,
+                        "symptom_match_score": prediction.symptom_match_score,
+                        "medical_reasoning": prediction.reasoning
+                    }
+            for validation in assessment.validations:
+                disease = diseases.get(validation.disease_name.lower())
+                if disease is not None:
+                    validation_results[disease] = {
+                        "confidence_adjustment": validation.confidence_adjustment,
+                        "reasoning": validation.reasoning,
+                        "symptom_match_score": validation.symptom_match_score,
+                        "validation_status": validation.validation_status
+                    }
+        
+        detailed_reasoning = {
+            "agent": "compact_assessment",
+            "step": "integrated_assessment",
+            "timestamp": datetime.now().isoformat(),
+            "responses_processed": len(qa_pairs),
+            "medical_reasoning": medical_reasoning,
+            "symptom_changes": {
+                "original_symptoms": state.get("selected_symptoms", []),
+                "updated_symptoms": updated_symptoms
+            },
+            "refinement_summary": {
+                disease: {
+                    "original_probability": initial_predictions.get(disease, {}).get("probability", 0),
+                    "refined_probability": result.get("probability", 0)
+                }
+                for disease, result in refined_predictions.items()
+            },
+            "validation_summary": {
+                disease: {
+                    "confidence_adjustment": result["confidence_adjustment"],
+                    "validation_status": result["validation_status"]
+                }
+                for disease, result in validation_results.items()
+            },
+            "memo_hits": memo_stats["hits"]
+        }
+        
+        print(f"✅ COMPACT ASSESSMENT NODE COMPLETED")
+        
+        self._activity_tracker(state).complete_activity(
+            activity_id,
+            {"predictions_refined": len(refined_predictions), "validations_completed": len(validation_results)},
+            medical_reasoning
+        )
+        
+        return {
+            **state,
+            "updated_symptoms": updated_symptoms,
+            "refined_predictions": refined_predictions,
+            "validation_results": validation_results,
+            "current_step": "compact_assessment_complete",
+            "reasoning_steps": state.get("reasoning_steps", []) + [detailed_reasoning],
+            "agent_outputs": {**state.get("agent_outputs", {}), "compact_assessment": raw_output},
+            "vector_db_usage": state.get("vector_db_usage", []) + [
+                {"query": f"{disease}: {', '.join(VALIDATION_SOURCES)}", "results": medical_context[disease]}
+                for disease in initial_predictions.keys()
+            ],
+            "retrieval_memo": retrieval_memo,
+            "real_time_activities": self._activity_tracker(state).get_current_activities()
+        }
+    
+    def _compact_assessment_fallback(self, state: DiagnosticState) -> DiagnosticState:
+        """The response integration and refinement fallbacks, without validation"""
+        return {
+            **self._refinement_fallback(self._response_integration_fallback(state)),
+            "validation_results": {},
+            "current_step": "compact_assessment_complete"
         }
     
     @traceable(name="validation_agent")
     def validation_node(self, state: DiagnosticState) -> DiagnosticState:
         """Validate predictions against medical knowledge"""
+        return self._with_budget("validation", state, self._validation_steps, self._validation_fallback)
+    
+    @traceable(name="validation_agent")
+    async def avalidation_node(self, state: DiagnosticState) -> DiagnosticState:
+        """validation_node for astream: knowledge lookups and validation calls are awaited"""
+        return await self._awith_budget("validation", state, self._validation_steps, self._validation_fallback)
+    
+    def _validation_steps(self, state: DiagnosticState):
+        """Step generator behind validation_node"""
         print(f"🔄 VALIDATION NODE STARTED")
         print(f"   Validating {len(state.get('initial_predictions', {}))} predictions")
         
         # Track activity
-        activity_id = self.activity_tracker.start_activity(
+        activity_id = self._activity_tracker(state).start_activity(
             "validation", 
             "checking_medical_knowledge",
             {"num_predictions": len(state.get('initial_predictions', {}))}
@@ -795,19 +1273,13 @@ class MedicalAgentNodes:
         predictions = state.get("refined_predictions", state["initial_predictions"])
         symptoms = state.get("updated_symptoms", state["selected_symptoms"])
         
-        # Search medical knowledge for each disease
-        medical_validations = {}
-        for disease in predictions.keys():
-            medical_context = self.vector_db.search(f"Medical validation {disease} symptoms diagnosis", k=3)
-            context_strings = []
-            for doc in medical_context:
-                if hasattr(doc, 'page_content'):
-                    context_strings.append(doc.page_content)
-                elif hasattr(doc, 'content'):
-                    context_strings.append(doc.content)
-                else:
-                    context_strings.append(str(doc))
-            medical_validations[disease] = context_strings
+        # Medical knowledge for all diseases, reusing lookups already made in this session
+        medical_validations, retrieval_memo, memo_stats = yield from self._get_disease_context(
+            state, list(predictions.keys()), VALIDATION_SOURCES
+        )
+        # Run the symptom-match tool locally; the dataset documents are already in the context
+        symptom_matches = (self._symptom_matches(symptoms, medical_validations)
+                           if DiagnosticConfig.TOOL_PREFETCH_ENABLED else {})
             
         prompt = ChatPromptTemplate.from_messages([
             ("system", """You are a Medical Knowledge Validator. Cross-reference symptom patterns 
@@ -816,6 +1288,9 @@ class MedicalAgentNodes:
             MEDICAL VALIDATION CONTEXT:
             {medical_validations}
             
+            SYMPTOM MATCH SCORES (from the medical knowledge base):
+            {symptom_matches}
+            
             Current predictions: {predictions}
             Updated symptoms: {symptoms}
             
@@ -825,7 +1300,7 @@ class MedicalAgentNodes:
             3. DIFFERENTIAL_ANALYSIS: How this compares to similar conditions
             4. CONFIDENCE_REASONING: Medical justification for confidence adjustments
             
-            Use the available medical tools to search for disease information.
+            Use the symptom match scores and the validation context as your medical evidence.
             
             Return ONLY a valid JSON object:
             {{
@@ -841,31 +1316,34 @@ class MedicalAgentNodes:
             ("human", "Validate the disease predictions against medical knowledge with detailed reasoning.")
         ])
         
-        messages = prompt.format_messages(
-            medical_validations=json.dumps(medical_validations, indent=2),
-            predictions=json.dumps(predictions, indent=2),
-            symptoms=symptoms
-        )
-        
-        response = self.llm_with_tools.invoke(messages)
-        
-        # Parse validation results
-        try:
-            content = response.content
-            if "```json" in content:
-                json_start = content.find("```json") + 7
-                json_end = content.find("```", json_start)
-                content = content[json_start:json_end].strip()
-            elif "{" in content and "}" in content:
-                start = content.find("{")
-                end = content.rfind("}") + 1
-                content = content[start:end]
+        if self._use_fanout(predictions):
+            # One smaller request per disease, run concurrently
+            validation_results, raw_output = yield from self._fan_out_per_disease(
+                "validation", prompt, list(predictions.keys()),
+                lambda disease: self._validation_inputs(
+                    {disease: medical_validations[disease]}, {disease: predictions[disease]}, symptoms,
+                    {disease: symptom_matches[disease]} if disease in symptom_matches else {}
+                ),
+                value_schema=ValidationScoresSchema
+            )
+        else:
+            messages = prompt.format_messages(**self._validation_inputs(
+                medical_validations, predictions, symptoms, symptom_matches
+            ))
             
-            validation_results = json.loads(content)
+            response = yield LLMInvoke(json_mode(self.llm), messages)
+            raw_output = response.content
             
-        except (json.JSONDecodeError, KeyError) as e:
-            print(f"Error parsing validation result: {e}")
-            validation_results = {}
+            # Parse validation results
+            try:
+                validation_results = yield from parse_structured(
+                    "validation", self.llm, raw_output, schema=per_disease_schema(ValidationScoresSchema),
+                    messages=messages
+                )
+                
+            except StructuredOutputError as e:
+                print(f"Error parsing validation result: {e}")
+                validation_results = {}
         
         # Create detailed reasoning
         detailed_reasoning = {
@@ -874,7 +1352,8 @@ class MedicalAgentNodes:
             "timestamp": datetime.now().isoformat(),
             "predictions_validated": len(validation_results),
             "medical_context_queries": list(medical_validations.keys()),
-            "vector_db_searches": [f"Medical validation {disease} symptoms diagnosis" for disease in predictions.keys()],
+            "vector_db_searches": [retrieval_memo_key(disease, source) for disease in predictions.keys() for source in VALIDATION_SOURCES],
+            "memo_hits": memo_stats["hits"],
             "validation_summary": {
                 disease: {
                     "confidence_adjustment": result.get("confidence_adjustment", 0),
@@ -890,7 +1369,7 @@ class MedicalAgentNodes:
         print(f"   Validated {len(validation_results)} predictions with medical evidence")
         
         # Complete activity tracking
-        self.activity_tracker.complete_activity(
+        self._activity_tracker(state).complete_activity(
             activity_id,
             {"validations_completed": len(validation_results)},
             f"Validated {len(validation_results)} predictions against medical knowledge"
@@ -901,22 +1380,113 @@ class MedicalAgentNodes:
             "validation_results": validation_results,
             "current_step": "predictions_validated",
             "reasoning_steps": state.get("reasoning_steps", []) + [detailed_reasoning],
-            "agent_outputs": {**state.get("agent_outputs", {}), "validation": response.content},
+            "agent_outputs": {**state.get("agent_outputs", {}), "validation": raw_output},
             "vector_db_usage": state.get("vector_db_usage", []) + [
-                {"query": f"Medical validation {disease} symptoms diagnosis", "results": medical_validations[disease]}
+                {"query": f"{disease}: {', '.join(VALIDATION_SOURCES)}", "results": medical_validations[disease]}
                 for disease in predictions.keys()
             ],
-            "real_time_activities": self.activity_tracker.get_current_activities()
+            "retrieval_memo": retrieval_memo,
+            "real_time_activities": self._activity_tracker(state).get_current_activities()
+        }
+    
+    def _validation_inputs(self, medical_validations, predictions, symptoms, symptom_matches) -> Dict[str, str]:
+        inputs = PromptInputs("validation")
+        inputs.add("predictions", predictions)
+        inputs.add("symptoms", symptoms)
+        inputs.add("symptom_matches", symptom_matches)
+        inputs.add_grouped_references("medical_validations", medical_validations)
+        return inputs.render()
+    
+    def _validation_fallback(self, state: DiagnosticState) -> DiagnosticState:
+        """No validation adjustments"""
+        return {
+            **state,
+            "validation_results": {},
+            "current_step": "predictions_validated"
         }
     
+    def _explanation_inputs(self, symptoms, predictions, validation, explanation_context) -> Dict[str, str]:
+        inputs = PromptInputs("explanation")
+        inputs.add("symptoms", symptoms)
+        inputs.add("predictions", predictions)
+        inputs.add("validation", validation, priority=1)
+        inputs.add_grouped_references("explanation_context", explanation_context)
+        return inputs.render()
+    
+    def _catalog_explanations(self, predictions: Dict[str, Any], symptoms: List[str], validation: Dict[str, Any]) -> tuple:
+        """Catalog base explanations plus, in delta mode, a short case-specific note from the LLM"""
+        catalog_version = self.explanation_catalog.catalog_version
+        case_notes = {}
+        raw_output = f"explanation catalog v{catalog_version}"
+        
+        if DiagnosticConfig.EXPLANATION_MODE == "delta":
+            prompt = ChatPromptTemplate.from_messages([
+                ("system", """You are a Medical Explanation Specialist. Patients already receive a general
+                description of each condition. For each disease below write 1-2 plain-language sentences
+                on how THIS patient's symptoms relate to it and what the probability means for them.
+                
+                Symptoms: {symptoms}
+                Predictions: {predictions}
+                Validation: {validation}
+                
+                Return ONLY a valid JSON object mapping each disease name to its sentences."""),
+                ("human", "Write the case-specific notes.")
+            ])
+            messages = prompt.format_messages(
+                symptoms=compact_json(symptoms),
+                predictions=compact_json({
+                    disease: round(data.get("probability", 0) if isinstance(data, dict) else float(data or 0), 3)
+                    for disease, data in predictions.items()
+                }),
+                validation=compact_json({
+                    disease: result.get("validation_status", "not_validated")
+                    for disease, result in validation.items() if isinstance(result, dict)
+                })
+            )
+            try:
+                response = yield LLMInvoke(json_mode(self.llm), messages)
+                raw_output = response.content
+                parsed = yield from parse_structured("explanation", self.llm, raw_output, messages=messages)
+                for disease, note in parsed.items():
+                    if isinstance(note, dict):
+                        note = note.get("explanation") or note.get("note")
+                    if note:
+                        case_notes[disease] = str(note)
+            except Exception as e:
+                print(f"Error generating case-specific notes, serving catalog text only: {e}")
+        
+        detailed_explanations = {}
+        for disease, pred_data in predictions.items():
+            entry = self.explanation_catalog.get(disease)
+            prob = pred_data.get("probability", 0) if isinstance(pred_data, dict) else float(pred_data or 0)
+            case_note = case_notes.get(disease, f"Based on your symptoms, there is a {prob:.1%} likelihood of {disease}.")
+            detailed_explanations[disease] = {
+                "explanation": f"{case_note} {entry['text']}",
+                "symptom_analysis": case_note,
+                "confidence_reasoning": f"Confidence based on {prob:.1%} probability score",
+                "medical_context": entry["overview"],
+                "catalog_version": catalog_version
+            }
+        
+        return detailed_explanations, raw_output
+    
     @traceable(name="explanation_agent")
     def explanation_node(self, state: DiagnosticState) -> DiagnosticState:
         """Generate clear explanations for predictions with detailed reasoning"""
+        return self._with_budget("explanation", state, self._explanation_steps, self._explanation_fallback)
+    
+    @traceable(name="explanation_agent")
+    async def aexplanation_node(self, state: DiagnosticState) -> DiagnosticState:
+        """explanation_node for astream, with the same time budget and catalog fallback"""
+        return await self._awith_budget("explanation", state, self._explanation_steps, self._explanation_fallback)
+    
+    def _explanation_steps(self, state: DiagnosticState):
+        """Step generator behind explanation_node"""
         print(f"🔄 EXPLANATION NODE STARTED")
         print(f"   Generating explanations for {len(state.get('refined_predictions', {}))} predictions")
         
         # Track activity
-        activity_id = self.activity_tracker.start_activity(
+        activity_id = self._activity_tracker(state).start_activity(
             "explanation", 
             "generating_explanations",
             {"num_predictions": len(state.get('refined_predictions', {}))}
@@ -927,105 +1497,99 @@ class MedicalAgentNodes:
         symptoms = state.get("updated_symptoms", state["selected_symptoms"])
         validation = state.get("validation_results", {})
         
-        # Search for explanation context for each disease
-        explanation_context = {}
-        for disease in predictions.keys():
-            context = self.vector_db.search(f"Patient explanation {disease} symptoms causes treatment", k=2)
-            context_strings = []
-            for doc in context:
-                if hasattr(doc, 'page_content'):
-                    context_strings.append(doc.page_content)
-                elif hasattr(doc, 'content'):
-                    context_strings.append(doc.content)
-                else:
-                    context_strings.append(str(doc))
-            explanation_context[disease] = context_strings
+        if (DiagnosticConfig.EXPLANATION_MODE != "full" and self.explanation_catalog is not None
+                and self.explanation_catalog.has_all(list(predictions.keys()))):
+            # Base text comes from the catalog, so no knowledge-base lookups are needed
+            explanation_context = {disease: [] for disease in predictions.keys()}
+            retrieval_memo = state.get("retrieval_memo", {})
+            memo_stats = {"hits": 0, "misses": 0}
+            detailed_explanations, raw_output = yield from self._catalog_explanations(predictions, symptoms, validation)
+        else:
+            # Explanation context for all diseases, reusing lookups already made in this session
+            explanation_context, retrieval_memo, memo_stats = yield from self._get_disease_context(
+                state, list(predictions.keys()), EXPLANATION_SOURCES
+            )
             
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", """You are a Medical Explanation Specialist. Create clear, understandable 
-            explanations for disease predictions that patients can understand.
+            prompt = ChatPromptTemplate.from_messages([
+                ("system", """You are a Medical Explanation Specialist. Create clear, understandable 
+                explanations for disease predictions that patients can understand.
 
-            PATIENT DATA:
-            - Symptoms: {symptoms}
-            - Disease Predictions: {predictions}
-            - Medical Validation: {validation}
-            - Medical Context: {explanation_context}
+                PATIENT DATA:
+                - Symptoms: {symptoms}
+                - Disease Predictions: {predictions}
+                - Medical Validation: {validation}
+                - Medical Context: {explanation_context}
             
-            For each disease prediction, provide:
-            1. Clear explanation of why this disease was predicted
-            2. How the patient's symptoms relate to this condition
-            3. Confidence level reasoning in simple terms
-            4. Any relevant medical context in patient-friendly language
-
-            Return ONLY a valid JSON object with this structure:
-            {{
-                "disease_name": {{
-                    "explanation": "Patient-friendly explanation here",
-                    "symptom_analysis": "How symptoms support this diagnosis",
-                    "confidence_reasoning": "Why this confidence level",
-                    "medical_context": "Relevant background in simple terms"
-                }}
-            }}"""),
-            ("human", "Generate comprehensive patient-friendly explanations.")
-        ])
+                For each disease prediction, provide:
+                1. Clear explanation of why this disease was predicted
+                2. How the patient's symptoms relate to this condition
+                3. Confidence level reasoning in simple terms
+                4. Any relevant medical context in patient-friendly language
 
-        try:
-            # Convert all data to JSON strings for safe template formatting
-            predictions_json = json.dumps(predictions, indent=2)
-            symptoms_list = json.dumps(symptoms)
-            validation_json = json.dumps(validation, indent=2)
-            context_json = json.dumps(explanation_context, indent=2)
-            
-            messages = prompt.format_messages(
-                symptoms=symptoms_list,
-                predictions=predictions_json,
-                validation=validation_json,
-                explanation_context=context_json
-            )
-            
-            response = self.llm_with_tools.invoke(messages)
-            
-        except Exception as format_error:
-            print(f"Error formatting prompt: {format_error}")
-            # Fallback with simpler formatting
-            simple_prompt = ChatPromptTemplate.from_messages([
-                ("system", "You are a medical explanation specialist. Generate patient-friendly explanations for the given disease predictions."),
-                ("human", f"Generate explanations for these diseases: {list(predictions.keys())}")
+                Return ONLY a valid JSON object with this structure:
+                {{
+                    "disease_name": {{
+                        "explanation": "Patient-friendly explanation here",
+                        "symptom_analysis": "How symptoms support this diagnosis",
+                        "confidence_reasoning": "Why this confidence level",
+                        "medical_context": "Relevant background in simple terms"
+                    }}
+                }}"""),
+                ("human", "Generate comprehensive patient-friendly explanations.")
             ])
-            messages = simple_prompt.format_messages()
-            response = self.llm_with_tools.invoke(messages)
 
-        # Parse explanations with detailed structure
-        try:
-            content = response.content
-            print(f"Raw LLM response: {content[:200]}...")  # Debug log
-            
-            if "```json" in content:
-                json_start = content.find("```json") + 7
-                json_end = content.find("```", json_start)
-                content = content[json_start:json_end].strip()
-            elif "{" in content and "}" in content:
-                start = content.find("{")
-                end = content.rfind("}") + 1
-                content = content[start:end]
-            
-            detailed_explanations = json.loads(content)
+            if self._use_fanout(predictions):
+                # One smaller request per disease, run concurrently
+                detailed_explanations, raw_output = yield from self._fan_out_per_disease(
+                    "explanation", prompt, list(predictions.keys()),
+                    lambda disease: self._explanation_inputs(
+                        symptoms, {disease: predictions[disease]},
+                        {disease: validation[disease]} if disease in validation else {},
+                        {disease: explanation_context.get(disease, [])}
+                    )
+                )
+            else:
+                try:
+                    # Convert all data to JSON strings for safe template formatting
+                    messages = prompt.format_messages(**self._explanation_inputs(
+                        symptoms, predictions, validation, explanation_context
+                    ))
+                
+                    response = yield LLMInvoke(json_mode(self.llm), messages)
+                
+                except Exception as format_error:
+                    print(f"Error formatting prompt: {format_error}")
+                    # Fallback with simpler formatting
+                    simple_prompt = ChatPromptTemplate.from_messages([
+                        ("system", "You are a medical explanation specialist. Generate patient-friendly explanations for the given disease predictions."),
+                        ("human", f"Generate explanations for these diseases: {list(predictions.keys())}")
+                    ])
+                    messages = simple_prompt.format_messages()
+                    response = yield LLMInvoke(json_mode(self.llm), messages)
             
-            # Convert to simple explanations for backward compatibility
-            simple_explanations = {}
-            for disease, explanation_data in detailed_explanations.items():
-                if isinstance(explanation_data, dict):
-                    simple_explanations[disease] = explanation_data.get("explanation",
-                        f"Based on your symptoms, there is a likelihood of {disease}.")
-                else:
-                    simple_explanations[disease] = str(explanation_data)
-                    
-        except (json.JSONDecodeError, KeyError, Exception) as e:
-            print(f"Error parsing explanations: {e}")
-            # Fallback to simple explanations
-            simple_explanations = {}
-            detailed_explanations = {}
-            for disease, pred_data in predictions.items():
+                raw_output = response.content
+                print(f"Raw LLM response: {raw_output[:200]}...")  # Debug log
+
+                # Parse explanations with detailed structure
+                try:
+                    detailed_explanations = yield from parse_structured("explanation", self.llm, raw_output,
+                                                                        messages=messages)
+                except StructuredOutputError as e:
+                    print(f"Error parsing explanations: {e}")
+                    detailed_explanations = {}
+
+        # Convert to simple explanations for backward compatibility
+        simple_explanations = {}
+        for disease, explanation_data in detailed_explanations.items():
+            if isinstance(explanation_data, dict):
+                simple_explanations[disease] = explanation_data.get("explanation",
+                    f"Based on your symptoms, there is a likelihood of {disease}.")
+            else:
+                simple_explanations[disease] = str(explanation_data)
+        
+        # Fallback to simple explanations for diseases without a usable answer
+        for disease, pred_data in predictions.items():
+            if disease not in simple_explanations:
                 prob = pred_data.get('probability', 0) if isinstance(pred_data, dict) else 0
                 simple_explanations[disease] = f"Based on symptom analysis and medical validation, {disease} was identified as a potential condition with {prob:.1%} probability."
                 detailed_explanations[disease] = {
@@ -1042,7 +1606,8 @@ class MedicalAgentNodes:
             "timestamp": datetime.now().isoformat(),
             "explanations_generated": len(simple_explanations),
             "medical_context_queries": list(explanation_context.keys()),
-            "vector_db_searches": [f"Patient explanation {disease} symptoms causes treatment" for disease in predictions.keys()],
+            "vector_db_searches": [retrieval_memo_key(disease, source) for disease in predictions.keys() for source in EXPLANATION_SOURCES],
+            "memo_hits": memo_stats["hits"],
             "explanation_analysis": {
                 disease: {
                     "symptom_correlation": detailed_explanations.get(disease, {}).get("symptom_analysis", "Not specified"),
@@ -1070,7 +1635,7 @@ class MedicalAgentNodes:
         print(f"   Generated {len(simple_explanations)} patient-friendly explanations with medical reasoning")
 
         # Complete activity tracking
-        self.activity_tracker.complete_activity(
+        self._activity_tracker(state).complete_activity(
             activity_id,
             {"explanations_generated": len(simple_explanations)},
             f"Generated comprehensive explanations for {len(simple_explanations)} conditions with medical reasoning"
@@ -1082,15 +1647,194 @@ class MedicalAgentNodes:
             "detailed_explanations": detailed_explanations,  # Add detailed explanations
             "current_step": "explanations_generated",
             "reasoning_steps": state.get("reasoning_steps", []) + [detailed_reasoning],
-            "agent_outputs": {**state.get("agent_outputs", {}), "explanation": response.content},
+            "agent_outputs": {**state.get("agent_outputs", {}), "explanation": raw_output},
             "vector_db_usage": state.get("vector_db_usage", []) + [
-                {"query": f"Patient explanation {disease} symptoms causes treatment", "results": explanation_context[disease]}
+                {"query": f"{disease}: {', '.join(EXPLANATION_SOURCES)}", "results": explanation_context[disease]}
                 for disease in predictions.keys()
             ],
-            "real_time_activities": self.activity_tracker.get_current_activities()
+            "retrieval_memo": retrieval_memo,
+            "real_time_activities": self._activity_tracker(state).get_current_activities()
         }
 
     
+    def _explanation_fallback(self, state: DiagnosticState) -> DiagnosticState:
+        """Catalog text when available, otherwise a one-line probability summary"""
+        predictions = state.get("refined_predictions") or state.get("initial_predictions", {})
+        explanations = {}
+        detailed_explanations = {}
+        for disease, pred_data in predictions.items():
+            prob = pred_data.get("probability", 0) if isinstance(pred_data, dict) else float(pred_data or 0)
+            summary = f"Based on your symptoms, there is a {prob:.1%} likelihood of {disease}."
+            entry = self.explanation_catalog.get(disease) if self.explanation_catalog is not None else None
+            explanations[disease] = f"{summary} {entry['text']}" if entry else summary
+            detailed_explanations[disease] = {
+                "explanation": explanations[disease],
+                "symptom_analysis": summary,
+                "confidence_reasoning": f"Confidence based on {prob:.1%} probability score",
+                "medical_context": entry["overview"] if entry else ""
+            }
+        return {
+            **state,
+            "explanations": explanations,
+            "detailed_explanations": detailed_explanations,
+            "current_step": "explanations_generated"
+        }
+    
+    def _merge_branches(self, state: DiagnosticState, branches) -> tuple:
+        """Fold parallel branch updates back in, in the given order.
+        
+        Returns (reasoning_steps, agent_outputs, other changed keys); lists only
+        carry the entries each branch appended.
+        """
+        branch_results = state.get("branch_results", {})
+        base_reasoning = state.get("reasoning_steps", [])
+        reasoning_steps = list(base_reasoning)
+        agent_outputs = dict(state.get("agent_outputs", {}))
+        merged_updates = {}
+        for branch in branches:
+            branch_update = branch_results.get(branch, {})
+            reasoning_steps += branch_update.get("reasoning_steps", [])[len(base_reasoning):]
+            agent_outputs.update(branch_update.get("agent_outputs", {}))
+            for key, value in branch_update.items():
+                if key in ("reasoning_steps", "agent_outputs", "current_step"):
+                    continue
+                if key == "degraded_nodes":
+                    merged = merged_updates.get(key, list(state.get(key, [])))
+                    merged_updates[key] = merged + [node for node in value if node not in merged]
+                elif key == "retrieval_memo":
+                    merged_updates[key] = {**merged_updates.get(key, {}), **value}
+                elif key == "vector_db_usage":
+                    merged = merged_updates.get(key, list(state.get(key, [])))
+                    merged_updates[key] = merged + value[len(state.get(key, [])):]
+                else:
+                    merged_updates[key] = value
+        return reasoning_steps, agent_outputs, merged_updates
+    
+    @traceable(name="question_reconciliation_agent")
+    def question_reconciliation_node(self, state: DiagnosticState) -> DiagnosticState:
+        """Fan-in after speculative questioning: merge the orchestrator analysis and fit the
+        questions, generated without it, to what the orchestrator found"""
+        print(f"🔄 QUESTION RECONCILIATION NODE STARTED")
+        
+        reasoning_steps, agent_outputs, merged_updates = self._merge_branches(state, ("orchestrator", "questioning"))
+        questions = merged_updates.get("clarifying_questions") or []
+        
+        analysis = next(
+            (step.get("medical_analysis", {}) for step in reasoning_steps if step.get("agent") == "orchestrator"),
+            {}
+        )
+        analysis_text = " ".join(
+            str(analysis.get(section, "")) for section in ("missing_clinical_info", "questioning_strategy", "differential_diagnosis")
+        ).lower().replace("_", " ")
+        
+        # Questions on symptoms the patient already reported add nothing
+        known_symptoms = {symptom.lower().replace("_", " ").strip() for symptom in state.get("selected_symptoms", [])}
+        kept = [q for q in questions
+                if q.get("symptom_checking", "").lower().replace("_", " ").strip() not in known_symptoms] or questions
+        
+        # Questions on what the orchestrator flagged as missing go first; the order is otherwise kept
+        def flagged(question):
+            symptom = question.get("symptom_checking", "").lower().replace("_", " ").strip()
+            return bool(symptom) and symptom in analysis_text
+        reconciled = sorted(kept, key=lambda q: not flagged(q)) if analysis_text.strip() else kept
+        
+        reasoning_step = {
+            "agent": "question_reconciliation",
+            "step": "speculative_questions_reconciled",
+            "timestamp": datetime.now().isoformat(),
+            "questions_generated": len(questions),
+            "questions_dropped": len(questions) - len(reconciled),
+            "questions_flagged_by_orchestrator": sum(1 for q in reconciled if flagged(q)),
+            "result": f"Kept {len(reconciled)} of {len(questions)} speculatively generated questions"
+        }
+        
+        print(f"✅ QUESTION RECONCILIATION NODE COMPLETED - {len(reconciled)} questions")
+        
+        return {
+            **state,
+            **merged_updates,
+            "clarifying_questions": reconciled,
+            "asked_questions": reconciled,
+            "questions_asked": len(reconciled),
+            "current_step": "all_questions_generated",
+            "reasoning_steps": reasoning_steps + [reasoning_step],
+            "agent_outputs": agent_outputs,
+            "branch_results": None
+        }
+    
+    @traceable(name="reconciliation_agent")
+    def reconciliation_node(self, state: DiagnosticState) -> DiagnosticState:
+        """Fan-in after the parallel branches: validation (or the compact assessment) and explanation"""
+        print(f"🔄 RECONCILIATION NODE STARTED")
+        
+        branch_results = state.get("branch_results", {})
+        print(f"   Merging branches: {list(branch_results.keys())}")
+        
+        reasoning_steps, agent_outputs, merged_updates = self._merge_branches(
+            state, ("compact", "validation", "explanation")
+        )
+        
+        predictions = (merged_updates.get("refined_predictions") or state.get("refined_predictions")
+                       or state.get("initial_predictions", {}))
+        validation_results = merged_updates.get("validation_results", state.get("validation_results", {})) or {}
+        explanations = dict(merged_updates.get("explanations", state.get("explanations", {})) or {})
+        
+        # Apply validation confidence adjustments and note them in the explanations
+        confidence_scores = {}
+        for disease, prediction in predictions.items():
+            probability = prediction.get("probability", 0) if isinstance(prediction, dict) else float(prediction or 0)
+            validation = validation_results.get(disease, {})
+            if not isinstance(validation, dict):
+                validation = {}
+            
+            try:
+                adjustment = float(validation.get("confidence_adjustment", 0) or 0)
+            except (TypeError, ValueError):
+                adjustment = 0.0
+            adjustment = max(-0.5, min(0.5, adjustment))
+            adjusted_probability = max(0.0, min(1.0, probability + adjustment))
+            
+            confidence_scores[disease] = {
+                "original_probability": probability,
+                "confidence_adjustment": adjustment,
+                "adjusted_probability": adjusted_probability,
+                "confidence_level": "High" if adjusted_probability >= DiagnosticConfig.HIGH_CONFIDENCE_THRESHOLD
+                    else "Medium" if adjusted_probability >= DiagnosticConfig.MEDIUM_CONFIDENCE_THRESHOLD else "Low",
+                "validation_status": validation.get("validation_status", "not_validated")
+            }
+            
+            if disease in explanations and adjustment:
+                direction = "increased" if adjustment > 0 else "reduced"
+                explanations[disease] = (
+                    f"{explanations[disease]} Cross-checking with our medical knowledge base {direction} "
+                    f"our confidence in this result to about {adjusted_probability:.0%}."
+                )
+        
+        reasoning_step = {
+            "agent": "reconciliation",
+            "step": "merge_parallel_branches",
+            "timestamp": datetime.now().isoformat(),
+            "branches_merged": list(branch_results.keys()),
+            "confidence_adjustments": {
+                disease: scores["confidence_adjustment"] for disease, scores in confidence_scores.items()
+            },
+            "result": f"Reconciled validation adjustments into {len(explanations)} explanations"
+        }
+        
+        print(f"✅ RECONCILIATION NODE COMPLETED")
+        
+        return {
+            **state,
+            **merged_updates,
+            "validation_results": validation_results,
+            "explanations": explanations,
+            "confidence_scores": confidence_scores,
+            "current_step": "branches_reconciled",
+            "reasoning_steps": reasoning_steps + [reasoning_step],
+            "agent_outputs": agent_outputs,
+            "branch_results": None
+        }
+    
     @traceable(name="evaluation_agent") 
     def evaluator_node(self, state: DiagnosticState) -> DiagnosticState:
         """Evaluate overall confidence - simplified for single question round"""
@@ -1103,7 +1847,7 @@ class MedicalAgentNodes:
         print(f"   Current step: {state.get('current_step', 'unknown')}")
 
         # Track activity
-        activity_id = self.activity_tracker.start_activity(
+        activity_id = self._activity_tracker(state).start_activity(
             "evaluator", 
             "final_confidence_evaluation",
             {
@@ -1161,7 +1905,7 @@ class MedicalAgentNodes:
         }
         
         # Complete activity tracking
-        self.activity_tracker.complete_activity(
+        self._activity_tracker(state).complete_activity(
             activity_id,
             {
                 "decision_made": decision,
@@ -1184,6 +1928,6 @@ class MedicalAgentNodes:
             "current_step": "evaluation_complete",
             "reasoning_steps": state.get("reasoning_steps", []) + [reasoning_step],
             "agent_outputs": {**state.get("agent_outputs", {}), "evaluator": f"Single round evaluation complete. Proceeding to explanation with confidence: {overall_confidence}"},
-            "real_time_activities": self.activity_tracker.get_current_activities()
+            "real_time_activities": self._activity_tracker(state).get_current_activities()
         }
 
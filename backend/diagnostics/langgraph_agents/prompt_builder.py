@@ -0,0 +1,123 @@
+"""Compact prompt inputs under a per-node token budget"""
+from typing import Dict, Any, List, Optional
+from .config import DiagnosticConfig
+import json
+
+def text_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token), the same estimate the LLM limiter uses"""
+    return len(text) // 4
+
+def _round_floats(value: Any, digits: int = 3) -> Any:
+    if isinstance(value, float):
+        return round(value, digits)
+    if isinstance(value, dict):
+        return {key: _round_floats(item, digits) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_round_floats(item, digits) for item in value]
+    return value
+
+def compact_json(value: Any) -> str:
+    """JSON without indentation or spaces after separators, floats rounded to 3 digits"""
+    return json.dumps(_round_floats(value), separators=(",", ":"), ensure_ascii=False, default=str)
+
+def dedupe_texts(texts: List[str], seen: Optional[set] = None) -> List[str]:
+    """Drop empty and repeated texts (ignoring whitespace differences), keeping the first occurrence"""
+    seen = set() if seen is None else seen
+    unique = []
+    for text in texts:
+        key = " ".join(str(text).split())
+        if key and key not in seen:
+            seen.add(key)
+            unique.append(key)
+    return unique
+
+class _Section:
+    __slots__ = ("name", "value", "priority", "kind")
+
+    def __init__(self, name: str, value: Any, priority: int, kind: str):
+        self.name = name
+        self.value = value
+        self.priority = priority
+        self.kind = kind
+
+    def render(self) -> str:
+        if self.kind == "references":
+            return "\n".join(f"[{i + 1}] {text}" for i, text in enumerate(self.value)) or "None"
+        if self.kind == "text":
+            return self.value
+        return compact_json(self.value)
+
+    def shrink(self, excess_tokens: int) -> bool:
+        """Give up at least excess_tokens (or everything that is left); False when already empty"""
+        if self.kind == "references":
+            if not self.value:
+                return False
+            self.value = self.value[:-1]
+            return True
+        if self.kind == "grouped":
+            # Trim the largest group, so every disease keeps some context
+            largest = max(self.value, key=lambda group: len(self.value[group]), default=None)
+            if largest is None or not self.value[largest]:
+                return False
+            self.value = {**self.value, largest: self.value[largest][:-1]}
+            return True
+        if self.kind == "text":
+            if not self.value:
+                return False
+            keep = max(0, len(self.value) - 4 * excess_tokens - 1)
+            self.value = self.value[:keep].rstrip() + "…" if keep else ""
+            return True
+        return False
+
+class PromptInputs:
+    """Named prompt variables for one node, serialized compactly and fitted to its token budget.
+
+    priority 0 marks inputs that are never cut (symptoms, predictions, answers);
+    above that, the highest number is trimmed first once the inputs exceed the
+    node's budget (see DiagnosticConfig.prompt_token_budget).
+    """
+
+    def __init__(self, node_name: str, budget_tokens: Optional[int] = None):
+        self.node_name = node_name
+        self.budget_tokens = (DiagnosticConfig.prompt_token_budget(node_name)
+                              if budget_tokens is None else budget_tokens)
+        self._sections = []
+        self._seen_references = set()
+
+    def add(self, name: str, value: Any, priority: int = 0) -> "PromptInputs":
+        """Any JSON-serializable value, or a string used as is"""
+        self._sections.append(_Section(name, value, priority, "text" if isinstance(value, str) else "json"))
+        return self
+
+    def add_references(self, name: str, texts: List[str], priority: int = 2) -> "PromptInputs":
+        """Retrieved texts as a numbered list; texts already added under another name are dropped"""
+        self._sections.append(_Section(name, dedupe_texts(texts, self._seen_references), priority, "references"))
+        return self
+
+    def add_grouped_references(self, name: str, groups: Dict[str, List[str]], priority: int = 2) -> "PromptInputs":
+        """Retrieved texts per disease; a text shown for one disease is not repeated for the next"""
+        groups = {group: dedupe_texts(texts, self._seen_references) for group, texts in groups.items()}
+        self._sections.append(_Section(name, groups, priority, "grouped"))
+        return self
+
+    def render(self) -> Dict[str, str]:
+        """Keyword arguments for ChatPromptTemplate.format_messages"""
+        rendered = {section.name: section.render() for section in self._sections}
+        if self.budget_tokens is None:
+            return rendered
+
+        total = sum(text_tokens(text) for text in rendered.values())
+        initial_total = total
+        trimmed = set()
+        for section in sorted(self._sections, key=lambda s: -s.priority):
+            if section.priority == 0:
+                break
+            while total > self.budget_tokens and section.shrink(total - self.budget_tokens):
+                total -= text_tokens(rendered[section.name])
+                rendered[section.name] = section.render()
+                total += text_tokens(rendered[section.name])
+                trimmed.add(section.name)
+        if trimmed:
+            print(f"   Prompt budget {self.node_name}: {initial_total} -> {total} tokens "
+                  f"(budget {self.budget_tokens}, trimmed {sorted(trimmed)})")
+        return rendered
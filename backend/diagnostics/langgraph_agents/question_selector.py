@@ -0,0 +1,150 @@
+"""Deterministic clarifying-question selection from the disease x symptom dataset"""
+from typing import Dict, Any, List, Optional
+import numpy as np
+import pandas as pd
+import re
+
+def normalize_symptom(symptom: str) -> str:
+    """Dataset symptoms look like ' skin_rash' or 'dischromic _patches'; user input may use spaces"""
+    return re.sub(r"[\s_]+", "_", str(symptom).strip().lower()).strip("_")
+
+def readable_symptom(symptom: str) -> str:
+    return normalize_symptom(symptom).replace("_", " ")
+
+def _entropy(distributions: np.ndarray) -> np.ndarray:
+    """Shannon entropy (bits) along the last axis of already-normalized distributions"""
+    safe = np.where(distributions > 0, distributions, 1.0)
+    return -(distributions * np.log2(safe)).sum(axis=-1)
+
+class InformationGainQuestionSelector:
+    """Picks the symptoms whose yes/no answer best splits the candidate diseases.
+
+    P[d, s] is the share of dataset rows for disease d that list symptom s. Questions
+    are chosen greedily by expected entropy reduction over the candidates' posterior,
+    conditioning on the answer patterns of the questions already picked.
+    """
+
+    # Keeps a symptom that never/always appears for a disease from zeroing out a posterior
+    SMOOTHING = 0.02
+
+    def __init__(self, diseases: List[str], symptoms: List[str], symptom_given_disease: np.ndarray):
+        self.diseases = diseases
+        self.symptoms = symptoms
+        self.symptom_given_disease = np.clip(symptom_given_disease, self.SMOOTHING, 1 - self.SMOOTHING)
+        self._disease_index = {d.strip().lower(): i for i, d in enumerate(diseases)}
+        self._symptom_index = {s: i for i, s in enumerate(symptoms)}
+
+    @classmethod
+    def from_csv(cls, dataset_path: str) -> "InformationGainQuestionSelector":
+        """Build the disease x symptom frequency matrix from dataset.csv"""
+        dataset = pd.read_csv(dataset_path)
+        symptom_columns = dataset.columns[1:]
+        rows = dataset[symptom_columns].stack().map(normalize_symptom)
+        rows = rows[rows != ""]
+
+        diseases = sorted(dataset["Disease"].str.strip().unique())
+        symptoms = sorted(rows.unique())
+        disease_rows = dataset["Disease"].str.strip()
+
+        # Count the rows of each disease that list each symptom
+        pairs = pd.DataFrame({
+            "disease": disease_rows.loc[rows.index.get_level_values(0)].values,
+            "row": rows.index.get_level_values(0),
+            "symptom": rows.values
+        }).drop_duplicates()
+        counts = pd.crosstab(pairs["disease"], pairs["symptom"]).reindex(
+            index=diseases, columns=symptoms, fill_value=0
+        ).to_numpy(dtype=float)
+        rows_per_disease = disease_rows.value_counts().reindex(diseases).to_numpy(dtype=float)
+
+        return cls(diseases, symptoms, counts / rows_per_disease[:, None])
+
+    def select(self,
+               predictions: Dict[str, Any],
+               known_symptoms: List[str],
+               max_questions: int,
+               max_candidates: int = 5) -> List[Dict[str, Any]]:
+        """Return up to max_questions symptoms to ask about, most informative first"""
+        candidates = []
+        for disease, data in predictions.items():
+            index = self._disease_index.get(str(disease).strip().lower())
+            probability = data.get("probability", 0) if isinstance(data, dict) else float(data or 0)
+            if index is not None and probability > 0:
+                candidates.append((index, probability, disease))
+        candidates = sorted(candidates, key=lambda c: c[1], reverse=True)[:max_candidates]
+        if len(candidates) < 2 or max_questions <= 0:
+            return []
+
+        disease_ids = np.array([c[0] for c in candidates])
+        prior = np.array([c[1] for c in candidates], dtype=float)
+        prior /= prior.sum()
+        likelihood = self.symptom_given_disease[disease_ids]  # (D, S)
+
+        available = np.ones(len(self.symptoms), dtype=bool)
+        for symptom in known_symptoms:
+            index = self._symptom_index.get(normalize_symptom(symptom))
+            if index is not None:
+                available[index] = False
+        # Symptoms none of the candidates show cannot separate them
+        available &= likelihood.max(axis=0) > self.SMOOTHING
+        symptom_ids = np.flatnonzero(available)
+        likelihood = likelihood[:, symptom_ids]
+        available = np.ones(len(symptom_ids), dtype=bool)
+
+        # joint[o, d]: P(answer pattern o, disease d) for the questions chosen so far
+        joint = prior[None, :]
+        prior_entropy = float(_entropy(prior))
+        selected = []
+        for _ in range(min(max_questions, int(available.sum()))):
+            yes = joint[:, :, None] * likelihood[None, :, :]        # (O, D, S)
+            no = joint[:, :, None] * (1 - likelihood[None, :, :])
+            outcomes = np.concatenate([yes, no], axis=0)            # (2O, D, S)
+            outcome_mass = outcomes.sum(axis=1)                     # (2O, S)
+            posterior = outcomes / np.where(outcome_mass > 0, outcome_mass, 1.0)[:, None, :]
+            expected_entropy = (outcome_mass * _entropy(np.moveaxis(posterior, 1, -1))).sum(axis=0)
+            expected_entropy[~available] = np.inf
+
+            best = int(np.argmin(expected_entropy))
+            if not np.isfinite(expected_entropy[best]):
+                break
+
+            current_entropy = float((joint.sum(axis=1) * _entropy(joint / joint.sum(axis=1, keepdims=True))).sum())
+            column = likelihood[:, best]
+            selected.append({
+                "symptom": self.symptoms[symptom_ids[best]],
+                "information_gain": round(current_entropy - float(expected_entropy[best]), 4),
+                "cumulative_information_gain": round(prior_entropy - float(expected_entropy[best]), 4),
+                "probability_yes": round(float((prior * column).sum()), 4),
+                "related_disease": candidates[int(np.argmax(column))][2]
+            })
+            joint = np.concatenate([joint * column[None, :], joint * (1 - column[None, :])], axis=0)
+            available[best] = False
+
+        return selected
+
+    def template_questions(self, selections: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Phrase selected symptoms as yes/no questions without an LLM"""
+        questions = []
+        for i, selection in enumerate(selections):
+            question_text = f"Have you been experiencing {readable_symptom(selection['symptom'])}?"
+            questions.append({
+                "id": f"q{i+1}",
+                "question": question_text,
+                "question_text": question_text,
+                "related_disease": selection["related_disease"],
+                "symptom_checking": readable_symptom(selection["symptom"]),
+                "priority": i + 1,
+                "type": "yes_no",
+                "required": True,
+                "information_gain": selection["information_gain"]
+            })
+        return questions
+
+def load_question_selector(dataset_path: str) -> Optional[InformationGainQuestionSelector]:
+    try:
+        selector = InformationGainQuestionSelector.from_csv(dataset_path)
+        print(f"Loaded question selector: {len(selector.diseases)} diseases x {len(selector.symptoms)} symptoms")
+        return selector
+    except Exception as e:
+        print(f"Warning: Could not load symptom dataset for question selection: {e}")
+        return None
@@ -0,0 +1,266 @@
+"""Process-wide throttle for LLM calls: a concurrency cap plus requests/tokens-per-minute buckets"""
+from typing import Dict, Any, List, Optional
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+from .config import DiagnosticConfig
+from .llm_cache import is_cached_response
+import asyncio
+import threading
+import time
+
+def estimate_tokens(messages: List[Any], output_tokens: int) -> int:
+    """Rough prompt size (~4 characters per token) plus the expected completion"""
+    characters = sum(len(str(getattr(message, "content", message))) for message in messages)
+    return characters // 4 + output_tokens
+
+def _request_kwargs(deadline_at: Optional[float]) -> Dict[str, Any]:
+    """Provider request timeout: what is left of the caller's time, capped by LLM_REQUEST_TIMEOUT_SECONDS"""
+    if deadline_at is None:
+        return {}
+    remaining = deadline_at - time.monotonic()
+    return {"timeout": max(0.001, min(remaining, DiagnosticConfig.LLM_REQUEST_TIMEOUT_SECONDS))}
+
+class _TokenBucket:
+    """Refills continuously at per_minute / 60 per second; may go into debt to keep FIFO order"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = per_minute
+        self.updated_at = time.monotonic()
+
+    def take(self, amount: float, now: float) -> float:
+        """Reserve amount and return how long the caller must wait before using it"""
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        self.level -= min(amount, self.capacity)
+        return max(0.0, -self.level / self.rate)
+
+    def adjust(self, amount: float):
+        """Correct an earlier reservation once the real usage is known"""
+        self.level = min(self.capacity, self.level - amount)
+
+class LLMRateLimiter:
+    """Shared by every node in the process so load degrades into queueing, not provider 429s.
+
+    A call first reserves a request and its estimated tokens from the per-minute
+    buckets, sleeping off any deficit, then waits for one of max_concurrency slots.
+    The token reservation is corrected with the usage the provider reports, and
+    refunded for responses served from the LLM cache. Works from worker threads and from event loops alike.
+
+    A sync caller with a deadline (monotonic time) gives up once it passes: a call
+    whose caller has timed out is dropped, with its reservation refunded, instead
+    of being made after it waited for a slot.
+    """
+
+    def __init__(self, max_concurrency: int, requests_per_minute: float, tokens_per_minute: float,
+                 sample_size: int = 500):
+        self.max_concurrency = max_concurrency
+        self._lock = threading.Lock()
+        self._requests = _TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self._tokens = _TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self._active = 0
+        self._waiters = deque()
+        self.calls = 0
+        self.throttled = 0
+        self.peak_active = 0
+        self.estimated_tokens = 0
+        self.reported_tokens = 0
+        self.abandoned = 0
+        self.cached = 0
+        self._slot_waits = deque(maxlen=sample_size)
+        self._rate_waits = deque(maxlen=sample_size)
+
+    def _reserve(self, tokens: int) -> float:
+        now = time.monotonic()
+        with self._lock:
+            self.calls += 1
+            self.estimated_tokens += tokens
+            wait = 0.0
+            if self._requests is not None:
+                wait = max(wait, self._requests.take(1, now))
+            if self._tokens is not None:
+                wait = max(wait, self._tokens.take(tokens, now))
+            if wait > 0:
+                self.throttled += 1
+            self._rate_waits.append(wait)
+            return wait
+
+    def _refund(self, tokens: int):
+        # Caller holds the lock
+        if self._requests is not None:
+            self._requests.adjust(-1)
+        if self._tokens is not None:
+            self._tokens.adjust(-tokens)
+
+    def _give_up(self, tokens: int):
+        """Refund the reservation of a call that will not be made"""
+        with self._lock:
+            self.abandoned += 1
+            self._refund(tokens)
+
+    def _enter(self, wake) -> bool:
+        """Take a slot now (True) or queue wake() to be called when one frees up"""
+        with self._lock:
+            if self._active < self.max_concurrency and not self._waiters:
+                self._active += 1
+                self.peak_active = max(self.peak_active, self._active)
+                return True
+            self._waiters.append(wake)
+            return False
+
+    def _leave_queue(self, wake) -> bool:
+        """Withdraw a queued waiter; False if a slot was already handed to it"""
+        with self._lock:
+            try:
+                self._waiters.remove(wake)
+                return True
+            except ValueError:
+                return False
+
+    def _release(self):
+        with self._lock:
+            if not self._waiters:
+                self._active -= 1
+                return
+            wake = self._waiters.popleft()
+        # The slot passes straight to the next waiter
+        wake()
+
+    def _settle(self, estimated: int, response):
+        """Replace the token estimate with the provider's reported usage, when available"""
+        if is_cached_response(response):
+            # Callers look the cache up first; this is a hit that appeared meanwhile
+            with self._lock:
+                self.cached += 1
+                self._refund(estimated)
+            return
+        usage = getattr(response, "usage_metadata", None) or {}
+        total = usage.get("total_tokens") if isinstance(usage, dict) else None
+        if not total:
+            return
+        with self._lock:
+            self.reported_tokens += total
+            if self._tokens is not None:
+                self._tokens.adjust(total - estimated)
+
+    @contextmanager
+    def limit(self, tokens: int, deadline_at: Optional[float] = None):
+        """Blocking acquisition for worker threads; raises TimeoutError once deadline_at passes"""
+        started_at = time.monotonic()
+        wait = self._reserve(tokens)
+        if wait > 0:
+            if deadline_at is not None and started_at + wait >= deadline_at:
+                self._give_up(tokens)
+                raise TimeoutError("LLM rate limit wait exceeds the caller's deadline")
+            time.sleep(wait)
+        woken = threading.Event()
+        if not self._enter(woken.set):
+            timeout = None if deadline_at is None else max(0.0, deadline_at - time.monotonic())
+            if not woken.wait(timeout) and self._leave_queue(woken.set):
+                self._give_up(tokens)
+                raise TimeoutError("caller gave up while waiting for an LLM slot")
+        self._slot_waits.append(time.monotonic() - started_at - wait)
+        try:
+            if deadline_at is not None and time.monotonic() >= deadline_at:
+                self._give_up(tokens)
+                raise TimeoutError("caller gave up while waiting for an LLM slot")
+            yield
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def alimit(self, tokens: int):
+        """Non-blocking acquisition for code running on an event loop"""
+        started_at = time.monotonic()
+        wait = self._reserve(tokens)
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                self._give_up(tokens)
+                raise
+        loop = asyncio.get_running_loop()
+        turn = loop.create_future()
+
+        def on_wake():
+            if turn.cancelled():
+                self._release()
+            else:
+                turn.set_result(None)
+
+        if not self._enter(lambda: loop.call_soon_threadsafe(on_wake)):
+            try:
+                await turn
+            except asyncio.CancelledError:
+                if turn.done() and not turn.cancelled():
+                    self._release()
+                self._give_up(tokens)
+                raise
+        self._slot_waits.append(time.monotonic() - started_at - wait)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def invoke(self, llm, messages, config: Optional[Dict[str, Any]] = None,
+               deadline_at: Optional[float] = None):
+        tokens = estimate_tokens(messages, DiagnosticConfig.LLM_OUTPUT_TOKEN_ESTIMATE)
+        with self.limit(tokens, deadline_at):
+            response = llm.invoke(messages, config=config, **_request_kwargs(deadline_at))
+        self._settle(tokens, response)
+        return response
+
+    async def ainvoke(self, llm, messages, config: Optional[Dict[str, Any]] = None,
+                      deadline_at: Optional[float] = None):
+        # A caller that gives up cancels this coroutine, which frees the slot
+        tokens = estimate_tokens(messages, DiagnosticConfig.LLM_OUTPUT_TOKEN_ESTIMATE)
+        async with self.alimit(tokens):
+            response = await llm.ainvoke(messages, config=config, **_request_kwargs(deadline_at))
+        self._settle(tokens, response)
+        return response
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Concurrency, queueing and rate-limit metrics for monitoring"""
+        def summary(samples):
+            samples = sorted(samples)
+            if not samples:
+                return {"avg": 0.0, "p95": 0.0, "max": 0.0}
+            return {
+                "avg": round(1000 * sum(samples) / len(samples), 1),
+                "p95": round(1000 * samples[int(0.95 * (len(samples) - 1))], 1),
+                "max": round(1000 * samples[-1], 1)
+            }
+
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "active": self._active,
+                "waiting": len(self._waiters),
+                "peak_active": self.peak_active,
+                "max_concurrency": self.max_concurrency,
+                "throttled": self.throttled,
+                "abandoned": self.abandoned,
+                "cached": self.cached,
+                "requests_per_minute": self._requests.capacity if self._requests else None,
+                "tokens_per_minute": self._tokens.capacity if self._tokens else None,
+                "estimated_tokens": self.estimated_tokens,
+                "reported_tokens": self.reported_tokens,
+                "slot_wait_ms": summary(self._slot_waits),
+                "rate_wait_ms": summary(self._rate_waits)
+            }
+
+_llm_limiter = None
+_llm_limiter_lock = threading.Lock()
+
+def get_llm_limiter() -> LLMRateLimiter:
+    """The limiter shared by every LLM call in this process"""
+    global _llm_limiter
+    with _llm_limiter_lock:
+        if _llm_limiter is None:
+            _llm_limiter = LLMRateLimiter(
+                DiagnosticConfig.LLM_MAX_CONCURRENCY,
+                DiagnosticConfig.LLM_REQUESTS_PER_MINUTE,
+                DiagnosticConfig.LLM_TOKENS_PER_MINUTE
+            )
+        return _llm_limiter
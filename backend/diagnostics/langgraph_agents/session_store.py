@@ -0,0 +1,508 @@
+"""Per-session state of the API layer and graph, bounded by TTL and LRU eviction.
+
+Values live under named namespaces (reasoning, status, jobs, ...) and a session's
+values expire together: after SESSION_TTL_SECONDS without access, or when more than
+SESSION_MAX_SESSIONS sessions are held. A background sweeper removes expired
+sessions that are never touched again.
+
+SESSION_STORE_BACKEND selects where they live: "memory" keeps them in this process,
+"sqlite" in a WAL-mode SQLite file that every worker process on the host shares,
+so any worker can serve a session's status and reasoning stream.
+"""
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from .config import DiagnosticConfig
+import json
+import os
+import sqlite3
+import threading
+import time
+
+_MISSING = object()
+
+class SessionNamespace(MutableMapping):
+    """Dict view of one namespace of a session store, keyed by session id"""
+
+    def __init__(self, store: "SessionStore", name: str):
+        self.store = store
+        self.name = name
+
+    def __getitem__(self, session_id: str) -> Any:
+        value = self.store.get(self.name, session_id, _MISSING)
+        if value is _MISSING:
+            raise KeyError(session_id)
+        return value
+
+    def __setitem__(self, session_id: str, value: Any):
+        self.store.set(self.name, session_id, value)
+
+    def __delitem__(self, session_id: str):
+        if not self.store.delete(self.name, session_id):
+            raise KeyError(session_id)
+
+    def __contains__(self, session_id) -> bool:
+        return self.store.get(self.name, session_id, _MISSING) is not _MISSING
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.store.session_ids(self.name))
+
+    def __len__(self) -> int:
+        return len(self.store.session_ids(self.name))
+
+    def get(self, session_id: str, default: Any = None) -> Any:
+        return self.store.get(self.name, session_id, default)
+
+    def setdefault(self, session_id: str, default: Any = None) -> Any:
+        return self.store.setdefault(self.name, session_id, default)
+
+class SessionStore:
+    """Base class for session stores: namespaces, eviction listeners and the sweeper.
+
+    Reads and writes refresh a session's TTL and LRU position. A value read from
+    a shared backend is a copy, so callers write changes back with set(); append()
+    adds to a session's event log without rewriting it.
+    """
+
+    backend = "base"
+
+    def __init__(self, ttl_seconds: float, max_sessions: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self._listeners: List[Callable[[str], None]] = []
+        self._stats_lock = threading.Lock()
+        self.expired = 0
+        self.evicted = 0
+        self._sweeper = None
+
+    def namespace(self, name: str) -> SessionNamespace:
+        return SessionNamespace(self, name)
+
+    def add_eviction_listener(self, listener: Callable[[str], None]):
+        """Call listener(session_id) whenever this process expires or evicts a session"""
+        self._listeners.append(listener)
+
+    def _notify(self, expired: List[str], evicted: List[str] = ()):
+        with self._stats_lock:
+            self.expired += len(expired)
+            self.evicted += len(evicted)
+        for session_id in [*expired, *evicted]:
+            for listener in self._listeners:
+                try:
+                    listener(session_id)
+                except Exception as e:
+                    print(f"Session eviction listener failed for {session_id}: {e}")
+
+    def set(self, namespace: str, session_id: str, value: Any):
+        self.setdefault(namespace, session_id, value, replace=True)
+
+    def get(self, namespace: str, session_id: str, default: Any = None) -> Any:
+        raise NotImplementedError
+
+    def setdefault(self, namespace: str, session_id: str, default: Any = None, replace: bool = False) -> Any:
+        raise NotImplementedError
+
+    def delete(self, namespace: str, session_id: str) -> bool:
+        raise NotImplementedError
+
+    def append(self, namespace: str, session_id: str, item: Any) -> int:
+        """Add item to the session's event log under namespace; returns its index"""
+        raise NotImplementedError
+
+    def items_since(self, namespace: str, session_id: str, index: int) -> List[Any]:
+        """Events of the log under namespace from index on"""
+        raise NotImplementedError
+
+    def release(self, session_id: str):
+        """Drop every value of a session"""
+        raise NotImplementedError
+
+    def session_ids(self, namespace: str) -> List[str]:
+        raise NotImplementedError
+
+    def sweep(self) -> int:
+        """Remove sessions idle for longer than the TTL; returns how many"""
+        raise NotImplementedError
+
+    def _namespace_stats(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def start_sweeper(self, interval_seconds: float):
+        """Sweep every interval_seconds on a daemon thread"""
+        if self._sweeper is not None or interval_seconds <= 0:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval_seconds)
+                try:
+                    self.sweep()
+                except Exception as e:
+                    print(f"Session sweep failed: {e}")
+
+        self._sweeper = threading.Thread(target=run, name="session_sweeper", daemon=True)
+        self._sweeper.start()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Sessions held, items per namespace, expirations/evictions and process RSS"""
+        stats = {"backend": self.backend, **self._namespace_stats()}
+        with self._stats_lock:
+            stats.update({
+                "max_sessions": self.max_sessions,
+                "ttl_seconds": self.ttl_seconds,
+                "expired": self.expired,
+                "evicted": self.evicted,
+                "process_rss_bytes": _process_rss_bytes()
+            })
+        return stats
+
+class InMemorySessionStore(SessionStore):
+    """Process-local store; values are kept by reference"""
+
+    backend = "memory"
+
+    def __init__(self, ttl_seconds: float, max_sessions: int):
+        super().__init__(ttl_seconds, max_sessions)
+        self._lock = threading.Lock()
+        # session id -> (last access, {namespace: value}), least recently used first
+        self._sessions = OrderedDict()
+
+    def _touch(self, session_id: str, now: float, expired: List[str]) -> Optional[Dict[str, Any]]:
+        # Caller holds the lock; an expired session is dropped and appended to expired
+        entry = self._sessions.pop(session_id, None)
+        if entry is None:
+            return None
+        last_access, values = entry
+        if now - last_access > self.ttl_seconds:
+            expired.append(session_id)
+            return None
+        self._sessions[session_id] = (now, values)
+        return values
+
+    def _values(self, session_id: str, expired: List[str], evicted: List[str]) -> Dict[str, Any]:
+        # Caller holds the lock; creates the session, evicting the least recently used
+        now = time.monotonic()
+        values = self._touch(session_id, now, expired)
+        if values is None:
+            values = {}
+            self._sessions[session_id] = (now, values)
+            while len(self._sessions) > self.max_sessions:
+                evicted.append(self._sessions.popitem(last=False)[0])
+        return values
+
+    def get(self, namespace: str, session_id: str, default: Any = None) -> Any:
+        expired = []
+        with self._lock:
+            values = self._touch(session_id, time.monotonic(), expired)
+        self._notify(expired)
+        return default if values is None else values.get(namespace, default)
+
+    def setdefault(self, namespace: str, session_id: str, default: Any = None, replace: bool = False) -> Any:
+        expired, evicted = [], []
+        with self._lock:
+            values = self._values(session_id, expired, evicted)
+            if replace or namespace not in values:
+                values[namespace] = default
+            value = values[namespace]
+        self._notify(expired, evicted)
+        return value
+
+    def delete(self, namespace: str, session_id: str) -> bool:
+        expired = []
+        with self._lock:
+            values = self._touch(session_id, time.monotonic(), expired)
+            deleted = values is not None and values.pop(namespace, _MISSING) is not _MISSING
+        self._notify(expired)
+        return deleted
+
+    def append(self, namespace: str, session_id: str, item: Any) -> int:
+        expired, evicted = [], []
+        with self._lock:
+            events = self._values(session_id, expired, evicted).setdefault(namespace, [])
+            events.append(item)
+            index = len(events) - 1
+        self._notify(expired, evicted)
+        return index
+
+    def items_since(self, namespace: str, session_id: str, index: int) -> List[Any]:
+        return self.get(namespace, session_id, [])[index:]
+
+    def release(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def session_ids(self, namespace: str) -> List[str]:
+        now = time.monotonic()
+        with self._lock:
+            return [session_id for session_id, (last_access, values) in self._sessions.items()
+                    if namespace in values and now - last_access <= self.ttl_seconds]
+
+    def sweep(self) -> int:
+        expired = []
+        with self._lock:
+            cutoff = time.monotonic() - self.ttl_seconds
+            # Least recently used first, so stop at the first live session
+            for session_id, (last_access, _) in self._sessions.items():
+                if last_access >= cutoff:
+                    break
+                expired.append(session_id)
+            for session_id in expired:
+                del self._sessions[session_id]
+        self._notify(expired)
+        return len(expired)
+
+    def _namespace_stats(self) -> Dict[str, Any]:
+        # Lists and dicts count their items
+        namespaces = {}
+        with self._lock:
+            for _, values in self._sessions.values():
+                for name, value in values.items():
+                    counts = namespaces.setdefault(name, {"sessions": 0, "items": 0})
+                    counts["sessions"] += 1
+                    counts["items"] += len(value) if isinstance(value, (list, dict)) else 1
+            return {"sessions": len(self._sessions), "namespaces": namespaces}
+
+def _json_default(value: Any) -> Any:
+    # numpy scalars/arrays from the ML predictions, then anything else as text
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return str(value)
+
+class SQLiteSessionStore(SessionStore):
+    """Store in a WAL-mode SQLite file shared by every worker process on the host.
+
+    Values and events are stored as JSON. Last-access times are wall-clock so all
+    processes agree on expiry, and are only rewritten once per TOUCH_INTERVAL_SECONDS
+    to keep polling readers from turning every read into a write.
+    """
+
+    backend = "sqlite"
+    TOUCH_INTERVAL_SECONDS = 1.0
+
+    def __init__(self, db_path: str, ttl_seconds: float, max_sessions: int):
+        super().__init__(ttl_seconds, max_sessions)
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_sessions_last_access ON sessions (last_access);
+            CREATE TABLE IF NOT EXISTS session_values (
+                session_id TEXT NOT NULL,
+                namespace TEXT NOT NULL,
+                value TEXT NOT NULL,
+                PRIMARY KEY (session_id, namespace)
+            );
+            CREATE TABLE IF NOT EXISTS session_events (
+                session_id TEXT NOT NULL,
+                namespace TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                value TEXT NOT NULL,
+                PRIMARY KEY (session_id, namespace, seq)
+            );
+        """)
+        self.conn.commit()
+
+    def _drop(self, session_ids: List[str]):
+        # Caller holds the lock and commits
+        for table in ("sessions", "session_values", "session_events"):
+            self.conn.executemany(f"DELETE FROM {table} WHERE session_id = ?",
+                                  [(session_id,) for session_id in session_ids])
+
+    def _touch(self, session_id: str, now: float, expired: List[str]) -> bool:
+        # Caller holds the lock and commits; False if the session is missing or expired
+        row = self.conn.execute(
+            "SELECT last_access FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return False
+        if now - row[0] > self.ttl_seconds:
+            self._drop([session_id])
+            expired.append(session_id)
+            return False
+        if now - row[0] > self.TOUCH_INTERVAL_SECONDS:
+            self.conn.execute("UPDATE sessions SET last_access = ? WHERE session_id = ?", (now, session_id))
+        return True
+
+    def _ensure(self, session_id: str, expired: List[str], evicted: List[str]):
+        # Caller holds the lock and commits; creates the session, evicting the least recently used
+        now = time.time()
+        if self._touch(session_id, now, expired):
+            return
+        # Another process may create the same session between the lookup and this insert
+        self.conn.execute(
+            "INSERT INTO sessions (session_id, last_access) VALUES (?, ?) "
+            "ON CONFLICT(session_id) DO UPDATE SET last_access = excluded.last_access",
+            (session_id, now)
+        )
+        overflow = self.conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0] - self.max_sessions
+        if overflow > 0:
+            oldest = [row[0] for row in self.conn.execute(
+                "SELECT session_id FROM sessions WHERE session_id != ? ORDER BY last_access ASC LIMIT ?",
+                (session_id, overflow)
+            )]
+            self._drop(oldest)
+            evicted.extend(oldest)
+
+    def get(self, namespace: str, session_id: str, default: Any = None) -> Any:
+        expired = []
+        with self._lock:
+            row = None
+            if self._touch(session_id, time.time(), expired):
+                row = self.conn.execute(
+                    "SELECT value FROM session_values WHERE session_id = ? AND namespace = ?",
+                    (session_id, namespace)
+                ).fetchone()
+            self.conn.commit()
+        self._notify(expired)
+        return default if row is None else json.loads(row[0])
+
+    def setdefault(self, namespace: str, session_id: str, default: Any = None, replace: bool = False) -> Any:
+        expired, evicted = [], []
+        encoded = json.dumps(default, default=_json_default)
+        with self._lock:
+            self._ensure(session_id, expired, evicted)
+            self.conn.execute(
+                f"INSERT OR {'REPLACE' if replace else 'IGNORE'} INTO session_values "
+                "(session_id, namespace, value) VALUES (?, ?, ?)",
+                (session_id, namespace, encoded)
+            )
+            if not replace:
+                encoded = self.conn.execute(
+                    "SELECT value FROM session_values WHERE session_id = ? AND namespace = ?",
+                    (session_id, namespace)
+                ).fetchone()[0]
+            self.conn.commit()
+        self._notify(expired, evicted)
+        return json.loads(encoded)
+
+    def delete(self, namespace: str, session_id: str) -> bool:
+        expired = []
+        with self._lock:
+            deleted = False
+            if self._touch(session_id, time.time(), expired):
+                deleted = self.conn.execute(
+                    "DELETE FROM session_values WHERE session_id = ? AND namespace = ?",
+                    (session_id, namespace)
+                ).rowcount > 0
+            self.conn.commit()
+        self._notify(expired)
+        return deleted
+
+    def append(self, namespace: str, session_id: str, item: Any) -> int:
+        expired, evicted = [], []
+        encoded = json.dumps(item, default=_json_default)
+        with self._lock:
+            self._ensure(session_id, expired, evicted)
+            # One statement, so concurrent writers in other processes cannot take the same seq
+            index = self.conn.execute(
+                "INSERT INTO session_events (session_id, namespace, seq, value) "
+                "SELECT ?, ?, COALESCE(MAX(seq) + 1, 0), ? FROM session_events "
+                "WHERE session_id = ? AND namespace = ? RETURNING seq",
+                (session_id, namespace, encoded, session_id, namespace)
+            ).fetchone()[0]
+            self.conn.commit()
+        self._notify(expired, evicted)
+        return index
+
+    def items_since(self, namespace: str, session_id: str, index: int) -> List[Any]:
+        expired = []
+        with self._lock:
+            rows = []
+            if self._touch(session_id, time.time(), expired):
+                rows = self.conn.execute(
+                    "SELECT value FROM session_events WHERE session_id = ? AND namespace = ? AND seq >= ? "
+                    "ORDER BY seq",
+                    (session_id, namespace, index)
+                ).fetchall()
+            self.conn.commit()
+        self._notify(expired)
+        return [json.loads(row[0]) for row in rows]
+
+    def release(self, session_id: str):
+        with self._lock:
+            self._drop([session_id])
+            self.conn.commit()
+
+    def session_ids(self, namespace: str) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self.conn.execute(
+                "SELECT s.session_id FROM sessions s WHERE s.last_access >= ? AND ("
+                "EXISTS (SELECT 1 FROM session_values v WHERE v.session_id = s.session_id AND v.namespace = ?) OR "
+                "EXISTS (SELECT 1 FROM session_events e WHERE e.session_id = s.session_id AND e.namespace = ?)) "
+                "ORDER BY s.last_access",
+                (time.time() - self.ttl_seconds, namespace, namespace)
+            )]
+
+    def sweep(self) -> int:
+        with self._lock:
+            expired = [row[0] for row in self.conn.execute(
+                "SELECT session_id FROM sessions WHERE last_access < ?", (time.time() - self.ttl_seconds,)
+            )]
+            self._drop(expired)
+            self.conn.commit()
+        self._notify(expired)
+        return len(expired)
+
+    def _namespace_stats(self) -> Dict[str, Any]:
+        # Items are values plus events; bytes is their JSON size
+        namespaces = {}
+        with self._lock:
+            sessions = self.conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+            for table in ("session_values", "session_events"):
+                for name, session_count, items, size in self.conn.execute(
+                    f"SELECT namespace, COUNT(DISTINCT session_id), COUNT(*), SUM(LENGTH(value)) "
+                    f"FROM {table} GROUP BY namespace"
+                ):
+                    counts = namespaces.setdefault(name, {"sessions": 0, "items": 0, "bytes": 0})
+                    counts["sessions"] += session_count
+                    counts["items"] += items
+                    counts["bytes"] += size or 0
+        try:
+            db_bytes = os.path.getsize(self.db_path)
+        except OSError:
+            db_bytes = None
+        return {"sessions": sessions, "namespaces": namespaces, "db_path": self.db_path, "db_bytes": db_bytes}
+
+def _process_rss_bytes() -> Optional[int]:
+    """Current resident set size on Linux, None elsewhere"""
+    try:
+        with open("/proc/self/statm") as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+def create_session_store(backend: str = None) -> SessionStore:
+    """Build the store selected by SESSION_STORE_BACKEND ("memory" or "sqlite")"""
+    backend = (backend or DiagnosticConfig.SESSION_STORE_BACKEND).lower()
+    ttl_seconds = DiagnosticConfig.SESSION_TTL_SECONDS
+    max_sessions = DiagnosticConfig.SESSION_MAX_SESSIONS
+
+    if backend == "memory":
+        return InMemorySessionStore(ttl_seconds, max_sessions)
+    if backend == "sqlite":
+        try:
+            return SQLiteSessionStore(DiagnosticConfig.SESSION_STORE_PATH, ttl_seconds, max_sessions)
+        except Exception as e:
+            print(f"Warning: Could not open session store at {DiagnosticConfig.SESSION_STORE_PATH}: {e}")
+            return InMemorySessionStore(ttl_seconds, max_sessions)
+    raise ValueError(f"Unknown SESSION_STORE_BACKEND {backend!r}; expected 'memory' or 'sqlite'")
+
+_session_store = None
+_session_store_lock = threading.Lock()
+
+def get_session_store() -> SessionStore:
+    """The store shared by the API layer and graph of this process; starts its sweeper"""
+    global _session_store
+    with _session_store_lock:
+        if _session_store is None:
+            _session_store = create_session_store()
+            _session_store.start_sweeper(DiagnosticConfig.SESSION_SWEEP_INTERVAL_SECONDS)
+        return _session_store
@@ -0,0 +1,163 @@
+"""Single-flight deduplication of identical diagnostic session starts"""
+from typing import Dict, Any, Callable, List, Optional, Tuple
+from concurrent.futures import Future
+import asyncio
+import copy
+import hashlib
+import json
+import threading
+import time
+
+def session_request_key(owner_id: Any,
+                        symptoms: List[str],
+                        patient_info: Optional[Dict[str, Any]],
+                        max_questions: int,
+                        allow_fast_path: bool,
+                        job: bool = False) -> str:
+    """Canonical key: same user, same symptom set (any order/spelling of separators), same patient info.
+    
+    Job-mode starts answer with a different contract (202 and a job record), so they
+    only share with other job-mode starts.
+    """
+    canonical = {
+        "owner": owner_id,
+        "symptoms": sorted({" ".join(str(s).replace("_", " ").split()).lower() for s in symptoms}),
+        "patient_info": patient_info or {},
+        "max_questions": max_questions,
+        "allow_fast_path": bool(allow_fast_path),
+        "job": bool(job)
+    }
+    return hashlib.sha256(json.dumps(canonical, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+class _Flight:
+    __slots__ = ("future", "session_id", "created_at", "claimed", "started", "finished_at")
+
+    def __init__(self, session_id: Optional[str] = None, claimed: bool = False):
+        self.future = Future()
+        self.session_id = session_id
+        self.created_at = time.monotonic()
+        self.claimed = claimed
+        self.started = False
+        self.finished_at = None
+
+class SingleFlight:
+    """Lets identical concurrent calls share one execution.
+
+    The first caller for a key runs the work; callers arriving while it runs, or
+    within window_seconds after it finished, get a copy of the same result.
+    Failures are shared with the waiting callers but not remembered, so a retry
+    after an error runs again. A concurrent.futures.Future is used because the
+    callers may each be on a different event loop (one per async_to_sync call).
+    
+    Callers that set up per-session state before the work starts claim() the key
+    first, so only the leader does that setup and followers reuse its session.
+    """
+
+    # A claim whose run never started (the leader failed before it) stops blocking the key
+    claim_timeout_seconds = 60
+
+    def __init__(self, window_seconds: float):
+        self.window_seconds = window_seconds
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.executions = 0
+        self.shared = 0
+
+    def _expire(self, now: float):
+        """Drop results older than the window and stale claims; caller holds the lock"""
+        expired = [key for key, flight in self._flights.items()
+                   if (flight.finished_at is not None and now - flight.finished_at > self.window_seconds)
+                   or (not flight.started and now - flight.created_at > self.claim_timeout_seconds)]
+        for key in expired:
+            del self._flights[key]
+
+    def claim(self, key: str, session_id: str) -> Tuple[str, bool]:
+        """Reserve the key for a run under session_id.
+        
+        Returns (session_id, True) when the caller leads, or the leading session and
+        False when an identical start is already claimed, running or recently finished.
+        """
+        with self._lock:
+            self._expire(time.monotonic())
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.shared += 1
+                return flight.session_id, False
+            self._flights[key] = _Flight(session_id, claimed=True)
+            self.executions += 1
+            return session_id, True
+
+    def mark_started(self, key: str):
+        """Keep a claim whose work runs elsewhere (a background job) from timing out"""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.started = True
+
+    def settle(self, key: str, result: Optional[Dict[str, Any]] = None, error: Optional[BaseException] = None):
+        """Finish a claimed flight whose work did not go through run()"""
+        with self._lock:
+            flight = self._flights.get(key)
+        if flight is None or flight.future.done():
+            return
+        if error is not None:
+            self._fail(key, flight, error)
+        else:
+            with self._lock:
+                # A later run() for the key shares this result instead of running again
+                flight.started = True
+            self._finish(flight, result)
+
+    def _fail(self, key: str, flight: _Flight, error: BaseException):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.future.set_exception(error)
+
+    def _finish(self, flight: _Flight, result: Dict[str, Any]):
+        with self._lock:
+            flight.finished_at = time.monotonic()
+        flight.future.set_result(copy.deepcopy(result))
+
+    async def run(self, key: str, coroutine_fn: Callable, *args) -> Dict[str, Any]:
+        with self._lock:
+            self._expire(time.monotonic())
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                self.executions += 1
+            elif not flight.claimed:
+                # Claimed flights counted their followers in claim()
+                self.shared += 1
+            # Whichever claimant gets here first runs; the inputs are identical by key
+            leader = not flight.started
+            flight.started = True
+
+        if not leader:
+            # shield: a follower that gives up must not cancel the shared future
+            result = await asyncio.shield(asyncio.wrap_future(flight.future))
+            result = copy.deepcopy(result)
+            result["deduplicated"] = True
+            return result
+
+        try:
+            result = await coroutine_fn(*args)
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                # The leader's client went away; waiting callers must not look cancelled themselves
+                self._fail(key, flight, RuntimeError("Shared diagnostic run was cancelled"))
+            else:
+                self._fail(key, flight, e)
+            raise
+        self._finish(flight, result)
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            in_flight = sum(1 for flight in self._flights.values() if flight.finished_at is None)
+            return {
+                "executions": self.executions,
+                "shared": self.shared,
+                "in_flight": in_flight,
+                "window_seconds": self.window_seconds
+            }
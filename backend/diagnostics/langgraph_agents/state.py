@@ -1,10 +1,24 @@
-from typing import List, Dict, Any, Optional, Annotated
+from typing import List, Dict, Any, Optional, Annotated, Union
 from typing_extensions import TypedDict
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, RootModel
 from langgraph.graph.message import add_messages
 from langchain_core.messages import BaseMessage
 import operator
 
+def merge_dicts(left: Dict[str, Any], right: Dict[str, Any]) -> Dict[str, Any]:
+    """Reducer that merges dictionary updates instead of overwriting them"""
+    return {**(left or {}), **(right or {})}
+
+def merge_branch_results(left: Dict[str, Any], right: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Reducer for outputs of parallel branches; None clears them once they are merged"""
+    if right is None:
+        return {}
+    return merge_dicts(left, right)
+
+def retrieval_memo_key(disease: str, source: str) -> str:
+    """Key of the retrieval memo for a (disease, knowledge source) pair"""
+    return f"{disease}::{source}"
+
 class DiagnosticState(TypedDict):
     """Main state schema for the diagnostic workflow"""
     # Input data
@@ -29,6 +43,8 @@ class DiagnosticState(TypedDict):
     max_questions: int
     questions_asked: int
     needs_more_questions: bool
+    # "standard" or "compact" processing of the answers (see DiagnosticConfig.PIPELINE_MODE)
+    pipeline_mode: str
     
     # Reasoning and transparency
     reasoning_steps: List[str]
@@ -40,6 +56,17 @@ class DiagnosticState(TypedDict):
     # Track previously asked questions
     asked_questions: List[Dict[str, Any]]
     
+    # Session-scoped retrieval memo: retrieval_memo_key(disease, source) -> document texts.
+    # Checkpointed with the state so resumed sessions reuse earlier lookups.
+    retrieval_memo: Annotated[Dict[str, List[str]], merge_dicts]
+    
+    # Nodes that ran out of their time budget in this request and served a fallback
+    degraded_nodes: List[str]
+    
+    # Updates produced by parallel branches (branch name -> changed keys), folded
+    # back into the main state by the reconciliation node
+    branch_results: Annotated[Dict[str, Any], merge_branch_results]
+    
     # Metadata
     session_id: str
     user_id: Optional[str]
@@ -55,20 +82,48 @@ class QuestionSchema(BaseModel):
     priority: int = 1
     required: bool = True
 
-class PredictionSchema(BaseModel):
-    """Schema for disease predictions"""
-    disease_name: str
+class IntegrationSchema(BaseModel):
+    """Schema for the response integration result"""
+    updated_symptoms: List[str]
+    medical_reasoning: str = ""
+
+class PredictionScoresSchema(BaseModel):
+    """Schema for one disease's entry in a refinement answer, which is keyed by disease name"""
     probability: float = Field(ge=0.0, le=1.0)
     confidence: str = Field(pattern="^(High|Medium|Low)$")
+
+class PredictionSchema(PredictionScoresSchema):
+    """Schema for disease predictions"""
+    disease_name: str
     description: str
     precautions: List[str]
     symptom_match_score: float = Field(ge=0.0, le=100.0)
     reasoning: str
 
-class ValidationSchema(BaseModel):
-    """Schema for validation results"""
-    disease_name: str
+class ValidationScoresSchema(BaseModel):
+    """Schema for one disease's entry in a validation answer, which is keyed by disease name"""
     confidence_adjustment: float = Field(ge=-0.5, le=0.5)
     reasoning: str
     symptom_match_score: float = Field(ge=0.0, le=100.0)
     validation_status: str
+
+class ValidationSchema(ValidationScoresSchema):
+    """Schema for validation results"""
+    disease_name: str
+
+def per_disease_schema(value_schema: type) -> type:
+    """Schema for an answer mapping disease names to entries of value_schema"""
+    return RootModel[Dict[str, value_schema]]
+
+def single_disease_schema(value_schema: type) -> type:
+    """Schema for a per-disease fan-out answer: {"<disease>": entry} or the bare entry"""
+    return RootModel[Union[Dict[str, value_schema], value_schema]]
+
+QuestionListSchema = RootModel[List[QuestionSchema]]
+
+class CompactAssessmentSchema(BaseModel):
+    """Schema for the compact pipeline's single integration, refinement and validation call"""
+    updated_symptoms: List[str]
+    medical_reasoning: str
+    predictions: List[PredictionSchema]
+    validations: List[ValidationSchema]
@@ -0,0 +1,220 @@
+"""Blocking work yielded by the agent nodes, and the sync/async drivers that run it.
+
+Node logic is written once as a generator that yields an effect (an LLM call or a
+blocking lookup) and receives its result. run_steps executes effects inline for the
+sync graph; arun_steps awaits them for the async graph, so one event loop can carry
+many sessions.
+"""
+from typing import Any, Dict, Generator, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.runnables import RunnableLambda
+from langgraph.config import get_config
+from .config import DiagnosticConfig
+from .rate_limiter import get_llm_limiter
+from .circuit_breaker import CircuitOpen, get_llm_breaker
+from .llm_cache import is_cached, is_cached_response
+from .prompt_builder import text_tokens
+from .token_usage import get_token_usage
+import asyncio
+import contextvars
+import time
+
+class NodeTimeout(Exception):
+    """A node ran out of its time budget or of the request deadline"""
+
+def request_deadline(seconds: Optional[float] = None) -> float:
+    """Wall-clock deadline to put in the graph config as configurable["deadline"]"""
+    return time.time() + (DiagnosticConfig.REQUEST_DEADLINE_SECONDS if seconds is None else seconds)
+
+def node_time_budget(node_name: str) -> Optional[float]:
+    """Seconds node_name may still use: its own budget, capped by the request deadline"""
+    budget = DiagnosticConfig.node_time_budget(node_name)
+    try:
+        deadline = get_config().get("configurable", {}).get("deadline")
+    except RuntimeError:
+        # Called outside a graph run
+        deadline = None
+    if deadline is not None:
+        remaining = deadline - time.time()
+        budget = remaining if budget is None else min(budget, remaining)
+    return budget
+
+# Runs effects under a timeout; a call that overruns is abandoned and finishes here unobserved
+_effect_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="node_effect")
+
+def _record_usage(messages, response):
+    """Attribute a call's tokens to the graph node and session it ran for"""
+    try:
+        config = get_config()
+    except RuntimeError:
+        return
+    metadata = config.get("metadata", {})
+    node = metadata.get("langgraph_node")
+    if node is None:
+        return
+    session_id = metadata.get("session_id") or config.get("configurable", {}).get("thread_id")
+    # Structured-output calls (include_raw=True) return the message under "raw"
+    message = response.get("raw") if isinstance(response, dict) else response
+    if is_cached_response(message):
+        get_token_usage().record(session_id, node, 0, 0, cached=True)
+        return
+    usage = getattr(message, "usage_metadata", None) or {}
+    input_tokens = usage.get("input_tokens")
+    output_tokens = usage.get("output_tokens")
+    estimated = input_tokens is None or output_tokens is None
+    if input_tokens is None:
+        input_tokens = sum(text_tokens(str(getattr(m, "content", m))) for m in messages)
+    if output_tokens is None:
+        output_tokens = text_tokens(str(getattr(message, "content", "") or ""))
+    get_token_usage().record(session_id, node, input_tokens, output_tokens, estimated)
+
+def _invoke_llm(llm, messages, config: Optional[Dict[str, Any]], deadline_at: Optional[float]):
+    # Cache hits are served without taking a limiter slot or counting toward the circuit
+    if is_cached(llm, messages):
+        response = llm.invoke(messages, config=config)
+    else:
+        response = get_llm_limiter().invoke(get_llm_breaker().guarded(llm), messages, config=config,
+                                            deadline_at=deadline_at)
+    _record_usage(messages, response)
+    return response
+
+async def _ainvoke_llm(llm, messages, config: Optional[Dict[str, Any]], deadline_at: Optional[float]):
+    if await asyncio.to_thread(is_cached, llm, messages):
+        response = await llm.ainvoke(messages, config=config)
+    else:
+        response = await get_llm_limiter().ainvoke(get_llm_breaker().guarded(llm), messages, config=config,
+                                                   deadline_at=deadline_at)
+    _record_usage(messages, response)
+    return response
+
+class LLMInvoke:
+    """A single chat model call, throttled by the process-wide LLM limiter and circuit breaker.
+
+    Effects take the monotonic deadline of the node running them, if any; LLM calls
+    turn it into a provider request timeout.
+    """
+
+    def __init__(self, llm, messages):
+        self.llm = llm
+        self.messages = messages
+
+    def run(self, deadline_at: Optional[float] = None):
+        return _invoke_llm(self.llm, self.messages, None, deadline_at)
+
+    async def arun(self, deadline_at: Optional[float] = None):
+        return await _ainvoke_llm(self.llm, self.messages, None, deadline_at)
+
+class LLMBatch:
+    """Several chat model calls; failed items come back as exceptions.
+
+    Each item passes through the LLM limiter on its own, so a batch cannot
+    exceed the process-wide concurrency or rate limits.
+    """
+
+    def __init__(self, llm, inputs: List[Any], config: Optional[Dict[str, Any]] = None):
+        self.llm = llm
+        self.inputs = inputs
+        self.config = config
+
+    def _runnable(self, deadline_at: Optional[float]) -> RunnableLambda:
+        def invoke(messages, config):
+            return _invoke_llm(self.llm, messages, config, deadline_at)
+
+        async def ainvoke(messages, config):
+            return await _ainvoke_llm(self.llm, messages, config, deadline_at)
+
+        return RunnableLambda(invoke, afunc=ainvoke, name="llm_batch_item")
+
+    def run(self, deadline_at: Optional[float] = None):
+        return self._runnable(deadline_at).batch(self.inputs, config=self.config, return_exceptions=True)
+
+    async def arun(self, deadline_at: Optional[float] = None):
+        return await self._runnable(deadline_at).abatch(self.inputs, config=self.config, return_exceptions=True)
+
+class BlockingCall:
+    """Any other blocking call, e.g. a vector store lookup; moved off the event loop when async"""
+
+    def __init__(self, fn, *args, **kwargs):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+
+    def run(self, deadline_at: Optional[float] = None):
+        return self.fn(*self.args, **self.kwargs)
+
+    async def arun(self, deadline_at: Optional[float] = None):
+        return await asyncio.to_thread(self.fn, *self.args, **self.kwargs)
+
+def _run_effect(effect, deadline_at: Optional[float]):
+    # Every node effect feeds an LLM prompt, so none is worth running while the circuit is open
+    get_llm_breaker().check()
+    if deadline_at is None:
+        return effect.run()
+    remaining = deadline_at - time.monotonic()
+    if remaining <= 0:
+        raise NodeTimeout("time budget exhausted")
+    # Copy the context so graph callbacks (token streaming, tracing) still see this run
+    future = _effect_executor.submit(contextvars.copy_context().run, effect.run, deadline_at)
+    try:
+        return future.result(timeout=remaining)
+    except Exception:
+        if time.monotonic() < deadline_at:
+            # The call's own error, e.g. a timeout of the HTTP client
+            raise
+        # Including the request timeout and limiter give-up derived from the deadline
+        raise NodeTimeout("time budget exceeded") from None
+
+async def _arun_effect(effect, deadline_at: Optional[float]):
+    get_llm_breaker().check()
+    if deadline_at is None:
+        return await effect.arun()
+    remaining = deadline_at - time.monotonic()
+    if remaining <= 0:
+        raise NodeTimeout("time budget exhausted")
+    try:
+        return await asyncio.wait_for(effect.arun(deadline_at), remaining)
+    except Exception:
+        if time.monotonic() < deadline_at:
+            raise
+        raise NodeTimeout("time budget exceeded") from None
+
+def run_steps(steps: Generator, timeout: Optional[float] = None) -> Any:
+    """Drive a node generator synchronously and return its result.
+    
+    With a timeout, raises NodeTimeout once the effects have used it up; raises
+    CircuitOpen when the LLM circuit is open. Neither is thrown into the generator,
+    so the node's own error handling cannot swallow them.
+    """
+    deadline_at = None if timeout is None else time.monotonic() + timeout
+    try:
+        effect = next(steps)
+        while True:
+            try:
+                result = _run_effect(effect, deadline_at)
+            except (NodeTimeout, CircuitOpen):
+                steps.close()
+                raise
+            except Exception as e:
+                effect = steps.throw(e)
+            else:
+                effect = steps.send(result)
+    except StopIteration as done:
+        return done.value
+
+async def arun_steps(steps: Generator, timeout: Optional[float] = None) -> Any:
+    """Drive a node generator on the event loop and return its result; timeout as in run_steps"""
+    deadline_at = None if timeout is None else time.monotonic() + timeout
+    try:
+        effect = next(steps)
+        while True:
+            try:
+                result = await _arun_effect(effect, deadline_at)
+            except (NodeTimeout, CircuitOpen):
+                steps.close()
+                raise
+            except Exception as e:
+                effect = steps.throw(e)
+            else:
+                effect = steps.send(result)
+    except StopIteration as done:
+        return done.value
@@ -0,0 +1,203 @@
+"""JSON answers from the LLM: provider JSON mode, local repair, then a bounded re-ask"""
+from typing import Dict, Any, List, Optional, Tuple
+from langchain_core.prompts import ChatPromptTemplate
+from pydantic import ValidationError
+from .config import DiagnosticConfig
+from .steps import LLMInvoke, BlockingCall
+from .llm_cache import evict_cached
+import ast
+import json
+import threading
+
+class StructuredOutputError(ValueError):
+    """An LLM answer that is not (repairably) the expected JSON"""
+
+def json_mode(llm):
+    """The chat model constrained to emit JSON, when STRUCTURED_OUTPUT_MODE allows it"""
+    if DiagnosticConfig.STRUCTURED_OUTPUT_MODE != "json_mode":
+        return llm
+    return llm.bind(response_mime_type="application/json")
+
+def _strip_fences(text: str) -> str:
+    if "```" not in text:
+        return text
+    start = text.find("```") + 3
+    if text[start:start + 4].lower() == "json":
+        start += 4
+    end = text.find("```", start)
+    return text[start:end] if end != -1 else text[start:]
+
+def _drop_trailing_comma(out: List[str]):
+    while out and out[-1].isspace():
+        out.pop()
+    if out and out[-1] == ",":
+        out.pop()
+
+def _extract_json(text: str, opener: str) -> str:
+    """One pass over text from its first opener: keep the first top-level value, drop
+    trailing commas and stray closers, and escape raw newlines in strings.
+
+    Raises StructuredOutputError when the value is cut off (an unterminated string
+    or an unclosed bracket). Closing it would silently drop whatever was lost, e.g.
+    the last diseases of a predictions dict that hit the output token limit.
+    """
+    start = text.find(opener)
+    if start == -1:
+        raise StructuredOutputError(f"no JSON {'object' if opener == '{' else 'array'} in the answer")
+    out = []
+    stack = []
+    in_string = False
+    escaped = False
+    for ch in text[start:]:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            elif ch == "\n":
+                ch = "\\n"
+            out.append(ch)
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]":
+            _drop_trailing_comma(out)
+            if not stack or stack[-1] != ch:
+                continue
+            stack.pop()
+            if not stack:
+                out.append(ch)
+                break
+        out.append(ch)
+    if in_string:
+        raise StructuredOutputError("answer is truncated inside a string")
+    if stack:
+        raise StructuredOutputError(f"answer is truncated with {len(stack)} unclosed bracket(s)")
+    return "".join(out)
+
+def _loads(candidate: str) -> Any:
+    try:
+        return json.loads(candidate)
+    except json.JSONDecodeError:
+        # Python-style literals: single quotes, True/False/None
+        return ast.literal_eval(candidate)
+
+def repair_json(text: str, expect: type = dict) -> Tuple[Any, bool]:
+    """Parse the expected JSON value (dict or list) out of an LLM answer.
+
+    Returns (value, repaired); repaired is False when the answer parsed as is
+    (after removing a code fence). Raises StructuredOutputError, also for an
+    answer that was cut off, so that it gets re-asked rather than half-used.
+    """
+    text = _strip_fences(text or "").strip()
+    try:
+        value = json.loads(text)
+        if isinstance(value, expect):
+            return value, False
+    except json.JSONDecodeError:
+        pass
+
+    candidate = _extract_json(text, "{" if expect is dict else "[")
+    try:
+        value = _loads(candidate)
+    except (ValueError, SyntaxError, MemoryError, RecursionError) as e:
+        raise StructuredOutputError(f"unrepairable JSON: {e}") from None
+    if not isinstance(value, expect):
+        raise StructuredOutputError(f"expected a JSON {expect.__name__}, got {type(value).__name__}")
+    return value, True
+
+def _validate(value: Any, schema: Optional[type]) -> Any:
+    if schema is None:
+        return value
+    try:
+        schema.model_validate(value)
+    except ValidationError as e:
+        raise StructuredOutputError(f"does not match {schema.__name__}: {e.error_count()} errors") from None
+    return value
+
+_REASK_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """Your previous answer could not be parsed ({error}).
+    Return ONLY the complete, corrected JSON {kind} with the same content, nothing else."""),
+    ("human", "{answer}")
+])
+
+def parse_structured(node_name: str, llm, answer: str, expect: type = dict,
+                     schema: Optional[type] = None, messages: Optional[List[Any]] = None):
+    """Step generator: the parsed answer, re-asking at most STRUCTURED_OUTPUT_MAX_REASKS times.
+
+    A re-ask only sends the broken answer back with the parse error, so it costs
+    a fraction of the original call. Raises StructuredOutputError when all fail.
+    messages is the prompt json_mode(llm) answered; an answer that does not parse
+    is evicted from the LLM cache so identical sessions do not replay it.
+    """
+    tracker = get_parse_tracker()
+    try:
+        value, repaired = repair_json(answer, expect)
+        value = _validate(value, schema)
+        tracker.record(node_name, "repaired" if repaired else "clean")
+        return value
+    except StructuredOutputError as e:
+        error = e
+    if messages is not None:
+        yield BlockingCall(evict_cached, json_mode(llm), messages)
+
+    for _ in range(DiagnosticConfig.STRUCTURED_OUTPUT_MAX_REASKS):
+        print(f"   {node_name}: re-asking for valid JSON ({error})")
+        reask_messages = _REASK_PROMPT.format_messages(
+            error=str(error), kind="object" if expect is dict else "array", answer=answer
+        )
+        try:
+            response = yield LLMInvoke(json_mode(llm), reask_messages)
+        except Exception as e:
+            error = StructuredOutputError(f"re-ask failed: {e}")
+            break
+        answer = response.content
+        try:
+            value = _validate(repair_json(answer, expect)[0], schema)
+            tracker.record(node_name, "reasked")
+            return value
+        except StructuredOutputError as e:
+            error = e
+            yield BlockingCall(evict_cached, json_mode(llm), reask_messages)
+
+    tracker.record(node_name, "failed")
+    raise error
+
+class ParseTracker:
+    """Outcome counts of structured-output parsing per node"""
+
+    OUTCOMES = ("clean", "repaired", "reasked", "failed")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._nodes = {}
+
+    def record(self, node_name: str, outcome: str):
+        with self._lock:
+            counts = self._nodes.setdefault(node_name, dict.fromkeys(self.OUTCOMES, 0))
+            counts[outcome] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Counts and failure/repair rates per node"""
+        with self._lock:
+            nodes = {node: dict(counts) for node, counts in self._nodes.items()}
+        for counts in nodes.values():
+            total = sum(counts[outcome] for outcome in self.OUTCOMES)
+            counts["parses"] = total
+            counts["failure_rate"] = round(counts["failed"] / total, 3) if total else 0.0
+            counts["repair_rate"] = round((counts["repaired"] + counts["reasked"]) / total, 3) if total else 0.0
+        return {
+            "mode": DiagnosticConfig.STRUCTURED_OUTPUT_MODE,
+            "max_reasks": DiagnosticConfig.STRUCTURED_OUTPUT_MAX_REASKS,
+            "nodes": nodes
+        }
+
+_parse_tracker = ParseTracker()
+
+def get_parse_tracker() -> ParseTracker:
+    """The tracker shared by every node in this process"""
+    return _parse_tracker
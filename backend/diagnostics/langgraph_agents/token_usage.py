@@ -0,0 +1,67 @@
+"""Input/output token accounting per graph node and per diagnostic session"""
+from typing import Dict, Any, Optional
+from collections import OrderedDict
+import threading
+
+def _empty_usage() -> Dict[str, int]:
+    return {"calls": 0, "input_tokens": 0, "output_tokens": 0, "estimated_calls": 0, "cached_calls": 0}
+
+def _add(usage: Dict[str, int], input_tokens: int, output_tokens: int, estimated: bool, cached: bool):
+    if cached:
+        # Served from the LLM response cache: no tokens spent at the provider
+        usage["cached_calls"] += 1
+        return
+    usage["calls"] += 1
+    usage["input_tokens"] += input_tokens
+    usage["output_tokens"] += output_tokens
+    usage["estimated_calls"] += int(estimated)
+
+class TokenUsageTracker:
+    """Keeps usage for the max_sessions most recently active sessions plus process-wide totals.
+
+    Counts come from the provider's usage metadata; calls without it are
+    estimated from the text and counted in estimated_calls. Responses served
+    from the LLM cache only count in cached_calls.
+    """
+
+    def __init__(self, max_sessions: int = 1000):
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+        self._nodes = {}
+
+    def record(self, session_id: Optional[str], node: str, input_tokens: int, output_tokens: int,
+               estimated: bool = False, cached: bool = False):
+        with self._lock:
+            _add(self._nodes.setdefault(node, _empty_usage()), input_tokens, output_tokens, estimated, cached)
+            if session_id is None:
+                return
+            nodes = self._sessions.pop(session_id, None) or {}
+            self._sessions[session_id] = nodes
+            _add(nodes.setdefault(node, _empty_usage()), input_tokens, output_tokens, estimated, cached)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def get_session_usage(self, session_id: str) -> Dict[str, Any]:
+        with self._lock:
+            nodes = {node: dict(usage) for node, usage in self._sessions.get(session_id, {}).items()}
+        total = _empty_usage()
+        for usage in nodes.values():
+            for key in total:
+                total[key] += usage[key]
+        return {"nodes": nodes, "total": total}
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Process-wide totals per node"""
+        with self._lock:
+            nodes = {node: dict(usage) for node, usage in self._nodes.items()}
+            sessions = len(self._sessions)
+        for usage in nodes.values():
+            usage["avg_input_tokens"] = round(usage["input_tokens"] / usage["calls"], 1) if usage["calls"] else 0.0
+        return {"nodes": nodes, "sessions_tracked": sessions}
+
+_token_usage = TokenUsageTracker()
+
+def get_token_usage() -> TokenUsageTracker:
+    """The tracker shared by every LLM call in this process"""
+    return _token_usage
@@ -1,3 +1,528 @@
-from django.test import TestCase
+import asyncio
+import os
+import tempfile
+import threading
+import time
 
-# Create your tests here.
+import numpy as np
+
+from django.test import SimpleTestCase
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration
+
+from diagnostics.langgraph_agents.admission import (AdmissionController, AdmissionRejected,
+                                                    PRIORITY_ANSWER, PRIORITY_NEW_SESSION)
+from diagnostics.langgraph_agents.circuit_breaker import CircuitBreaker, CircuitOpen
+from diagnostics.langgraph_agents.llm_cache import (InMemoryLLMCache, SQLiteLLMCache, cache_key,
+                                                    evict_cached)
+from diagnostics.langgraph_agents.rate_limiter import LLMRateLimiter, _TokenBucket
+from diagnostics.langgraph_agents.question_selector import InformationGainQuestionSelector
+from diagnostics.langgraph_agents.session_store import SQLiteSessionStore
+from diagnostics.langgraph_agents.single_flight import SingleFlight, session_request_key
+from diagnostics.langgraph_agents.state import PredictionScoresSchema, per_disease_schema
+from diagnostics.langgraph_agents.steps import BlockingCall, LLMInvoke
+from diagnostics.langgraph_agents.structured_output import (StructuredOutputError, parse_structured,
+                                                            repair_json)
+
+
+class AdmissionControllerTests(SimpleTestCase):
+    """Slots, queue priority, rejection and slot release of AdmissionController"""
+
+    def setUp(self):
+        self.admission = AdmissionController(max_active=1, max_queue=1, answer_reserve=1)
+        self.unblock = threading.Event()
+        self.addCleanup(self.admission.executor.shutdown, wait=True)
+        self.addCleanup(self.unblock.set)
+
+    def occupy_slot(self):
+        """Hold the only worker slot until self.unblock is set"""
+        started = threading.Event()
+
+        def block():
+            started.set()
+            self.unblock.wait(5)
+
+        future = self.admission.submit(block)
+        self.assertTrue(started.wait(5))
+        return future
+
+    def test_answers_are_served_before_new_sessions(self):
+        blocker = self.occupy_slot()
+        order = []
+        new_session = self.admission.submit(order.append, "new_session", priority=PRIORITY_NEW_SESSION)
+        answer = self.admission.submit(order.append, "answer", priority=PRIORITY_ANSWER)
+        self.assertEqual(self.admission.get_stats()["queued"]["answer"], 1)
+
+        self.unblock.set()
+        for future in (blocker, new_session, answer):
+            future.result(timeout=5)
+        self.assertEqual(order, ["answer", "new_session"])
+
+    def test_full_queue_rejects_with_retry_after(self):
+        blocker = self.occupy_slot()
+        queued = self.admission.submit(lambda: None)
+
+        with self.assertRaises(AdmissionRejected) as rejected:
+            self.admission.submit(lambda: None)
+        self.assertEqual(rejected.exception.priority, PRIORITY_NEW_SESSION)
+        self.assertGreaterEqual(rejected.exception.retry_after, 1)
+        self.assertLessEqual(rejected.exception.retry_after, AdmissionController.MAX_RETRY_AFTER)
+        self.assertEqual(self.admission.get_stats()["rejected"]["new_session"], 1)
+
+        # Answers may still use the reserved queue slot
+        answer = self.admission.submit(lambda: "answered", priority=PRIORITY_ANSWER)
+        self.unblock.set()
+        for future in (blocker, queued):
+            future.result(timeout=5)
+        self.assertEqual(answer.result(timeout=5), "answered")
+
+    def test_cancelled_submission_releases_its_slot(self):
+        blocker = self.occupy_slot()
+        ran = []
+        cancelled = self.admission.submit(ran.append, "cancelled")
+        self.assertTrue(cancelled.cancel())
+
+        self.unblock.set()
+        blocker.result(timeout=5)
+        self.assertEqual(self.admission.submit(lambda: "next").result(timeout=5), "next")
+        self.assertEqual(ran, [])
+        self.assertEqual(self.admission.get_stats()["active"], 0)
+
+    def test_cancelled_coroutine_waiting_for_a_slot_releases_it(self):
+        blocker = self.occupy_slot()
+        ran = []
+
+        async def never_runs():
+            ran.append("cancelled")
+
+        async def cancel_while_queued():
+            waiting = asyncio.ensure_future(self.admission.run(never_runs))
+            await asyncio.sleep(0.05)
+            self.assertEqual(self.admission.get_stats()["queue_depth"], 1)
+            waiting.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await waiting
+            self.unblock.set()
+            await asyncio.wrap_future(blocker)
+            # The queued turn is handed over and given back once the loop runs its callback
+            await asyncio.sleep(0.05)
+
+        asyncio.run(cancel_while_queued())
+        self.assertEqual(ran, [])
+        self.assertEqual(self.admission.get_stats()["active"], 0)
+        self.assertEqual(self.admission.get_stats()["queue_depth"], 0)
+
+
+
+class LLMRateLimiterTests(SimpleTestCase):
+    """Token bucket debt, and refunds of reservations for calls that are never made"""
+
+    def test_bucket_goes_into_debt_and_refunds_restore_it(self):
+        bucket = _TokenBucket(per_minute=60)
+        now = time.monotonic()
+        self.assertEqual(bucket.take(60, now), 0.0)
+        self.assertAlmostEqual(bucket.take(30, now), 30.0)
+        # A reservation larger than the bucket only drains it to the full capacity
+        self.assertAlmostEqual(bucket.take(600, now), 90.0)
+
+        bucket.adjust(-90)
+        self.assertAlmostEqual(bucket.take(30, now), 30.0)
+        bucket.adjust(-1000)
+        self.assertEqual(bucket.level, bucket.capacity)
+
+    def test_cancelled_rate_limit_wait_refunds_its_reservation(self):
+        limiter = LLMRateLimiter(max_concurrency=1, requests_per_minute=0, tokens_per_minute=60)
+
+        async def cancel_while_throttled():
+            async with limiter.alimit(60):
+                pass
+            waiting = asyncio.ensure_future(limiter.alimit(30).__aenter__())
+            await asyncio.sleep(0.05)
+            waiting.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await waiting
+
+        asyncio.run(cancel_while_throttled())
+        self.assertEqual(limiter.get_stats()["abandoned"], 1)
+        # Only the completed call's 60 tokens are still owed, less what refilled meanwhile
+        self.assertLess(limiter._tokens.take(0, time.monotonic()), 1.0)
+
+
+
+class LLMCacheTests(SimpleTestCase):
+    """Cache keys, TTL expiry and LRU eviction of the LLM response caches"""
+
+    LLM_STRING = "[('model', 'gemini'), ('temperature', 0.3)]"
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.db_path = os.path.join(directory.name, "llm_cache.db")
+
+    def make_caches(self, ttl_seconds=60, max_entries=100):
+        sqlite_cache = SQLiteLLMCache(self.db_path, ttl_seconds, max_entries)
+        self.addCleanup(sqlite_cache.conn.close)
+        return [InMemoryLLMCache(ttl_seconds, max_entries), sqlite_cache]
+
+    def answer(self, text):
+        return [ChatGeneration(message=AIMessage(content=text))]
+
+    def test_key_ignores_whitespace_and_the_request_timeout(self):
+        key = cache_key("Symptoms:\n  fever,   chills ", self.LLM_STRING)
+        self.assertEqual(key, cache_key("Symptoms: fever, chills", self.LLM_STRING))
+        self.assertEqual(key, cache_key("Symptoms: fever, chills",
+                                        "[('model', 'gemini'), ('temperature', 0.3), ('timeout', 20.0)]"))
+        self.assertNotEqual(key, cache_key("Symptoms: fever, chills",
+                                           "[('model', 'gemini'), ('temperature', 0.7)]"))
+
+    def test_entries_expire_after_the_ttl(self):
+        for cache in self.make_caches(ttl_seconds=0.1):
+            with self.subTest(backend=cache.backend):
+                cache.update("prompt", self.LLM_STRING, self.answer("cached"))
+                self.assertEqual(cache.lookup("prompt", self.LLM_STRING)[0].message.content, "cached")
+                time.sleep(0.15)
+                self.assertIsNone(cache.lookup("prompt", self.LLM_STRING))
+                self.assertEqual(cache.get_stats()["entries"], 0)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        for cache in self.make_caches(max_entries=2):
+            with self.subTest(backend=cache.backend):
+                cache.TOUCH_INTERVAL_SECONDS = 0
+                for prompt in ("a", "b"):
+                    cache.update(prompt, self.LLM_STRING, self.answer(prompt))
+                    time.sleep(0.01)
+                cache.lookup("a", self.LLM_STRING)
+                time.sleep(0.01)
+                cache.update("c", self.LLM_STRING, self.answer("c"))
+
+                self.assertIsNone(cache.lookup("b", self.LLM_STRING))
+                self.assertIsNotNone(cache.lookup("a", self.LLM_STRING))
+                self.assertEqual(cache.get_stats()["evictions"], 1)
+
+    def test_hits_only_rewrite_last_used_once_per_interval(self):
+        cache = self.make_caches()[1]
+        cache.update("prompt", self.LLM_STRING, self.answer("cached"))
+
+        def last_used():
+            return cache.conn.execute("SELECT last_used FROM llm_cache").fetchone()[0]
+        written_at = last_used()
+
+        cache.lookup("prompt", self.LLM_STRING)
+        self.assertEqual(last_used(), written_at)
+        cache.TOUCH_INTERVAL_SECONDS = 0
+        cache.lookup("prompt", self.LLM_STRING)
+        self.assertGreater(last_used(), written_at)
+
+
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    """Tripping, the half-open probe and its expiry"""
+
+    def setUp(self):
+        self.breaker = CircuitBreaker(failure_rate_threshold=0.5, slow_call_seconds=0.1,
+                                      slow_call_rate_threshold=1.0, window_size=4, minimum_calls=2,
+                                      open_seconds=0.2)
+
+    def call(self, fail=False):
+        with self.breaker.guard():
+            if fail:
+                raise ConnectionError("provider down")
+
+    def trip(self):
+        while self.breaker.get_stats()["state"] == "closed":
+            with self.assertRaises(ConnectionError):
+                self.call(fail=True)
+        self.assertEqual(self.breaker.get_stats()["state"], "open")
+
+    def test_failures_open_the_circuit_and_a_successful_probe_closes_it(self):
+        self.call()
+        self.assertEqual(self.breaker.get_stats()["state"], "closed")
+        self.trip()
+        with self.assertRaises(CircuitOpen):
+            self.call()
+        self.assertFalse(self.breaker.allows_calls())
+
+        time.sleep(0.25)
+        self.assertEqual(self.breaker.get_stats()["state"], "half_open")
+        self.call()
+        self.assertEqual(self.breaker.get_stats()["state"], "closed")
+        self.assertEqual(self.breaker.get_stats()["rejected"], 1)
+
+    def test_failed_probe_reopens_and_only_one_probe_runs_at_a_time(self):
+        self.trip()
+        time.sleep(0.25)
+        with self.breaker.guard():
+            # Other callers are rejected while the probe is out
+            self.assertFalse(self.breaker.allows_calls())
+            with self.assertRaises(CircuitOpen):
+                self.call()
+        self.assertEqual(self.breaker.get_stats()["state"], "closed")
+
+        self.trip()
+        time.sleep(0.25)
+        with self.assertRaises(ConnectionError):
+            self.call(fail=True)
+        self.assertEqual(self.breaker.get_stats()["state"], "open")
+        self.assertEqual(self.breaker.get_stats()["times_opened"], 3)
+
+    def test_hung_probe_expires_and_its_late_result_is_ignored(self):
+        self.trip()
+        time.sleep(0.25)
+        with self.breaker.guard():
+            time.sleep(0.12)
+            # Past slow_call_seconds the probe counts as slow and the circuit reopens
+            self.assertEqual(self.breaker.get_stats()["state"], "open")
+            self.assertIn("probe still running", self.breaker.get_stats()["last_trip_reason"])
+        self.assertEqual(self.breaker.get_stats()["state"], "open")
+
+        time.sleep(0.25)
+        self.call()
+        self.assertEqual(self.breaker.get_stats()["state"], "closed")
+
+
+class InformationGainQuestionSelectorTests(SimpleTestCase):
+    """Greedy question order on a tiny disease x symptom matrix"""
+
+    def setUp(self):
+        symptoms = ["chills", "cough", "fatigue", "itching", "skin_rash"]
+        self.selector = InformationGainQuestionSelector(["Dengue", "Malaria", "Typhoid"], symptoms, np.array([
+            [0.0, 0.0, 1.0, 0.0, 1.0],  # Dengue
+            [1.0, 0.0, 1.0, 0.0, 0.0],  # Malaria
+            [0.0, 1.0, 1.0, 0.0, 0.0],  # Typhoid
+        ]))
+        self.predictions = {"Malaria": {"probability": 0.5}, "Typhoid": {"probability": 0.3},
+                            "Dengue": {"probability": 0.2}}
+
+    def test_symptom_of_the_likeliest_disease_is_asked_first(self):
+        selections = self.selector.select(self.predictions, [], max_questions=5)
+        # chills isolates the likeliest disease; fatigue, shown by all, splits nothing and
+        # itching, shown by none, is never a candidate
+        self.assertEqual([s["symptom"] for s in selections[:1]], ["chills"])
+        self.assertEqual(sorted(s["symptom"] for s in selections[1:3]), ["cough", "skin_rash"])
+        self.assertEqual([s["symptom"] for s in selections[3:]], ["fatigue"])
+        self.assertAlmostEqual(selections[3]["information_gain"], 0.0, places=3)
+        self.assertEqual(selections[0]["related_disease"], "Malaria")
+        self.assertGreater(selections[0]["information_gain"], selections[1]["information_gain"])
+        self.assertAlmostEqual(selections[0]["probability_yes"], 0.5, delta=0.02)
+
+    def test_known_symptoms_and_uninformative_inputs_are_skipped(self):
+        selections = self.selector.select(self.predictions, ["Chills"], max_questions=1)
+        self.assertEqual([s["symptom"] for s in selections], ["cough"])
+        self.assertEqual(self.selector.select({"Malaria": 0.9, "Unknown": 0.1}, [], 3), [])
+        self.assertEqual(self.selector.select(self.predictions, [], 0), [])
+
+    def test_template_questions_follow_the_selection_order(self):
+        questions = self.selector.template_questions(self.selector.select(self.predictions, [], 2))
+        self.assertEqual([q["id"] for q in questions], ["q1", "q2"])
+        self.assertEqual(questions[0]["question_text"], "Have you been experiencing chills?")
+        self.assertEqual([q["priority"] for q in questions], [1, 2])
+
+
+class RepairJsonTests(SimpleTestCase):
+    """Local repair of LLM JSON answers, and the re-ask of answers that were cut off"""
+
+    def test_clean_answer_is_not_marked_repaired(self):
+        self.assertEqual(repair_json('{"a": 1}'), ({"a": 1}, False))
+        self.assertEqual(repair_json('```json\n{"a": 1}\n```'), ({"a": 1}, False))
+
+    def test_surrounding_text_and_trailing_commas_are_repaired(self):
+        value, repaired = repair_json('Sure: {"a": [1, 2,], "b": "x",} thanks')
+        self.assertEqual(value, {"a": [1, 2], "b": "x"})
+        self.assertTrue(repaired)
+        self.assertEqual(repair_json('{"a": "line\nbreak"}'), ({"a": "line\nbreak"}, True))
+
+    def test_truncated_answers_are_rejected(self):
+        truncated = {
+            '{"a": "cut': "inside a string",
+            '{"a": [1, 2': "2 unclosed bracket(s)",
+            '{"a": 1, ': "1 unclosed bracket(s)",
+            '{"a": {"b": 1}': "1 unclosed bracket(s)",
+        }
+        for answer, reason in truncated.items():
+            with self.subTest(answer=answer):
+                with self.assertRaisesMessage(StructuredOutputError, reason):
+                    repair_json(answer)
+        with self.assertRaisesMessage(StructuredOutputError, "2 unclosed bracket(s)"):
+            repair_json('[{"a": 1}, {"b"', expect=list)
+
+    def test_truncated_answer_is_evicted_and_reasked(self):
+        llm = FakeListChatModel(responses=[])
+        messages = [HumanMessage(content="Return the predictions as JSON")]
+        steps = parse_structured("test_node", llm, '{"Malaria": {"probability": 0.', messages=messages)
+
+        evict = next(steps)
+        self.assertIsInstance(evict, BlockingCall)
+        self.assertIs(evict.fn, evict_cached)
+        self.assertIs(evict.args[1], messages)
+
+        reask = steps.send(None)
+        self.assertIsInstance(reask, LLMInvoke)
+        self.assertIn("truncated", reask.messages[0].content)
+        with self.assertRaises(StopIteration) as done:
+            steps.send(AIMessage(content='{"Malaria": {"probability": 0.6}}'))
+        self.assertEqual(done.exception.value, {"Malaria": {"probability": 0.6}})
+
+    def test_answer_not_matching_the_schema_is_reasked(self):
+        llm = FakeListChatModel(responses=[])
+        messages = [HumanMessage(content="Return the refined predictions as JSON")]
+        schema = per_disease_schema(PredictionScoresSchema)
+        steps = parse_structured("test_node", llm, '{"Malaria": {"probability": 1.5, "confidence": "High"}}',
+                                 schema=schema, messages=messages)
+
+        self.assertIsInstance(next(steps), BlockingCall)
+        reask = steps.send(None)
+        self.assertIsInstance(reask, LLMInvoke)
+        self.assertIn("PredictionScoresSchema", reask.messages[0].content)
+        # A re-asked answer that still does not match is evicted too, then the parse fails
+        still_wrong = AIMessage(content='{"Malaria": {"probability": 0.6, "confidence": "Very high"}}')
+        self.assertIsInstance(steps.send(still_wrong), BlockingCall)
+        with self.assertRaisesMessage(StructuredOutputError, "does not match"):
+            steps.send(None)
+
+
+class SQLiteSessionStoreTests(SimpleTestCase):
+    """TTL and LRU eviction of the shared SQLite session store, and its event log"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.db_path = os.path.join(directory.name, "sessions.db")
+
+    def make_store(self, ttl_seconds=60, max_sessions=100):
+        store = SQLiteSessionStore(self.db_path, ttl_seconds, max_sessions)
+        # Record every access so LRU order is exact within the test
+        store.TOUCH_INTERVAL_SECONDS = 0
+        self.addCleanup(store.conn.close)
+        return store
+
+    def test_idle_sessions_expire_after_the_ttl(self):
+        store = self.make_store(ttl_seconds=0.2)
+        released = []
+        store.add_eviction_listener(released.append)
+        store.set("status", "idle", "initialized")
+        store.set("status", "swept", "initialized")
+
+        time.sleep(0.3)
+        self.assertIsNone(store.get("status", "idle"))
+        self.assertEqual(store.sweep(), 1)
+        self.assertEqual(sorted(released), ["idle", "swept"])
+        self.assertEqual(store.get_stats()["expired"], 2)
+
+    def test_least_recently_used_session_is_evicted(self):
+        store = self.make_store(max_sessions=2)
+        released = []
+        store.add_eviction_listener(released.append)
+        store.set("status", "a", "initialized")
+        time.sleep(0.01)
+        store.set("status", "b", "initialized")
+        time.sleep(0.01)
+        store.get("status", "a")
+        time.sleep(0.01)
+
+        store.set("status", "c", "initialized")
+        self.assertEqual(released, ["b"])
+        self.assertIsNone(store.get("status", "b"))
+        self.assertEqual(store.get("status", "a"), "initialized")
+        self.assertEqual(store.get_stats()["evicted"], 1)
+
+    def test_session_created_concurrently_by_another_process_is_reused(self):
+        store, other_process = self.make_store(), self.make_store()
+        lookup = store._touch
+
+        def lookup_then_lose_the_race(session_id, now, expired):
+            found = lookup(session_id, now, expired)
+            store._touch = lookup
+            other_process.set("status", session_id, "initialized")
+            return found
+
+        store._touch = lookup_then_lose_the_race
+        store.set("status", "session", "running")
+        self.assertEqual(other_process.get("status", "session"), "running")
+        self.assertEqual(store.get_stats()["sessions"], 1)
+
+    def test_events_appended_through_two_connections_keep_their_order(self):
+        writer, other_writer = self.make_store(), self.make_store()
+        indexes = [
+            (writer if i % 2 == 0 else other_writer).append("deltas", "session", {"content": f"t{i}"})
+            for i in range(6)
+        ]
+        self.assertEqual(indexes, list(range(6)))
+
+        expected = [{"content": f"t{i}"} for i in range(6)]
+        self.assertEqual(writer.items_since("deltas", "session", 0), expected)
+        self.assertEqual(other_writer.items_since("deltas", "session", 4), expected[4:])
+        self.assertEqual(other_writer.items_since("deltas", "session", 6), [])
+        self.assertEqual(writer.items_since("deltas", "other_session", 0), [])
+
+
+class SingleFlightTests(SimpleTestCase):
+    """Deduplication of identical session starts, by run() and by claim()/settle()"""
+
+    def setUp(self):
+        self.flight = SingleFlight(window_seconds=60)
+        self.key = session_request_key(1, ["high_fever", "chills"], {}, 3, True)
+        self.runs = []
+
+    async def diagnose(self, session_id):
+        self.runs.append(session_id)
+        await asyncio.sleep(0.05)
+        return {"session_id": session_id, "type": "question"}
+
+    def test_key_ignores_symptom_order_and_spelling(self):
+        self.assertEqual(self.key, session_request_key(1, ["Chills", "high fever"], None, 3, True))
+        self.assertNotEqual(self.key, session_request_key(2, ["high_fever", "chills"], {}, 3, True))
+        self.assertNotEqual(self.key, session_request_key(1, ["high_fever", "chills"], {}, 3, True, job=True))
+
+    def test_concurrent_identical_runs_share_one_execution(self):
+        async def start_twice():
+            return await asyncio.gather(self.flight.run(self.key, self.diagnose, "s1"),
+                                        self.flight.run(self.key, self.diagnose, "s2"))
+
+        first, second = asyncio.run(start_twice())
+        self.assertEqual(self.runs, ["s1"])
+        self.assertNotIn("deduplicated", first)
+        self.assertEqual(second, {"session_id": "s1", "type": "question", "deduplicated": True})
+
+        # Within the window the finished result is shared too
+        third = asyncio.run(self.flight.run(self.key, self.diagnose, "s3"))
+        self.assertEqual((self.runs, third["session_id"]), (["s1"], "s1"))
+        self.assertEqual(self.flight.get_stats()["executions"], 1)
+        self.assertEqual(self.flight.get_stats()["shared"], 2)
+
+    def test_failures_are_shared_but_not_remembered(self):
+        async def fail(session_id):
+            raise ValueError("provider down")
+
+        with self.assertRaises(ValueError):
+            asyncio.run(self.flight.run(self.key, fail, "s1"))
+        asyncio.run(self.flight.run(self.key, self.diagnose, "s2"))
+        self.assertEqual(self.runs, ["s2"])
+
+    def test_claim_makes_followers_join_the_leading_session(self):
+        self.assertEqual(self.flight.claim(self.key, "s1"), ("s1", True))
+        self.assertEqual(self.flight.claim(self.key, "s2"), ("s1", False))
+
+        leader = asyncio.run(self.flight.run(self.key, self.diagnose, "s1"))
+        follower = asyncio.run(self.flight.run(self.key, self.diagnose, "s1"))
+        self.assertEqual(self.runs, ["s1"])
+        self.assertEqual(follower, {**leader, "deduplicated": True})
+
+    def test_settled_claims_share_the_result_or_free_the_key(self):
+        self.flight.claim(self.key, "s1")
+        self.flight.settle(self.key, result={"session_id": "s1", "enhanced": False})
+        self.assertEqual(self.flight.claim(self.key, "s2"), ("s1", False))
+        shared = asyncio.run(self.flight.run(self.key, self.diagnose, "s1"))
+        self.assertEqual((self.runs, shared["enhanced"]), ([], False))
+
+        other_key = session_request_key(1, ["cough"], {}, 3, True)
+        self.flight.claim(other_key, "s3")
+        self.flight.settle(other_key, error=RuntimeError("ML prediction failed"))
+        self.assertEqual(self.flight.claim(other_key, "s4"), ("s4", True))
+
+    def test_unstarted_claim_times_out(self):
+        self.flight.claim_timeout_seconds = 0.05
+        self.flight.claim(self.key, "s1")
+        time.sleep(0.1)
+        self.assertEqual(self.flight.claim(self.key, "s2"), ("s2", True))
@@ -1,6 +1,15 @@
 from django.urls import path
 from . import views
 from . import views_enhanced
+from .langgraph_agents.config import DiagnosticConfig
+
+# Under ASGI the graph runs on the server's event loop; see ASYNC_GRAPH_EXECUTION
+if DiagnosticConfig.ASYNC_GRAPH_EXECUTION:
+    predict_enhanced_view = views_enhanced.predict_disease_enhanced_async_view
+    answer_questions_view = views_enhanced.answer_clarifying_questions_async_view
+else:
+    predict_enhanced_view = views_enhanced.predict_disease_enhanced_view
+    answer_questions_view = views_enhanced.answer_clarifying_questions_view
 
 urlpatterns = [
      # Diagnostic endpoints
@@ -10,10 +19,18 @@ urlpatterns = [
     path('history/', views.user_diagnostic_history, name='diagnostic_history'),
     
     # New enhanced endpoints
-    path('predict/disease/enhanced/', views_enhanced.predict_disease_enhanced_view, name='predict_disease_enhanced'),
-    path('predict/disease/answer-questions/', views_enhanced.answer_clarifying_questions_view, name='answer_clarifying_questions'),
+    path('predict/disease/enhanced/', predict_enhanced_view, name='predict_disease_enhanced'),
+    path('predict/disease/answer-questions/', answer_questions_view, name='answer_clarifying_questions'),
     path('sessions/<str:session_id>/status/', views_enhanced.get_session_status_view, name='session_status'),
+    path('sessions/<str:session_id>/job/', views_enhanced.get_enhanced_job_view, name='enhanced_job_status'),
     path('sessions/active/', views_enhanced.get_active_sessions_view, name='active_sessions'),
+    path('metrics/llm-cache/', views_enhanced.get_llm_cache_stats_view, name='llm_cache_stats'),
+    path('metrics/admission/', views_enhanced.get_admission_stats_view, name='admission_stats'),
+    path('metrics/llm-limiter/', views_enhanced.get_llm_limiter_stats_view, name='llm_limiter_stats'),
+    path('metrics/llm-circuit/', views_enhanced.get_llm_circuit_stats_view, name='llm_circuit_stats'),
+    path('metrics/tokens/', views_enhanced.get_token_usage_stats_view, name='token_usage_stats'),
+    path('metrics/structured-output/', views_enhanced.get_structured_output_stats_view, name='structured_output_stats'),
+    path('metrics/sessions/', views_enhanced.get_session_store_stats_view, name='session_store_stats'),
     path('reasoning-stream/<str:session_id>/', views_enhanced.reasoning_stream_view, name='reasoning_stream'),
     path('reasoning-stream/<str:session_id>', views_enhanced.reasoning_stream_view, name='reasoning_stream'),
 ]
\ No newline at end of file
@@ -1,4 +1,11 @@
 import os
+import time
+import asyncio
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import faiss
+import numpy as np
 import pandas as pd
 from langchain_community.vectorstores import FAISS
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
@@ -15,9 +22,153 @@ def get_gemini_api_key():
 
 gemini_api_key = get_gemini_api_key()
 
+# Storage modes for the in-memory embedding index:
+#   float32 - the original flat FAISS index (exact, 4 bytes per dimension)
+#   float16 - scalar-quantized index storing half-precision vectors (2 bytes per dimension);
+#             the recommended compressed mode for this knowledge base
+#   pq      - product-quantized codes with exact re-ranking of the top candidates against
+#             float32 vectors memory-mapped from disk (only the touched rows are paged in);
+#             refused below VECTOR_PQ_MIN_VECTORS, where float16 is used instead
+STORAGE_MODES = ("float32", "float16", "pq")
+VECTOR_STORAGE_MODE = os.getenv("VECTOR_STORAGE_MODE", "float32").lower()
+VECTOR_PQ_SUBQUANTIZERS = int(os.getenv("VECTOR_PQ_SUBQUANTIZERS", "32"))
+VECTOR_RERANK_FACTOR = int(os.getenv("VECTOR_RERANK_FACTOR", "4"))
+# Below this, PQ training gets fewer than the 39 points per centroid faiss asks for (256
+# centroids per sub-quantizer), recall drops, and the float32 re-ranking copy PQ needs is
+# already twice the size of a float16 index, which holds the whole collection in a few MB
+VECTOR_PQ_MIN_VECTORS = int(os.getenv("VECTOR_PQ_MIN_VECTORS", "10000"))
+RERANK_VECTORS_FILE = "rerank_vectors.npy"
+# Checksum of the vectors the re-ranking file was written from
+RERANK_FINGERPRINT_FILE = "rerank_vectors.sha256"
+
+# Upper bound on concurrent searches (each one blocks on a remote embedding call)
+VECTOR_SEARCH_CONCURRENCY = int(os.getenv("VECTOR_SEARCH_CONCURRENCY", "8"))
+
+# Knowledge sources stored in document metadata, with the wording used to look each one up
+KNOWLEDGE_SOURCES = {
+    "description": "description",
+    "dataset": "symptoms",
+    "precaution": "precautions"
+}
+# Candidates fetched before metadata filtering in a disease lookup
+DISEASE_LOOKUP_FETCH_K = int(os.getenv("DISEASE_LOOKUP_FETCH_K", "200"))
+
+
+def normalize_disease_name(name):
+    """Case and whitespace insensitive disease name used for metadata matching"""
+    return " ".join(str(name).lower().split())
+
+
+def vectors_fingerprint(vectors):
+    """Checksum identifying one build of the index vectors"""
+    return hashlib.sha256(np.ascontiguousarray(vectors, dtype=np.float32).tobytes()).hexdigest()
+
+
+def build_compressed_index(vectors, mode, metric=faiss.METRIC_L2, pq_subquantizers=VECTOR_PQ_SUBQUANTIZERS,
+                           pq_min_vectors=VECTOR_PQ_MIN_VECTORS):
+    """Build a compressed FAISS index holding the given float32 vectors"""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    num_vectors, dimension = vectors.shape
+
+    if mode == "float16":
+        index = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_fp16, metric)
+    elif mode == "pq":
+        if num_vectors < pq_min_vectors:
+            raise ValueError(f"pq storage needs at least {pq_min_vectors} vectors, got {num_vectors}; "
+                             f"use float16 instead")
+        # The number of sub-quantizers must divide the dimension, and PQ training needs
+        # at least 2**nbits points, so shrink both for small collections.
+        subquantizers = max(m for m in range(1, min(pq_subquantizers, dimension) + 1) if dimension % m == 0)
+        nbits = int(max(1, min(8, np.floor(np.log2(max(num_vectors, 2))))))
+        index = faiss.IndexPQ(dimension, subquantizers, nbits, metric)
+        index.train(vectors)
+    else:
+        raise ValueError(f"Unsupported compressed storage mode: {mode}")
+
+    index.add(vectors)
+    return index
+
+
+def rerank_candidates(candidate_ids, vectors, query_vector, k, metric=faiss.METRIC_L2):
+    """Exactly re-rank candidate ids against the uncompressed vectors and keep the top k"""
+    # Sorted ids keep reads from a memory-mapped array sequential
+    ordered_ids = sorted(int(i) for i in candidate_ids if i != -1)
+    if not ordered_ids:
+        return []
+
+    exact_vectors = np.asarray(vectors[ordered_ids], dtype=np.float32)
+    if metric == faiss.METRIC_INNER_PRODUCT:
+        scores = -(exact_vectors @ query_vector)
+    else:
+        scores = ((exact_vectors - query_vector) ** 2).sum(axis=1)
+
+    return [ordered_ids[pos] for pos in np.argsort(scores)[:k]]
+
+
+def index_memory_bytes(index):
+    """Size of a FAISS index (codes plus codebooks) as it is held in memory"""
+    return int(faiss.serialize_index(index).size)
+
+
+def benchmark_storage_modes(vectors, query_vectors, k=5, modes=("float16", "pq"),
+                            pq_subquantizers=VECTOR_PQ_SUBQUANTIZERS, rerank_factor=VECTOR_RERANK_FACTOR,
+                            pq_min_vectors=VECTOR_PQ_MIN_VECTORS):
+    """Compare recall@k, memory and latency of compressed indexes against the exact float32 index"""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    query_vectors = np.ascontiguousarray(query_vectors, dtype=np.float32)
+
+    exact_index = faiss.IndexFlatL2(vectors.shape[1])
+    exact_index.add(vectors)
+    start = time.perf_counter()
+    _, exact_ids = exact_index.search(query_vectors, k)
+    exact_latency = (time.perf_counter() - start) / len(query_vectors)
+
+    def recall_at_k(found_ids):
+        hits = sum(len(set(found) & set(expected)) for found, expected in zip(found_ids, exact_ids))
+        return hits / float(exact_ids.size)
+
+    results = [{
+        "mode": "float32",
+        "recall_at_k": 1.0,
+        "memory_bytes": index_memory_bytes(exact_index),
+        "avg_query_ms": exact_latency * 1000
+    }]
+
+    for mode in modes:
+        index = build_compressed_index(vectors, mode, pq_subquantizers=pq_subquantizers,
+                                       pq_min_vectors=pq_min_vectors)
+        start = time.perf_counter()
+        _, found_ids = index.search(query_vectors, k)
+        latency = (time.perf_counter() - start) / len(query_vectors)
+        results.append({
+            "mode": mode,
+            "recall_at_k": recall_at_k(found_ids),
+            "memory_bytes": index_memory_bytes(index),
+            "avg_query_ms": latency * 1000
+        })
+
+        if mode == "pq":
+            # Same PQ codes, but re-rank k * rerank_factor candidates with exact distances
+            start = time.perf_counter()
+            _, candidate_ids = index.search(query_vectors, k * rerank_factor)
+            reranked_ids = [
+                rerank_candidates(candidates, vectors, query, k)
+                for candidates, query in zip(candidate_ids, query_vectors)
+            ]
+            latency = (time.perf_counter() - start) / len(query_vectors)
+            results.append({
+                "mode": f"pq+rerank(x{rerank_factor})",
+                "recall_at_k": recall_at_k(reranked_ids),
+                "memory_bytes": index_memory_bytes(index),
+                "avg_query_ms": latency * 1000
+            })
+
+    return results
+
+
 # Class that manages the vector database logic
 class MedicalKnowledgeDB:
-    def __init__(self):
+    def __init__(self, storage_mode: str = None):
         self.data_dir = settings.DATA_DIR  # Points to the folder holding the CSV files.
         self.db_path = os.path.join(settings.BASE_DIR, 'diagnostics', 'agents', 'vector_db')  # Where the FAISS index will be saved.
         
@@ -27,6 +178,21 @@ class MedicalKnowledgeDB:
             google_api_key=gemini_api_key
         )
         self.vector_db = None
+        
+        # Compressed storage configuration
+        self.storage_mode = (storage_mode or VECTOR_STORAGE_MODE).lower()
+        if self.storage_mode not in STORAGE_MODES:
+            raise ValueError(f"Unknown vector storage mode '{self.storage_mode}', expected one of {STORAGE_MODES}")
+        self.rerank_factor = VECTOR_RERANK_FACTOR
+        self.rerank_vectors = None  # Memory-mapped float32 vectors, only used in "pq" mode
+        
+        # Shared pool for concurrent searches; its size bounds parallelism across all callers.
+        # Created up front (its threads start on first use) so concurrent first searches share one pool
+        self.search_concurrency = VECTOR_SEARCH_CONCURRENCY
+        self._search_executor = ThreadPoolExecutor(
+            max_workers=self.search_concurrency,
+            thread_name_prefix="vector-search"
+        )
     
     def load_or_create_db(self):
         """Load existing vector DB or create a new one if it doesn't exist"""
@@ -37,10 +203,56 @@ class MedicalKnowledgeDB:
                 self.embeddings,
                 allow_dangerous_deserialization=True  
             )
+            self._apply_storage_mode()
             return self.vector_db
         
         print("Creating new vector database...")
-        return self.create_db()
+        self.create_db()
+        self._apply_storage_mode()
+        return self.vector_db
+    
+    def _apply_storage_mode(self):
+        """Replace the flat float32 index with the configured compressed index"""
+        if self.storage_mode == "float32":
+            return
+        
+        flat_index = self.vector_db.index
+        vectors = flat_index.reconstruct_n(0, flat_index.ntotal)
+        original_bytes = index_memory_bytes(flat_index)
+        
+        if self.storage_mode == "pq" and flat_index.ntotal < VECTOR_PQ_MIN_VECTORS:
+            print(f"Vector index has {flat_index.ntotal} vectors, fewer than VECTOR_PQ_MIN_VECTORS="
+                  f"{VECTOR_PQ_MIN_VECTORS}; using float16 instead of pq")
+            self.storage_mode = "float16"
+        
+        # Positions are preserved, so index_to_docstore_id keeps mapping to the right documents
+        self.vector_db.index = build_compressed_index(vectors, self.storage_mode, flat_index.metric_type)
+        
+        if self.storage_mode == "pq":
+            self.rerank_vectors = self._load_rerank_vectors(vectors)
+        
+        print(f"Vector index stored as {self.storage_mode}: "
+              f"{original_bytes / 1e6:.1f}MB -> {index_memory_bytes(self.vector_db.index) / 1e6:.1f}MB")
+    
+    def _load_rerank_vectors(self, vectors):
+        """Persist the float32 vectors next to the index and memory-map them for re-ranking"""
+        rerank_path = os.path.join(self.db_path, RERANK_VECTORS_FILE)
+        fingerprint_path = os.path.join(self.db_path, RERANK_FINGERPRINT_FILE)
+        fingerprint = vectors_fingerprint(vectors)
+        
+        # A rebuild can keep the vector count and dimension, so compare the checksum
+        stale = True
+        if os.path.exists(rerank_path) and os.path.exists(fingerprint_path):
+            with open(fingerprint_path) as f:
+                stale = f.read().strip() != fingerprint
+        if stale:
+            os.makedirs(self.db_path, exist_ok=True)
+            np.save(rerank_path, np.ascontiguousarray(vectors, dtype=np.float32))
+            # Written last, so an interrupted save never carries a matching fingerprint
+            with open(fingerprint_path, "w") as f:
+                f.write(fingerprint)
+        
+        return np.load(rerank_path, mmap_mode='r')
     
     def create_db(self):
         """Create a vector database from medical datasets"""
@@ -94,11 +306,95 @@ class MedicalKnowledgeDB:
         os.makedirs(self.db_path, exist_ok=True)
         self.vector_db.save_local(self.db_path)
         
+        # A rebuilt index invalidates previously saved re-ranking vectors
+        for filename in (RERANK_FINGERPRINT_FILE, RERANK_VECTORS_FILE):
+            path = os.path.join(self.db_path, filename)
+            if os.path.exists(path):
+                os.remove(path)
+        
         return self.vector_db
     
-    def search(self, query, k=5):
+    def search(self, query, k=5, filter=None, fetch_k=20):
         """Search the vector database for relevant information"""
         if not self.vector_db:
             self.load_or_create_db()
         
+        if self.storage_mode == "pq":
+            query_vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+            return self._search_with_rerank(query_vector, k, filter, fetch_k)
+        
+        if filter is not None:
+            return self.vector_db.similarity_search(query, k=k, filter=filter, fetch_k=fetch_k)
+        
         return self.vector_db.similarity_search(query, k=k) # Given a query, it finds top k relevant documents from the DB. These enable agents to retrieve context when thinking about predictions.
+    
+    def _search_with_rerank(self, query_vector, k, filter=None, fetch_k=20):
+        """Fetch k * rerank_factor PQ candidates, then re-rank them with exact distances"""
+        index = self.vector_db.index
+        wanted = fetch_k if filter is not None else k
+        num_candidates = min(index.ntotal, wanted * self.rerank_factor)
+        _, candidate_ids = index.search(query_vector.reshape(1, -1), num_candidates)
+        
+        top_ids = rerank_candidates(candidate_ids[0], self.rerank_vectors, query_vector, wanted, index.metric_type)
+        docs = [
+            self.vector_db.docstore.search(self.vector_db.index_to_docstore_id[i])
+            for i in top_ids
+        ]
+        if filter is not None:
+            docs = [doc for doc in docs if filter(doc.metadata)]
+        return docs[:k]
+    
+    def search_disease(self, disease, source, k=2):
+        """Retrieve documents of one knowledge source (description, dataset, precaution) about a disease"""
+        if source not in KNOWLEDGE_SOURCES:
+            raise ValueError(f"Unknown knowledge source '{source}', expected one of {list(KNOWLEDGE_SOURCES)}")
+        
+        target = normalize_disease_name(disease)
+        
+        def matches(metadata):
+            return (metadata.get("source") == source and
+                    normalize_disease_name(metadata.get("disease", "")) == target)
+        
+        query = f"Disease: {disease} {KNOWLEDGE_SOURCES[source]}"
+        docs = self.search(query, k=k, filter=matches, fetch_k=DISEASE_LOOKUP_FETCH_K)
+        
+        # Names the knowledge base does not know still get the nearest documents
+        return docs or self.search(query, k=k)
+    
+    def search_many(self, queries, k=5):
+        """Run several searches concurrently and return their results in query order"""
+        if not queries:
+            return []
+        
+        # Load once here rather than racing to load inside the workers
+        if not self.vector_db:
+            self.load_or_create_db()
+        
+        if len(queries) == 1:
+            return [self.search(queries[0], k=k)]
+        
+        return list(self._search_executor.map(partial(self.search, k=k), queries))
+    
+    def search_disease_many(self, lookups, k=2):
+        """Run several (disease, source) lookups concurrently, returning results in order"""
+        if not lookups:
+            return []
+        
+        if not self.vector_db:
+            self.load_or_create_db()
+        
+        return list(self._search_executor.map(
+            lambda lookup: self.search_disease(lookup[0], lookup[1], k=k), lookups
+        ))
+    
+    async def asearch(self, query, k=5):
+        """Async search that runs on the shared search pool without blocking the event loop"""
+        if not self.vector_db:
+            self.load_or_create_db()
+        
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._search_executor, partial(self.search, query, k=k))
+    
+    async def asearch_many(self, queries, k=5):
+        """Async counterpart of search_many"""
+        return list(await asyncio.gather(*(self.asearch(query, k=k) for query in queries)))
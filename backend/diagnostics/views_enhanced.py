@@ -4,10 +4,16 @@ from django.conf import settings
 from rest_framework.decorators import api_view, permission_classes, parser_classes
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder as DRFJSONEncoder
+from rest_framework import exceptions
+from asgiref.sync import async_to_sync, sync_to_async
 from .models import DiagnosticResult, MalariaImage, SymptomInput
 from .ml_utils import predict_disease, SYMPTOM_CATEGORIES, available_symptoms
 from .langgraph_agents.api_integration import DiagnosticAPIIntegration
 from .langgraph_agents.config import DiagnosticConfig
+from .langgraph_agents.admission import AdmissionRejected
 from .vector_db import MedicalKnowledgeDB
 import asyncio
 from django.http import StreamingHttpResponse
@@ -17,9 +23,11 @@ from datetime import datetime
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.views import View
-from django.views.decorators.http import require_GET
+from django.views.decorators.http import require_GET, require_POST
 from django.views.decorators.gzip import gzip_page
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse
+from django.urls import reverse
+from django.db import close_old_connections
 
 # Initialize the diagnostic system
 vector_db = MedicalKnowledgeDB()
@@ -65,51 +73,211 @@ def clean_for_json_serialization(obj):
         return str(obj)
 
 
-@api_view(['POST'])
-@parser_classes([JSONParser])
-def predict_disease_enhanced_view(request):
-    """Enhanced disease prediction using LangGraph multi-agent system"""
-   
+async def _authenticate_async(request):
+    """DRF authentication and IsAuthenticated for plain async Django views.
+    
+    Returns (user, parsed JSON body, error response); the error is None on success.
+    """
+    drf_request = Request(
+        request,
+        parsers=[JSONParser()],
+        authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    )
+    try:
+        # Session/token lookups hit the ORM, and session auth enforces CSRF here
+        user = await sync_to_async(lambda: drf_request.user)()
+        if not user or not user.is_authenticated:
+            raise exceptions.NotAuthenticated()
+        data = await sync_to_async(lambda: drf_request.data)()
+    except exceptions.APIException as e:
+        return None, None, _json_response({'detail': str(e.detail)}, e.status_code)
+    return user, data, None
+
+
+def _json_response(payload, status_code) -> JsonResponse:
+    return JsonResponse(payload, status=status_code, safe=False, encoder=DRFJSONEncoder)
+
+
+def _busy_payload(rejection: AdmissionRejected, session_id) -> dict:
+    print(f"Diagnostic service busy: {rejection}")
+    return {
+        'error': 'The diagnostic assistant is busy, please try again shortly',
+        'status': 'busy',
+        'session_id': session_id,
+        'retry_after': rejection.retry_after
+    }
+
+
+def _with_retry_after(response, payload):
+    """Add the Retry-After header to 429 responses from the admission controller"""
+    if response.status_code == status.HTTP_429_TOO_MANY_REQUESTS and isinstance(payload, dict):
+        response['Retry-After'] = str(payload.get('retry_after', 1))
+    return response
+
+
+def _save_enhanced_result(user, result: dict, symptoms) -> None:
+    """Persist an enhanced prediction for the user and mark the result as saved"""
+    print(f"Saving result for user: {user.username}")
+    
+    # Clean the result before saving
+    cleaned_result = clean_for_json_serialization(result)
+    
+    diagnostic_result = DiagnosticResult.objects.create(
+        user=user,
+        diagnostic_type='enhanced',
+        result_data=cleaned_result
+    )
+
+    SymptomInput.objects.create(
+        diagnostic_result=diagnostic_result,
+        symptoms=symptoms
+    )
+
+    result['saved'] = True
+    result['result_id'] = diagnostic_result.id
+
+
+def _format_enhanced_result(enhanced_result: dict, initial_result, selected_symptoms) -> dict:
+    """Response payload for a start_diagnosis result"""
+    if enhanced_result.get('type') == 'question':
+        questions = enhanced_result.get('questions', [])
+        print(f"DEBUG: Found {len(questions)} questions in enhanced result")
+
+        # Ensure questions are properly formatted
+        formatted_questions = []
+        for q in questions:
+            if isinstance(q, dict):
+                formatted_questions.append(q)
+            elif isinstance(q, str):
+                formatted_questions.append({
+                    'id': f'q{len(formatted_questions) + 1}',
+                    'question': q,
+                    'question_text': q,
+                    'type': 'yes_no',
+                    'related_disease': 'General',
+                    'symptom_checking': 'additional symptoms',
+                    'priority': 1,
+                    'required': True
+                })
+
+        result = {
+            'initial_predictions': initial_result,
+            'enhanced': True,
+            'status': 'waiting_for_input',
+            'session_id': enhanced_result['session_id'],
+            'progress': enhanced_result.get('progress', {}),
+            'clarifying_questions': formatted_questions,
+            'degraded': enhanced_result.get('degraded', False),
+            'degraded_reason': enhanced_result.get('degraded_reason'),
+            'degraded_nodes': enhanced_result.get('degraded_nodes', []),
+            'reasoning_steps': enhanced_result.get('reasoning_steps', []),
+            'agent_outputs': clean_for_json_serialization(enhanced_result.get('agent_outputs', {})),
+            'transparency': clean_for_json_serialization(enhanced_result.get('transparency', {}))
+        }
+    elif enhanced_result.get('type') == 'diagnosis':
+        # The system has completed the diagnosis
+        result = {
+            'initial_predictions': initial_result,
+            'enhanced': True,
+            'status': 'completed',
+            'session_id': enhanced_result['session_id'],
+            'enhanced_predictions': enhanced_result['predictions'],
+            'summary': enhanced_result.get('summary', {}),
+            'symptoms_analyzed': enhanced_result.get('symptoms_analyzed', selected_symptoms),
+            'questions_asked': enhanced_result.get('questions_asked', 0),
+            'reasoning_steps': enhanced_result.get('reasoning_steps', []),
+            'agent_outputs': clean_for_json_serialization(enhanced_result.get('agent_outputs', {})),
+            'transparency': clean_for_json_serialization(enhanced_result.get('transparency', {})),
+            'clarifying_questions': [],
+            'fast_path': enhanced_result.get('fast_path', False),
+            'enrichment_pending': enhanced_result.get('enrichment_pending', False),
+            'degraded': enhanced_result.get('degraded', False),
+            'degraded_reason': enhanced_result.get('degraded_reason'),
+            'degraded_nodes': enhanced_result.get('degraded_nodes', [])
+        }
+    else:
+        # Fallback for other response types
+        result = {
+            'initial_predictions': initial_result,
+            'enhanced': True,
+            'session_id': enhanced_result.get('session_id'),
+            'langgraph_result': clean_for_json_serialization(enhanced_result),
+            'reasoning_steps': enhanced_result.get('reasoning_steps', []),
+            'agent_outputs': clean_for_json_serialization(enhanced_result.get('agent_outputs', {})),
+            'clarifying_questions': []
+        }
+    return result
+
+
+def _finish_enhanced_job(user, enhanced_result: dict, initial_result, selected_symptoms) -> dict:
+    """Format and save the result of a background job; runs on the job's worker thread"""
+    try:
+        result = _format_enhanced_result(enhanced_result, initial_result, selected_symptoms)
+        if user.is_authenticated:
+            _save_enhanced_result(user, result, selected_symptoms)
+        return result
+    finally:
+        # Worker threads sit outside the request cycle that normally closes connections
+        close_old_connections()
+
+
+async def _run_enhanced_prediction(data, user):
+    """Body of the enhanced prediction endpoints; returns (payload, http status)"""
+    # Arguments of the session this request leads until a run or job takes it over;
+    # any other exit settles it so identical starts do not join a session that never runs
+    claim = None
     try:
         print("Enhanced disease prediction view called")
-        data = request.data
         selected_symptoms = data.get('symptoms', [])
         patient_info = data.get('patient_info', {})
         max_questions = data.get('max_questions', DiagnosticConfig.MAX_QUESTIONS_DEFAULT)
+        # Clients can opt out of the high-confidence shortcut to always get the agent review
+        allow_fast_path = data.get('fast_path', True)
+        # Job mode answers with 202 right after the ML prediction and runs the agents in the background
+        job_mode = data.get('job', DiagnosticConfig.ENHANCED_JOB_MODE_DEFAULT)
         print(f"Selected symptoms: {selected_symptoms}")
 
         if not selected_symptoms:
-            return Response({'error': 'No symptoms provided'}, status=status.HTTP_400_BAD_REQUEST)
+            return {'error': 'No symptoms provided'}, status.HTTP_400_BAD_REQUEST
         
-        # Create session ID FIRST
-        session_id = str(uuid.uuid4())
+        owner_id = user.pk if user.is_authenticated else None
         
-        # Initialize session in diagnostic API IMMEDIATELY
-        diagnostic_api.initialize_session(session_id)
-        
-        # Add initial reasoning steps BEFORE any processing
-        timestamp = datetime.now().isoformat()
-        initial_steps = [
-            {
-                "id": f"{session_id}_0",
-                "agent": "system",
-                "step": "session_created",
-                "timestamp": timestamp,
-                "content": "Diagnostic session initialized",
-                "status": "completed"
-            }
-        ]
+        # Create session ID FIRST; a duplicate start joins the session of the identical one
+        session_id, leader = diagnostic_api.claim_session(
+            selected_symptoms, patient_info, max_questions, allow_fast_path, owner_id, job=bool(job_mode)
+        )
         
-        # Store initial steps IMMEDIATELY
-        diagnostic_api.update_session_reasoning(session_id, initial_steps)
+        if leader:
+            claim = dict(symptoms=selected_symptoms, patient_info=patient_info, max_questions=max_questions,
+                         allow_fast_path=allow_fast_path, owner_id=owner_id, job=bool(job_mode))
+            # Initialize session in diagnostic API IMMEDIATELY
+            diagnostic_api.initialize_session(session_id)
+            
+            # Add initial reasoning steps BEFORE any processing
+            timestamp = datetime.now().isoformat()
+            initial_steps = [
+                {
+                    "id": f"{session_id}_0",
+                    "agent": "system",
+                    "step": "session_created",
+                    "timestamp": timestamp,
+                    "content": "Diagnostic session initialized",
+                    "status": "completed"
+                }
+            ]
+            
+            # Store initial steps IMMEDIATELY
+            diagnostic_api.update_session_reasoning(session_id, initial_steps)
+        else:
+            print(f"Joining identical diagnostic session {session_id}")
         
         # Get initial prediction from ML model
         print("Getting initial prediction...")
-        initial_result = predict_disease(selected_symptoms)
+        initial_result = await asyncio.to_thread(predict_disease, selected_symptoms)
         print(f"Initial prediction result: {initial_result}")
 
         if 'error' in initial_result:
-            return Response(initial_result, status=status.HTTP_400_BAD_REQUEST)
+            return initial_result, status.HTTP_400_BAD_REQUEST
 
          # Add ML prediction step IMMEDIATELY after prediction
         ml_step = {
@@ -123,20 +291,25 @@ def predict_disease_enhanced_view(request):
         }
         
         current_steps = diagnostic_api.get_session_reasoning(session_id)
-        current_steps.append(ml_step)
-        diagnostic_api.update_session_reasoning(session_id, current_steps)
+        if leader:
+            current_steps.append(ml_step)
+            diagnostic_api.update_session_reasoning(session_id, current_steps)
         
         # If there are no predictions, return early
         if not initial_result or len(initial_result) == 0:
             print("No diseases predicted in initial result")
-            return Response({
+            result = {
                 'initial_predictions': initial_result,
                 'enhanced': False,
                 'message': 'No diseases predicted based on the provided symptoms.',
                 'clarifying_questions': [],
                 'reasoning_steps': current_steps,
                 'session_id': session_id
-            })
+            }
+            if claim:
+                diagnostic_api.settle_session_claim(**claim, result=result)
+                claim = None
+            return result, status.HTTP_200_OK
        
 
         # Add workflow start step BEFORE starting LangGraph
@@ -149,8 +322,9 @@ def predict_disease_enhanced_view(request):
             "status": "completed"
         }
         
-        current_steps.append(workflow_start_step)
-        diagnostic_api.update_session_reasoning(session_id, current_steps)
+        if leader:
+            current_steps.append(workflow_start_step)
+            diagnostic_api.update_session_reasoning(session_id, current_steps)
 
         # Use the LangGraph agent system to enhance the prediction
         try:
@@ -170,86 +344,54 @@ def predict_disease_enhanced_view(request):
                     'source': 'ml_model'
                 }
 
-            # Start the diagnostic session
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-
-            try:
-                enhanced_result = loop.run_until_complete(
-                    diagnostic_api.start_diagnosis(
+            if job_mode:
+                if leader:
+                    # The job settles the claim from here on, also when it is rejected
+                    claim = None
+                    diagnostic_api.submit_diagnosis_job(
                         symptoms=selected_symptoms,
                         patient_info=patient_info,
                         initial_predictions=initial_result,
                         max_questions=max_questions,
-                        session_id=session_id
+                        session_id=session_id,
+                        allow_fast_path=allow_fast_path,
+                        owner_id=owner_id,
+                        on_complete=lambda enhanced_result: _finish_enhanced_job(
+                            user, enhanced_result, initial_result, selected_symptoms
+                        )
                     )
-                )
-            finally:
-                loop.close()
+                job = diagnostic_api.get_job(session_id)
+                return {
+                    'initial_predictions': initial_result,
+                    'enhanced': True,
+                    'status': 'processing',
+                    'job_status': job['status'] if job else 'queued',
+                    'session_id': session_id,
+                    'deduplicated': not leader,
+                    'poll_url': reverse('enhanced_job_status', args=[session_id]),
+                    'stream_url': reverse('reasoning_stream', args=[session_id]),
+                    'clarifying_questions': [],
+                    'reasoning_steps': current_steps
+                }, status.HTTP_202_ACCEPTED
+
+            # Start the diagnostic session; its single-flight run settles the claim
+            claim = None
+            enhanced_result = await diagnostic_api.start_diagnosis(
+                symptoms=selected_symptoms,
+                patient_info=patient_info,
+                initial_predictions=initial_result,
+                max_questions=max_questions,
+                session_id=session_id,
+                allow_fast_path=allow_fast_path,
+                owner_id=owner_id
+            )
 
             print(f"Enhanced result: {enhanced_result}")
 
-            # Format the response based on the result type
-            if enhanced_result.get('type') == 'question':
-                questions = enhanced_result.get('questions', [])
-                print(f"DEBUG: Found {len(questions)} questions in enhanced result")
-
-                # Ensure questions are properly formatted
-                formatted_questions = []
-                for q in questions:
-                    if isinstance(q, dict):
-                        formatted_questions.append(q)
-                    elif isinstance(q, str):
-                        formatted_questions.append({
-                            'id': f'q{len(formatted_questions) + 1}',
-                            'question': q,
-                            'question_text': q,
-                            'type': 'yes_no',
-                            'related_disease': 'General',
-                            'symptom_checking': 'additional symptoms',
-                            'priority': 1,
-                            'required': True
-                        })
-
-                result = {
-                    'initial_predictions': initial_result,
-                    'enhanced': True,
-                    'status': 'waiting_for_input',
-                    'session_id': enhanced_result['session_id'],
-                    'progress': enhanced_result.get('progress', {}),
-                    'clarifying_questions': formatted_questions,
-                    'reasoning_steps': enhanced_result.get('reasoning_steps', []),
-                    'agent_outputs': clean_for_json_serialization(enhanced_result.get('agent_outputs', {})),
-                    'transparency': clean_for_json_serialization(enhanced_result.get('transparency', {}))
-                }
-            elif enhanced_result.get('type') == 'diagnosis':
-                # The system has completed the diagnosis
-                result = {
-                    'initial_predictions': initial_result,
-                    'enhanced': True,
-                    'status': 'completed',
-                    'session_id': enhanced_result['session_id'],
-                    'enhanced_predictions': enhanced_result['predictions'],
-                    'summary': enhanced_result.get('summary', {}),
-                    'symptoms_analyzed': enhanced_result.get('symptoms_analyzed', selected_symptoms),
-                    'questions_asked': enhanced_result.get('questions_asked', 0),
-                    'reasoning_steps': enhanced_result.get('reasoning_steps', []),
-                    'agent_outputs': clean_for_json_serialization(enhanced_result.get('agent_outputs', {})),
-                    'transparency': clean_for_json_serialization(enhanced_result.get('transparency', {})),
-                    'clarifying_questions': []
-                }
-            else:
-                # Fallback for other response types
-                result = {
-                    'initial_predictions': initial_result,
-                    'enhanced': True,
-                    'session_id': enhanced_result.get('session_id'),
-                    'langgraph_result': clean_for_json_serialization(enhanced_result),
-                    'reasoning_steps': enhanced_result.get('reasoning_steps', []),
-                    'agent_outputs': clean_for_json_serialization(enhanced_result.get('agent_outputs', {})),
-                    'clarifying_questions': []
-                }
+            result = _format_enhanced_result(enhanced_result, initial_result, selected_symptoms)
 
+        except AdmissionRejected as e:
+            return _busy_payload(e, session_id), status.HTTP_429_TOO_MANY_REQUESTS
         except Exception as e:
             print(f"Exception during LangGraph enhancement: {str(e)}")
             import traceback
@@ -264,8 +406,9 @@ def predict_disease_enhanced_view(request):
                 "status": "error"
             }
             
-            current_steps.append(error_step)
-            diagnostic_api.update_session_reasoning(session_id, current_steps)
+            if leader:
+                current_steps.append(error_step)
+                diagnostic_api.update_session_reasoning(session_id, current_steps)
             
             result = {
                 'initial_predictions': initial_result,
@@ -278,25 +421,8 @@ def predict_disease_enhanced_view(request):
             }
 
         # Save result if user is authenticated
-        if request.user.is_authenticated:
-            print(f"Saving result for user: {request.user.username}")
-            
-            # Clean the result before saving
-            cleaned_result = clean_for_json_serialization(result)
-            
-            diagnostic_result = DiagnosticResult.objects.create(
-                user=request.user,
-                diagnostic_type='enhanced',
-                result_data=cleaned_result
-            )
-
-            SymptomInput.objects.create(
-                diagnostic_result=diagnostic_result,
-                symptoms=selected_symptoms
-            )
-
-            result['saved'] = True
-            result['result_id'] = diagnostic_result.id
+        if user.is_authenticated:
+            await sync_to_async(_save_enhanced_result)(user, result, selected_symptoms)
             
             print(f"DEBUG: reasoning_steps content: {result.get('reasoning_steps', [])}")
             for i, step in enumerate(result.get('reasoning_steps', [])):
@@ -304,13 +430,37 @@ def predict_disease_enhanced_view(request):
 
         print(f"Returning final result with status: {result.get('status', 'unknown')}")
         print(f"Reasoning steps in result: {len(result.get('reasoning_steps', []))}")
-        return Response(result)
+        return result, status.HTTP_200_OK
 
     except Exception as e:
         print(f"Exception in predict_disease_enhanced_view: {str(e)}")
         import traceback
         traceback.print_exc()
-        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return {'error': str(e)}, status.HTTP_500_INTERNAL_SERVER_ERROR
+    finally:
+        if claim:
+            diagnostic_api.settle_session_claim(
+                **claim, error=RuntimeError("Diagnostic session ended before its workflow started")
+            )
+
+
+@api_view(['POST'])
+@parser_classes([JSONParser])
+def predict_disease_enhanced_view(request):
+    """Enhanced disease prediction using LangGraph multi-agent system"""
+    payload, status_code = async_to_sync(_run_enhanced_prediction)(request.data, request.user)
+    return _with_retry_after(Response(payload, status=status_code), payload)
+
+
+@csrf_exempt
+@require_POST
+async def predict_disease_enhanced_async_view(request):
+    """Async variant of predict_disease_enhanced_view, served when ASYNC_GRAPH_EXECUTION is set"""
+    user, data, error = await _authenticate_async(request)
+    if error is not None:
+        return error
+    payload, status_code = await _run_enhanced_prediction(data, user)
+    return _with_retry_after(_json_response(payload, status_code), payload)
 
 @require_GET
 @csrf_exempt
@@ -352,9 +502,31 @@ def reasoning_stream_view(request, session_id):
             last_check = time.time()
             max_wait_time = 300  # 5 minutes timeout
             start_time = time.time()
+            delta_index = 0
+            job_status_sent = None
             
             while (time.time() - start_time) < max_wait_time:
                 try:
+                    # Stream LLM tokens as they arrive
+                    new_deltas = diagnostic_api.get_new_reasoning_deltas(session_id, delta_index)
+                    for delta in new_deltas:
+                        yield f"data: {json.dumps(delta)}\n\n"
+                    delta_index += len(new_deltas)
+                    
+                    # Deliver the result of a background job (questions or diagnosis) once it is ready
+                    job = diagnostic_api.get_job(session_id)
+                    if job and job['status'] != job_status_sent and job['status'] not in ('queued', 'running'):
+                        job_status_sent = job['status']
+                        job_data = {
+                            'type': 'job',
+                            'session_id': session_id,
+                            'job_status': job['status'],
+                            'result': clean_for_json_serialization(job['response']),
+                            'error': job['error'],
+                            'timestamp': datetime.now().isoformat()
+                        }
+                        yield f"data: {json.dumps(job_data)}\n\n"
+                    
                     # Check for new reasoning steps
                     try:
                         new_steps = diagnostic_api.get_new_reasoning_steps(session_id, last_check)
@@ -384,7 +556,7 @@ def reasoning_stream_view(request, session_id):
                         print(f"Error checking session completion: {e}")
                     
                     last_check = time.time()
-                    time.sleep(1)  # Poll every second
+                    time.sleep(DiagnosticConfig.STREAM_POLL_INTERVAL)
                     
                 except Exception as e:
                     error_data = {
@@ -429,12 +601,58 @@ def reasoning_stream_view(request, session_id):
     
     return response
 
-@api_view(['POST'])
-@parser_classes([JSONParser])
-def answer_clarifying_questions_view(request):
-    """Continue diagnostic session with user answers using LangGraph"""
+def _lookup_result_session(user, result_id):
+    """Session ID stored with a saved result; returns (session_id, error payload, http status)"""
+    try:
+        diagnostic_result = DiagnosticResult.objects.get(id=result_id)
+        if user.is_authenticated and user != diagnostic_result.user:
+            return None, {'error': 'Not authorized'}, status.HTTP_403_FORBIDDEN
+        
+        session_id = diagnostic_result.result_data.get('session_id')
+        if not session_id:
+            return None, {'error': 'Session ID not found in saved result'}, status.HTTP_400_BAD_REQUEST
+        return session_id, None, None
+    except DiagnosticResult.DoesNotExist:
+        return None, {'error': 'Diagnostic result not found'}, status.HTTP_404_NOT_FOUND
+
+
+def _save_completed_result(user, result: dict, result_id) -> None:
+    """Persist a completed diagnosis for the user and mark the result as saved"""
+    print(f"Saving completed result for user: {user.username}")
+    
+    # Get original symptoms from the session or previous result
+    original_symptoms = []
+    if result_id:
+        try:
+            original_diagnostic = DiagnosticResult.objects.get(id=result_id)
+            original_symptom_input = SymptomInput.objects.get(diagnostic_result=original_diagnostic)
+            original_symptoms = original_symptom_input.symptoms
+        except (DiagnosticResult.DoesNotExist, SymptomInput.DoesNotExist):
+            pass
+    
+    # Clean the result before saving to ensure JSON serialization
+    cleaned_result = clean_for_json_serialization(result)
+    
+    new_diagnostic_result = DiagnosticResult.objects.create(
+        user=user,
+        diagnostic_type='completed',
+        result_data=cleaned_result
+    )
+    
+    # Save symptoms (use analyzed symptoms if available, otherwise original)
+    symptoms_to_save = result.get('symptoms_analyzed', original_symptoms)
+    SymptomInput.objects.create(
+        diagnostic_result=new_diagnostic_result,
+        symptoms=symptoms_to_save
+    )
+    
+    result['saved'] = True
+    result['result_id'] = new_diagnostic_result.id
+
+
+async def _run_answer_questions(data, user):
+    """Body of the answer endpoints; returns (payload, http status)"""
     try:
-        data = request.data
         session_id = data.get('session_id')
         answers = data.get('answers', {})
         result_id = data.get('result_id')
@@ -448,41 +666,29 @@ def answer_clarifying_questions_view(request):
             processed_answers[key] = value
         
         if not session_id and not result_id:
-            return Response({'error': 'Session ID or Result ID is required'}, status=status.HTTP_400_BAD_REQUEST)
+            return {'error': 'Session ID or Result ID is required'}, status.HTTP_400_BAD_REQUEST
         
         if not answers:
-            return Response({'error': 'Answers are required'}, status=status.HTTP_400_BAD_REQUEST)
+            return {'error': 'Answers are required'}, status.HTTP_400_BAD_REQUEST
+        
+        # Optional per-request choice of the answer processing pipeline, to compare the two
+        pipeline_mode = data.get('pipeline_mode')
+        if pipeline_mode not in (None, 'standard', 'compact'):
+            return {'error': "pipeline_mode must be 'standard' or 'compact'"}, status.HTTP_400_BAD_REQUEST
         
         print(f"Processed answers: {processed_answers}")
         
         # If we have a result_id but no session_id, try to get session_id from saved result
         if result_id and not session_id:
-            try:
-                diagnostic_result = DiagnosticResult.objects.get(id=result_id)
-                if request.user.is_authenticated and request.user != diagnostic_result.user:
-                    return Response({'error': 'Not authorized'}, status=status.HTTP_403_FORBIDDEN)
-                
-                session_id = diagnostic_result.result_data.get('session_id')
-                if not session_id:
-                    return Response({'error': 'Session ID not found in saved result'},
-                                   status=status.HTTP_400_BAD_REQUEST)
-            except DiagnosticResult.DoesNotExist:
-                return Response({'error': 'Diagnostic result not found'},
-                               status=status.HTTP_404_NOT_FOUND)
+            session_id, error, error_status = await sync_to_async(_lookup_result_session)(user, result_id)
+            if error is not None:
+                return error, error_status
         
         # Continue the diagnostic session with the answer
         try:
             print(f"Continuing session {session_id} with answers: {processed_answers}")
             
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
-            try:
-                continued_result = loop.run_until_complete(
-                    diagnostic_api.answer_question(session_id, processed_answers)
-                )
-            finally:
-                loop.close()
+            continued_result = await diagnostic_api.answer_question(session_id, processed_answers, pipeline_mode)
             
             print(f"Continued result: {continued_result}")
             
@@ -533,6 +739,8 @@ def answer_clarifying_questions_view(request):
                     'reasoning_steps': continued_result.get('reasoning_steps', []),
                     'agent_outputs': clean_for_json_serialization(continued_result.get('agent_outputs', {})),
                     'transparency': clean_for_json_serialization(continued_result.get('transparency', {})),
+                    'degraded_nodes': continued_result.get('degraded_nodes', []),
+                    'pipeline_mode': continued_result.get('pipeline_mode'),
                     'clarifying_questions': []  # Clear questions when completed
                 }
             else:
@@ -544,57 +752,48 @@ def answer_clarifying_questions_view(request):
                     'clarifying_questions': []
                 }
         
+        except AdmissionRejected as e:
+            return _busy_payload(e, session_id), status.HTTP_429_TOO_MANY_REQUESTS
         except Exception as e:
             print(f"Exception during session continuation: {str(e)}")
             import traceback
             traceback.print_exc()
-            return Response({'error': f'Error processing answer: {str(e)}'},
-                           status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            return {'error': f'Error processing answer: {str(e)}'}, status.HTTP_500_INTERNAL_SERVER_ERROR
         
         # Save the updated result if user is authenticated and diagnosis is complete
-        if request.user.is_authenticated and result.get('status') == 'completed':
-            print(f"Saving completed result for user: {request.user.username}")
-            
-            # Get original symptoms from the session or previous result
-            original_symptoms = []
-            if result_id:
-                try:
-                    original_diagnostic = DiagnosticResult.objects.get(id=result_id)
-                    original_symptom_input = SymptomInput.objects.get(diagnostic_result=original_diagnostic)
-                    original_symptoms = original_symptom_input.symptoms
-                except (DiagnosticResult.DoesNotExist, SymptomInput.DoesNotExist):
-                    pass
-            
-            # Clean the result before saving to ensure JSON serialization
-            cleaned_result = clean_for_json_serialization(result)
-            
-            new_diagnostic_result = DiagnosticResult.objects.create(
-                user=request.user,
-                diagnostic_type='completed',
-                result_data=cleaned_result
-            )
-            
-            # Save symptoms (use analyzed symptoms if available, otherwise original)
-            symptoms_to_save = result.get('symptoms_analyzed', original_symptoms)
-            SymptomInput.objects.create(
-                diagnostic_result=new_diagnostic_result,
-                symptoms=symptoms_to_save
-            )
-            
-            result['saved'] = True
-            result['result_id'] = new_diagnostic_result.id
+        if user.is_authenticated and result.get('status') == 'completed':
+            await sync_to_async(_save_completed_result)(user, result, result_id)
             
             print(f"DEBUG: reasoning_steps content: {result.get('reasoning_steps', [])}")
             for i, step in enumerate(result.get('reasoning_steps', [])):
                 print(f"  Step {i}: {type(step)} - {repr(step)}")
         
-        return Response(result)
+        return result, status.HTTP_200_OK
         
     except Exception as e:
         print(f"Exception in answer_clarifying_questions_view: {str(e)}")
         import traceback
         traceback.print_exc()
-        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return {'error': str(e)}, status.HTTP_500_INTERNAL_SERVER_ERROR
+
+
+@api_view(['POST'])
+@parser_classes([JSONParser])
+def answer_clarifying_questions_view(request):
+    """Continue diagnostic session with user answers using LangGraph"""
+    payload, status_code = async_to_sync(_run_answer_questions)(request.data, request.user)
+    return _with_retry_after(Response(payload, status=status_code), payload)
+
+
+@csrf_exempt
+@require_POST
+async def answer_clarifying_questions_async_view(request):
+    """Async variant of answer_clarifying_questions_view, served when ASYNC_GRAPH_EXECUTION is set"""
+    user, data, error = await _authenticate_async(request)
+    if error is not None:
+        return error
+    payload, status_code = await _run_answer_questions(data, user)
+    return _with_retry_after(_json_response(payload, status_code), payload)
 
 
 @api_view(['GET'])
@@ -604,15 +803,7 @@ def get_session_status_view(request, session_id):
         if not session_id:
             return Response({'error': 'Session ID is required'}, status=status.HTTP_400_BAD_REQUEST)
         
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        try:
-            session_status = loop.run_until_complete(
-                diagnostic_api.get_session_status(session_id)
-            )
-        finally:
-            loop.close()
+        session_status = async_to_sync(diagnostic_api.get_session_status)(session_id)
         
         # Clean the session status for JSON serialization
         cleaned_status = clean_for_json_serialization(session_status)
@@ -624,19 +815,45 @@ def get_session_status_view(request, session_id):
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['GET'])
+def get_enhanced_job_view(request, session_id):
+    """Poll a job-mode enhanced prediction: 202 while the agents run, then the usual result"""
+    try:
+        job = diagnostic_api.get_job(session_id)
+        if job is None or (job['owner_id'] is not None and job['owner_id'] != request.user.pk):
+            return Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+        
+        if job['status'] in ('queued', 'running'):
+            return Response({
+                'session_id': session_id,
+                'status': 'processing',
+                'job_status': job['status']
+            }, status=status.HTTP_202_ACCEPTED)
+        
+        if job['status'] == 'error':
+            # Same shape as a synchronous run whose enhancement failed
+            return Response({
+                'enhanced': False,
+                'enhancement_error': job['error'],
+                'status': 'error',
+                'job_status': 'error',
+                'session_id': session_id,
+                'clarifying_questions': [],
+                'reasoning_steps': diagnostic_api.get_session_reasoning(session_id)
+            })
+        
+        return Response({**job['response'], 'job_status': job['status']})
+        
+    except Exception as e:
+        print(f"Exception in get_enhanced_job_view: {str(e)}")
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 @api_view(['GET'])
 def get_active_sessions_view(request):
     """Get list of active diagnostic sessions"""
     try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        try:
-            active_sessions = loop.run_until_complete(
-                diagnostic_api.get_active_sessions()
-            )
-        finally:
-            loop.close()
+        active_sessions = async_to_sync(diagnostic_api.get_active_sessions)()
         
         # Clean the active sessions for JSON serialization
         cleaned_sessions = clean_for_json_serialization(active_sessions)
@@ -645,4 +862,74 @@ def get_active_sessions_view(request):
         
     except Exception as e:
         print(f"Exception in get_active_sessions_view: {str(e)}")
-        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+def get_llm_cache_stats_view(request):
+    """Get hit-rate metrics of the LLM response cache"""
+    try:
+        return Response(diagnostic_api.get_llm_cache_stats())
+        
+    except Exception as e:
+        print(f"Exception in get_llm_cache_stats_view: {str(e)}")
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+def get_llm_limiter_stats_view(request):
+    """Get concurrency and rate-limit metrics of the shared LLM throttle"""
+    try:
+        return Response(diagnostic_api.get_llm_limiter_stats())
+        
+    except Exception as e:
+        print(f"Exception in get_llm_limiter_stats_view: {str(e)}")
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+def get_llm_circuit_stats_view(request):
+    """Get the state of the LLM circuit breaker"""
+    try:
+        return Response(diagnostic_api.get_llm_circuit_stats())
+        
+    except Exception as e:
+        print(f"Exception in get_llm_circuit_stats_view: {str(e)}")
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+def get_token_usage_stats_view(request):
+    """Get LLM token usage per node; pass ?session_id= for a single session"""
+    try:
+        return Response(diagnostic_api.get_token_usage_stats(request.query_params.get('session_id')))
+        
+    except Exception as e:
+        print(f"Exception in get_token_usage_stats_view: {str(e)}")
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+def get_structured_output_stats_view(request):
+    """Get JSON parse outcomes (clean, repaired, re-asked, failed) per node"""
+    try:
+        return Response(diagnostic_api.get_structured_output_stats())
+        
+    except Exception as e:
+        print(f"Exception in get_structured_output_stats_view: {str(e)}")
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+def get_session_store_stats_view(request):
+    """Get sessions held in memory, items per namespace, TTL/LRU evictions and process RSS"""
+    try:
+        return Response(diagnostic_api.get_session_store_stats())
+        
+    except Exception as e:
+        print(f"Exception in get_session_store_stats_view: {str(e)}")
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+def get_admission_stats_view(request):
+    """Get worker, queue-depth and queue-wait metrics of the diagnostic admission controller"""
+    try:
+        return Response(diagnostic_api.get_admission_stats())
+        
+    except Exception as e:
+        print(f"Exception in get_admission_stats_view: {str(e)}")
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
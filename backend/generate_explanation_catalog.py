@@ -0,0 +1,46 @@
+import os
+import json
+import argparse
+import django
+
+# Set up Django environment
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'medical_system.settings')
+django.setup()
+
+from django.conf import settings
+from langchain_google_genai import ChatGoogleGenerativeAI
+from diagnostics.langgraph_agents.config import DiagnosticConfig
+from diagnostics.langgraph_agents.explanation_catalog import build_catalog, write_catalog
+
+def generate_catalog():
+    """Regenerate the per-disease explanation catalog used by explanation_node"""
+    parser = argparse.ArgumentParser(description="Generate the patient-education explanation catalog")
+    parser.add_argument("--output", default=DiagnosticConfig.EXPLANATION_CATALOG_PATH)
+    parser.add_argument("--no-llm", action="store_true", help="Build entries from the CSV data only")
+    args = parser.parse_args()
+
+    symptoms_dir = os.path.join(settings.DATA_DIR, 'symptoms')
+
+    previous = None
+    if os.path.exists(args.output):
+        with open(args.output, encoding="utf-8") as f:
+            previous = json.load(f)
+
+    llm = None
+    if not args.no_llm:
+        if not DiagnosticConfig.GEMINI_API_KEY:
+            parser.error("GEMINI_API_KEY is not set; pass --no-llm to build from the CSV data only")
+        # Low temperature: these texts are reviewed once and served to every patient
+        llm = ChatGoogleGenerativeAI(
+            model=DiagnosticConfig.GEMINI_MODEL,
+            temperature=0.2,
+            google_api_key=DiagnosticConfig.GEMINI_API_KEY
+        )
+
+    catalog = build_catalog(symptoms_dir, llm, previous, DiagnosticConfig.GEMINI_MODEL)
+    write_catalog(catalog, args.output)
+    print(f"Wrote explanation catalog v{catalog['catalog_version']} "
+          f"({len(catalog['entries'])} diseases) to {args.output}")
+
+if __name__ == "__main__":
+    generate_catalog()
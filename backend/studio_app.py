@@ -41,6 +41,14 @@ class MockVectorDB:
             })
         return results
     
+    def search_many(self, queries: List[str], k: int = 5) -> List[List[Dict]]:
+        """Mock batched search"""
+        return [self.search(query, top_k=k) for query in queries]
+    
+    def search_disease_many(self, lookups: List[tuple], k: int = 2) -> List[List[Dict]]:
+        """Mock batched (disease, source) lookup"""
+        return [self.search(f"{disease} {source}", top_k=k) for disease, source in lookups]
+    
     def get_similar_symptoms(self, symptoms: List[str]) -> List[Dict]:
         """Mock similar symptoms method"""
         similar = []
@@ -142,6 +142,18 @@ const RealtimeReasoning = ({
     } else {
       setCurrentStep(null);
     }
+  } else if (data.type === 'delta') {
+    // Streamed LLM tokens: grow the in-progress step until the node completes
+    setCurrentStep(prev => (prev && prev.id === data.step_id)
+      ? { ...prev, content: prev.content + data.content }
+      : {
+          id: data.step_id,
+          agent: data.node,
+          step: `${data.node}_generating`,
+          timestamp: data.timestamp,
+          content: data.content,
+          status: 'in_progress'
+        });
   } else if (data.type === 'current_step') {
     setCurrentStep(data.step);
   } else if (data.type === 'complete') {